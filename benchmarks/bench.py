@@ -0,0 +1,246 @@
+#coding: utf-8
+"""Benchmarks of the stages of converttool
+
+Generates synthetic csv files shaped like our feeds, with unicode names
+and quoted multi-line addresses, and times every stage separately:
+parsing, validation and each formatter. Every stage runs in its own
+process so its peak memory is measured on its own, and streams the rows
+parsed from the generated file, so large files are benchmarked in
+constant memory. The time spent parsing is left out of the stages
+reading the rows.
+
+    python benchmarks/bench.py --rows 1000 --rows 100000 --output bench.json
+    python benchmarks/bench.py --compare bench.json --threshold 10
+
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import resource
+import tempfile
+import multiprocessing
+from itertools import islice
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converttool.converter import Converter
+from converttool.validate import Validate
+from converttool.formats import FormatJSON, FormatXML
+
+try:
+    import tracemalloc
+except ImportError:
+    # Allocations are only traced where tracemalloc is available, the
+    # growth of the peak resident memory stands for them otherwise
+    tracemalloc = None
+
+FIELDNAMES = ['name', 'address', 'stars', 'contact', 'phone', 'uri']
+
+SCHEMA = {
+    'name': {'type': 'string', 'required': True, 'empty': False},
+    'address': {'type': 'string'},
+    'stars': {'type': 'integer', 'min': 0, 'max': 5},
+    'contact': {'type': 'string'},
+    'phone': {'type': 'string', 'maxlength': 30},
+    'uri': {'type': 'string', 'regex': 'https?://.*'},
+}
+
+SYLLABLES = [u'jür', u'gen', u'ma', u'xi', u'ne', u'ló', u'we', u'sin', u'da', u'øst', u'çe', u'ña']
+STREETS = [u'Lowe Knoll', u'Paucek Way', u'Mühlenweg', u'Rue de l\'Église', u'O\'Connell St']
+CITIES = [u'East Maxine, WA 97030', u'Zürich', u'São Paulo', u'Kraków', u'Reykjavík']
+
+def _name(r):
+    return u'-'.join(u''.join(r.choice(SYLLABLES) for _ in range(r.randint(2, 3))).capitalize() for _ in range(2))
+
+def generate_csv(file_name, rows, seed=1):
+    """Write a csv of rows in the shape of our feeds
+
+    :param str file_name: Name of the csv file
+    :param int rows: Number of rows
+    :param int seed: Seed of the random generator
+
+    """
+    r = random.Random(seed)
+    with open(file_name, 'wb') as f:
+        f.write(','.join(FIELDNAMES) + '\n')
+        for i in xrange(rows):
+            address = u'{} {}'.format(r.randint(1, 99999), r.choice(STREETS))
+            if r.random() < 0.5:
+                address += u'\n' + r.choice(CITIES)
+            if u'\n' in address or u',' in address or r.random() < 0.5:
+                address = u'"{}"'.format(address.replace(u'"', u'""'))
+            values = [
+                _name(r),
+                address,
+                unicode(r.randint(0, 5)),
+                u'"Dr. {}"'.format(_name(r)),
+                u'1-{}-{}-{}x{}'.format(r.randint(200, 999), r.randint(100, 999), r.randint(1000, 9999), r.randint(1, 9999)),
+                u'http://www.{}.com/{}.htm'.format(_name(r).lower(), i),
+            ]
+            f.write(u','.join(values).encode('utf-8') + '\n')
+
+def iter_parsed(csv_file, parsing, batch_size=512):
+    """Generator to parse the rows of the csv as they are read
+
+    The rows are parsed a batch at a time, and the time spent parsing
+    them is added up, without timing every row.
+
+    :param str csv_file: Name of the csv file
+    :param dict parsing: `rows`, `wall` and `cpu` time of the parsing
+    :param int batch_size: Number of rows parsed at once
+    :rtype: iterator of dictionaries, one for every row
+
+    """
+    rows = Converter(csv_file, ('json',), stream=True).iter_csv()
+    while True:
+        wall, cpu = time.time(), time.clock()
+        batch = list(islice(rows, batch_size))
+        parsing['wall'] += time.time() - wall
+        parsing['cpu'] += time.clock() - cpu
+        if not batch:
+            return
+        parsing['rows'] += len(batch)
+        for row in batch:
+            yield row
+
+def _parse(csv_file, rows, output):
+    for row in rows:
+        pass
+    return os.path.getsize(csv_file)
+
+def _validate(csv_file, rows, output):
+    Validate(rows, SCHEMA).validate()
+    return 0
+
+def _json(csv_file, rows, output):
+    FormatJSON.convert_data(output, rows, False)
+    return os.path.getsize(output)
+
+def _xml(csv_file, rows, output):
+    FormatXML.convert_data(output, rows, False)
+    return os.path.getsize(output)
+
+STAGES = [
+    ('parse_csv', _parse),
+    ('validate', _validate),
+    ('json', _json),
+    ('xml', _xml),
+]
+
+def _measure(name, stage, csv_file, results):
+    """Run a stage in a child process and report its measures
+
+    The rows are parsed from the csv as the stage reads them, and the
+    time spent parsing them is subtracted from the other stages.
+
+    """
+    output = tempfile.mktemp()
+    try:
+        parsing = {'rows': 0, 'wall': 0.0, 'cpu': 0.0}
+        rows = iter_parsed(csv_file, parsing)
+        gc.collect()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        objects = len(gc.get_objects())
+        if tracemalloc is not None:
+            tracemalloc.start()
+        wall, cpu = time.time(), time.clock()
+        size = stage(csv_file, rows, output)
+        wall, cpu = time.time() - wall, time.clock() - cpu
+        if name != 'parse_csv':
+            wall, cpu = wall - parsing['wall'], cpu - parsing['cpu']
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        if tracemalloc is not None:
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            allocated = peak_rss * 1024
+        results.put({
+            'rows': parsing['rows'],
+            'wall': wall,
+            'cpu': cpu,
+            'rows_per_sec': parsing['rows'] / wall if wall else None,
+            'mb_per_sec': size / wall / 1024 / 1024 if wall and size else None,
+            'peak_rss_kb': peak_rss,
+            'peak_allocated': allocated,
+            'allocated_from': 'tracemalloc' if tracemalloc is not None else 'rss',
+            'live_objects': len(gc.get_objects()) - objects,
+        })
+    finally:
+        if os.path.exists(output):
+            os.remove(output)
+
+def run(sizes, stages, tmpdir, repeat=3):
+    """Run the benchmarks for every size, keeping the fastest of repeated runs
+
+    :rtype: dict of the measures of every stage, by size
+
+    """
+    results = {}
+    for size in sizes:
+        csv_file = os.path.join(tmpdir, 'bench-{}.csv'.format(size))
+        if not os.path.exists(csv_file):
+            click.echo("Generating {} rows".format(size), err=True)
+            generate_csv(csv_file, size)
+        for name, stage in STAGES:
+            if stages and name not in stages:
+                continue
+            measures = []
+            for _ in range(repeat):
+                queue = multiprocessing.Queue()
+                process = multiprocessing.Process(target=_measure, args=(name, stage, csv_file, queue))
+                process.start()
+                measures.append(queue.get())
+                process.join()
+            # The fastest run is the least disturbed by the rest of the machine
+            measure = min(measures, key=lambda measure: measure['wall'])
+            results['{}:{}'.format(name, size)] = measure
+            click.echo("{:<10} {:>9} rows {:>12.0f} rows/s {:>9.2f} MB/s {:>9} KB peak RSS {:>9.0f} KB allocated ({})".format(
+                name, size, measure['rows_per_sec'] or 0, measure['mb_per_sec'] or 0, measure['peak_rss_kb'],
+                measure['peak_allocated'] / 1024.0, measure['allocated_from']))
+    return results
+
+def compare(results, baseline, threshold):
+    """Compare the throughput with a previous run
+
+    :rtype: list of the benchmarks slower than the threshold, in percent
+
+    """
+    regressions = []
+    for key, measure in sorted(results.items()):
+        previous = baseline.get(key)
+        if not previous or not previous.get('rows_per_sec') or not measure['rows_per_sec']:
+            continue
+        change = (measure['rows_per_sec'] - previous['rows_per_sec']) * 100.0 / previous['rows_per_sec']
+        flag = ''
+        if change < -threshold:
+            flag = 'REGRESSION'
+            regressions.append(key)
+        click.echo("{:<20} {:>+8.1f}% {}".format(key, change, flag))
+    return regressions
+
+@click.command()
+@click.option('--rows', multiple=True, type=int, help='Number of rows of a benchmark, can be repeated. 1000, 10000 and 100000 by default')
+@click.option('--stage', multiple=True, type=click.Choice([name for name, stage in STAGES]), help='Stage to benchmark, can be repeated. All of them by default')
+@click.option('--output', default=None, help='Save the results as json in this file')
+@click.option('--compare', 'baseline', default=None, help='Compare with the results saved by a previous run')
+@click.option('--threshold', default=10.0, help='Slowdown in percent flagged as a regression. 10 by default')
+@click.option('--repeat', default=3, help='Number of runs of every benchmark, the fastest is kept. 3 by default')
+@click.option('--tmpdir', default=tempfile.gettempdir(), help='Directory of the generated csv files')
+def main(rows, stage, output, baseline, threshold, repeat, tmpdir):
+    """Benchmark parsing, validation and formatters of converttool"""
+    results = run(rows or (1000, 10000, 100000), stage, tmpdir, repeat)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), threshold)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
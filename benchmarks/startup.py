@@ -0,0 +1,114 @@
+"""Benchmark of the startup time of the converttool command line
+
+Times `converttool --help`, and other command lines, in fresh python
+processes, and reports the imports taking the most time in the format of
+`python -X importtime`, that python 2 does not have.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --imports 30 --target 100 -- json input.csv
+
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the measured process, times every import like -X importtime:
+# self time, without the imports it triggers, and cumulative time
+IMPORT_HOOK = r'''
+import sys, time, __builtin__
+_import = __builtin__.__import__
+_stack = [0.0]
+_times = []
+def _timed_import(name, globals=None, locals=None, fromlist=None, level=-1):
+    known = set(sys.modules)
+    _stack.append(0.0)
+    start = time.time()
+    try:
+        return _import(name, globals, locals, fromlist, level)
+    finally:
+        cumulative = time.time() - start
+        nested = _stack.pop()
+        _stack[-1] += cumulative
+        loaded = [module for module in set(sys.modules) - known if sys.modules[module] is not None]
+        if loaded:
+            # Implicit relative imports load the module under its full name
+            named = [module for module in loaded if module == name or module.endswith('.' + name)]
+            _times.append((cumulative - nested, cumulative, len(_stack) - 1, min(named, key=len) if named else name))
+__builtin__.__import__ = _timed_import
+import atexit
+def _report():
+    for self_time, cumulative, depth, name in _times:
+        sys.stderr.write('import time: {:>9} | {:>10} | {}{}\n'.format(
+            int(self_time * 1e6), int(cumulative * 1e6), '  ' * depth, name))
+atexit.register(_report)
+sys.argv = ['converttool'] + sys.argv[1:]
+import runpy
+runpy.run_module('converttool', run_name='__main__', alter_sys=True)
+'''
+
+def time_command(args, repeat):
+    """Return the wall times of a command line run in fresh processes
+
+    :param list args: Arguments of converttool
+    :param int repeat: Number of runs
+    :rtype: list of the times in milliseconds
+
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.call([sys.executable, '-m', 'converttool'] + list(args), stdout=devnull, stderr=devnull, env=env)
+            times.append((time.time() - start) * 1000)
+    return times
+
+def profile_imports(args):
+    """Return the import times of a command line, as -X importtime would
+
+    :param list args: Arguments of converttool
+    :rtype: list of tuples of the self and cumulative times in
+    microseconds, the nesting and the name of every import
+
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    process = subprocess.Popen([sys.executable, '-c', IMPORT_HOOK] + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    stdout, stderr = process.communicate()
+    imports = []
+    for line in stderr.splitlines():
+        if line.startswith('import time:'):
+            self_time, cumulative, name = line[len('import time:'):].split('|')
+            imports.append((int(self_time), int(cumulative), (len(name) - len(name.lstrip())) // 2, name.strip()))
+    return imports
+
+@click.command()
+@click.option('--repeat', default=10, help='Number of runs of the command line, the median is kept. 10 by default')
+@click.option('--imports', default=20, help='Number of the slowest imports reported. 20 by default')
+@click.option('--target', default=100.0, help='Startup time in milliseconds not to exceed. 100 by default')
+@click.option('--output', default=None, help='Save the results as json in this file')
+@click.argument('args', nargs=-1)
+def main(repeat, imports, target, output, args):
+    """Benchmark the startup time of converttool, `--help` by default"""
+    args = args or ('--help',)
+    times = sorted(time_command(args, repeat))
+    median = times[len(times) // 2]
+    click.echo("converttool {}: median {:.1f}ms, fastest {:.1f}ms over {} runs".format(' '.join(args), median, times[0], repeat))
+    profile = profile_imports(args)
+    top = sorted(profile, key=lambda entry: -entry[1])[:imports]
+    click.echo("import time: self [us] | cumulative | imported package")
+    for self_time, cumulative, depth, name in top:
+        click.echo("import time: {:>9} | {:>10} | {}{}".format(self_time, cumulative, '  ' * depth, name))
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'args': args, 'times': times, 'median': median, 'imports': profile}, f, indent=4)
+    if median > target:
+        click.echo("Startup is slower than {:.0f}ms".format(target))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,3 @@
-from converttool.app import main
+from converttool.app import run
 
-main()
+run()
@@ -1,24 +1,72 @@
 import click
 from converttool import *
 from converttool.exceptions import *
-from converttool.converter import Converter
+# Only the choices and defaults of the options are imported for --help
+from converttool.constants import EXECUTORS, READERS, COMPRESSIONS, PROFILES, PROFILE_TOP, INFER_SAMPLE, SORT_MEMORY, CACHE_SIZE, BUFFER_SIZE
 import logging
+import json
+import sys
 
 
 @click.command()
+@click.option('--batch', default=None, help='Glob or directory of csv files to convert, the last argument being a format. Outputs are written next to every csv, named after it')
 @click.option('--output-name', default='output', help='Name of the output file without extension. `output` by default')
 @click.option('--pretty', default=False, is_flag=True, help='Pretty print the output. Disabled by default')
 @click.option('--strict', default=False, is_flag=True, help='Set strict validation, tool will stop if data is valid. False by default')
+@click.option('--stream', default=False, is_flag=True, help='Stream the csv to the formatters instead of loading it in memory, in a single pass for all the formats. Disabled by default')
+@click.option('--append', default=False, is_flag=True, help='Append to existing output files, only for appendable formats like jsonl. Disabled by default')
+@click.option('--incremental', default=False, is_flag=True, help='Only convert the rows added to the csv since the last conversion, and add them to the outputs. Disabled by default')
+@click.option('--reader', default='csv', type=click.Choice(READERS), help='Read the csv line by line, or from a memory map in blocks of records, faster on large local files. `csv` by default')
+@click.option('--columns', default=None, help='Comma separated names of the columns to convert, the other columns are never decoded. All of them by default')
+@click.option('--infer-types', default=False, is_flag=True, help='Infer the types of the columns from their first rows, and write integers and floats as numbers. Disabled by default')
+@click.option('--infer-sample', default=INFER_SAMPLE, type=int, help='Number of rows the types of the columns are inferred from. 1000 by default')
+@click.option('--compress', default=None, type=click.Choice(COMPRESSIONS), help='Compress the outputs as they are written, gzip in parallel threads. Compressed csv files are detected and decompressed as they are read. Disabled by default')
+@click.option('--buffer-size', default=BUFFER_SIZE // 1024, type=int, help='Size in KB of the output buffered by the formats before it is written at once. {} by default'.format(BUFFER_SIZE // 1024))
+@click.option('--executor', default='serial', help='Convert the formats one after the other, or all at once in threads or processes. `serial` by default', type=click.Choice(EXECUTORS))
+@click.option('--workers', default=None, type=int, help='Maximum number of formats converted at the same time. All of them by default')
+@click.option('--jobs', default=None, type=int, help='Number of processes converting chunks of the csv in parallel, or files with --batch. 1 by default, the number of cpus with --batch')
+@click.option('--sort-key', default=None, help='Name of the column to sort the data on, numbers are sorted numerically')
+@click.option('--sort-memory', default=SORT_MEMORY, type=int, help='Memory budget of the sort in MB, larger data is sorted in temporary files. {} by default'.format(SORT_MEMORY))
+@click.option('--stats', default=False, is_flag=True, help='Print the time, rows, bytes and peak memory of every stage. Disabled by default')
+@click.option('--stats-json', default=None, help='Write the measures of every stage as json in this file')
+@click.option('--profile', default=None, type=click.Choice(PROFILES), help='Profile the parsing and every format on its own, for cpu time or memory. Disabled by default')
+@click.option('--profile-top', default=PROFILE_TOP, type=int, help='Number of functions or allocation sites reported for every stage. 20 by default')
+@click.option('--no-cache', default=False, is_flag=True, help='Convert the csv even if the outputs are in the cache, and do not cache them')
+@click.option('--cache-size', default=CACHE_SIZE, type=int, help='Size of the cache in MB, the least recently used outputs are evicted beyond it. {} by default'.format(CACHE_SIZE))
 @click.option('--log', default="notset", help='Enable logging for converttool', type=click.Choice(['info', 'debug', 'notset']))
-@click.argument('output_format', nargs=-1, required=True)
+@click.argument('output_format', nargs=-1)
 @click.argument('csv', nargs=1)
-def main(output_name, pretty, strict, log, output_format, csv):
+def main(batch, output_name, pretty, strict, stream, append, incremental, reader, columns, infer_types, infer_sample, compress, buffer_size, executor, workers, jobs, sort_key, sort_memory, stats, stats_json, profile, profile_top, no_cache, cache_size, log, output_format, csv):
     """A simple command line tool to convert CSV to other formats"""
 
+    if batch:
+        # Outputs are named after every csv, and files are converted in
+        # worker processes without stats or profiles
+        for option, value in (('--output-name', output_name != 'output'), ('--stats', stats), ('--stats-json', stats_json), ('--profile', profile)):
+            if value:
+                raise click.UsageError('{} can not be used with --batch.'.format(option))
+        # There is no csv argument, it is the last format
+        output_format = output_format + (csv,)
+    elif not output_format:
+        raise click.UsageError('Missing argument "output_format".')
+    options = dict(pretty=pretty, loglevel=log, strict=strict, stream=stream, append=append, incremental=incremental, reader=reader, columns=columns.split(',') if columns else None, infer_types=infer_types, infer_sample=infer_sample, compress=compress, buffer_size=buffer_size * 1024, executor=executor, workers=workers, sort_key=sort_key, sort_memory=sort_memory, cache=not no_cache, cache_size=cache_size)
+    # The conversion code is only imported to convert, not for --help
+    from converttool.converter import Converter
     try:
-        c = Converter(csv_file=csv, output_format=output_format, output_name=output_name, pretty=pretty, loglevel=log, strict=strict)
+        if batch:
+            return run_batch(batch, output_format, jobs, options)
+        c = Converter(csv_file=csv, output_format=output_format, output_name=output_name, jobs=jobs or 1, stats=stats or bool(stats_json), profile=profile, profile_top=profile_top, **options)
         c.convert()
         click.echo("Total Data Parsed: {}".format(c.get_total_data()))
+        if c.get_total_rejected():
+            click.echo("Invalid Data Rejected: {} (see {})".format(c.get_total_rejected(), c.get_rejects_name()))
+        if stats:
+            click.echo(c.metrics.format_table())
+        if stats_json:
+            with open(stats_json, 'w') as f:
+                json.dump(c.metrics.as_dict(), f, indent=4)
+        if profile:
+            click.echo(c.profiler.format_reports())
     except CSVNotFound:
         click.echo("{} Not Found. Are you in the right directory?".format(csv))
     except FormatterNotFound:
@@ -27,7 +75,42 @@ def main(output_name, pretty, strict, log, output_format, csv):
         click.echo("There was a problem in converting and writing to the output file.")
         click.echo("This is not good")
         click.echo("I suggest you enable debugging and send the logs to author")
+    except (ColumnNotFound, CompressionNotSupported) as e:
+        click.echo(e)
+    except SortKeyNotFound:
+        click.echo("{} is not a column of {}".format(sort_key, csv))
     except ValidationError:
         click.echo("Validation Failed! You might not want to use the --strict flag")
     except Exception as e:
         print e
+
+def run_batch(pattern, output_format, jobs, options):
+    """Convert the csv files matching a glob, and print the result of every file
+
+    The command exits with status 1 when a file failed, or when the
+    batch is refused.
+
+    """
+    from converttool.batch import Batch, find_inputs
+    try:
+        files = find_inputs(pattern)
+    except OutputNameConflict as e:
+        click.echo(e)
+        sys.exit(1)
+    if not files:
+        click.echo("No csv file matches {}".format(pattern))
+        return
+    b = Batch(files, output_format, jobs, **options)
+    b.run()
+    click.echo(b.format_summary())
+    if b.get_failed():
+        # main only catches the errors of the conversion, not SystemExit
+        sys.exit(1)
+
+def run():
+    """Entry point of converttool, `converttool serve` starts the conversion service"""
+    if sys.argv[1:2] == ['serve']:
+        from converttool.service import serve
+        serve(args=sys.argv[2:], prog_name='converttool serve')
+    else:
+        main()
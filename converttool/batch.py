@@ -0,0 +1,151 @@
+from converttool import *
+from converttool.exceptions import *
+from converttool.converter import Converter
+from converttool.compression import EXTENSIONS, strip_extension
+from click import progressbar
+import multiprocessing
+import signal
+import glob
+import time
+import sys
+
+log = logging.getLogger('converttool.Batch')
+
+def find_inputs(pattern):
+    """Return the csv files matching a glob, largest first
+
+    Large files are converted first, so that a large file converted last
+    does not keep a single process busy while the others are idle.
+
+    :param str pattern: Glob of the csv files, or a directory whose csv
+    files are converted, compressed or not
+    :rtype: list of the names of the files
+    :raises: OutputNameConflict if files would be converted to the same
+    outputs, like a.csv and a.csv.gz
+
+    """
+    if os.path.isdir(pattern):
+        patterns = [os.path.join(pattern, '*.csv' + extension) for extension in [''] + sorted(EXTENSIONS.values())]
+    else:
+        patterns = [pattern]
+    files = [name for pattern in patterns for name in glob.glob(pattern) if os.path.isfile(name)]
+    # Files converted at the same time to the same outputs would
+    # overwrite each other
+    outputs = {}
+    for name in sorted(files):
+        output_name = get_output_name(name)
+        if output_name in outputs:
+            raise OutputNameConflict("{} and {} would both be converted to {}".format(outputs[output_name], name, output_name))
+        outputs[output_name] = name
+    return sorted(files, key=lambda name: (-os.path.getsize(name), name))
+
+def get_output_name(csv_file):
+    """Return the output name of a csv of the batch, next to it and named after it"""
+    return os.path.splitext(strip_extension(os.path.abspath(csv_file)))[0]
+
+def convert_file(task):
+    """Convert a csv of the batch in a worker process
+
+    :param tuple task: Name of the csv, formats and keyword arguments of
+    `Converter`
+    :rtype: dict of the `csv`, the `rows` parsed and `rejected`, the
+    `seconds` spent and the `error` if the conversion failed
+
+    """
+    csv_file, output_format, options = task
+    result = {'csv': csv_file, 'rows': 0, 'rejected': 0, 'seconds': 0.0, 'error': None}
+    start = time.time()
+    try:
+        c = Converter(csv_file, output_format, get_output_name(csv_file), **options)
+        c.convert()
+        result['rows'] = c.get_total_data()
+        result['rejected'] = c.get_total_rejected()
+    except Error as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    except Exception as e:
+        log.debug("Conversion of {} failed".format(csv_file), exc_info=True)
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    result['seconds'] = time.time() - start
+    return result
+
+def _init_worker():
+    """Silence the progress bars of the conversions of a worker process"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sys.stdout = open(os.devnull, 'w')
+
+class Batch:
+    """Class to convert many csv files with a shared pool of processes
+
+    Every file is converted on its own by a process of the pool, the
+    largest files first. A file that fails does not stop the others,
+    its error is reported in the summary.
+
+    """
+
+    def __init__(self, files, output_format, jobs=None, **options):
+        """Method to initialize `Batch`
+
+        :param list files: Names of the csv files, in the order they are
+        converted
+        :param tuple output_format: Formats of the outputs
+        :param int jobs: Number of processes, the number of cpus by default
+        :param options: Keyword arguments of `Converter`. The files are
+        converted in a single process each, so the `process` executor
+        runs formats in threads instead
+
+        """
+        self.files = files
+        self.output_format = output_format
+        self.jobs = jobs or multiprocessing.cpu_count()
+        if options.get('executor') == 'process':
+            options['executor'] = 'thread'
+        options['jobs'] = 1
+        self.options = options
+        self.results = []
+        self.seconds = 0.0
+
+    def run(self):
+        """Method to convert every file, and collect their results
+
+        :rtype: list of the results of `convert_file`, in the order of
+        the files
+
+        """
+        tasks = [(csv_file, self.output_format, self.options) for csv_file in self.files]
+        results = {}
+        start = time.time()
+        pool = multiprocessing.Pool(min(self.jobs, len(tasks)) or 1, _init_worker)
+        try:
+            with progressbar(length=len(tasks), label="Converting {} files".format(len(tasks))) as bar:
+                # One file at a time, so the largest files are taken first
+                for result in pool.imap_unordered(convert_file, tasks, chunksize=1):
+                    results[result['csv']] = result
+                    bar.update(1)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        self.seconds = time.time() - start
+        self.results = [results[csv_file] for csv_file in self.files]
+        return self.results
+
+    def get_failed(self):
+        """Method to return the results of the files that failed"""
+        return [result for result in self.results if result['error'] is not None]
+
+    def format_summary(self):
+        """Method to format the result of every file and the total throughput"""
+        lines = []
+        for result in self.results:
+            if result['error'] is not None:
+                lines.append('FAILED {}: {}'.format(result['csv'], result['error']))
+            else:
+                rejected = ', {} rejected'.format(result['rejected']) if result['rejected'] else ''
+                lines.append('OK     {}: {} rows{} in {:.2f}s'.format(result['csv'], result['rows'], rejected, result['seconds']))
+        rows = sum(result['rows'] for result in self.results)
+        lines.append('Converted {} of {} files, {} rows in {:.2f}s, {:.0f} rows/s'.format(
+            len(self.results) - len(self.get_failed()), len(self.results), rows, self.seconds,
+            rows / self.seconds if self.seconds else 0))
+        return '\n'.join(lines)
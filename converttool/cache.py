@@ -0,0 +1,198 @@
+from converttool import *
+from converttool.constants import CACHE_DIR, CACHE_SIZE
+import hashlib
+import shutil
+import tempfile
+import simplejson as json
+
+log = logging.getLogger('converttool.Cache')
+
+# Bump whenever the output of a format changes, so outputs cached by an
+# older converttool are not used. Outputs of version 1 were hard links
+# to the cache, that could be written in place
+CACHE_VERSION = 2
+# Number of bytes hashed at once
+HASH_BLOCK = 1 << 20
+# ioctl sharing the blocks of a file with another on Linux, `cp --reflink`
+FICLONE = 0x40049409
+
+def clone(source, destination):
+    """Copy a file, sharing its blocks when the file system can
+
+    On btrfs or xfs the copy is a reflink, written blocks are copied
+    then, so neither file changes when the other is written. Other file
+    systems get a plain copy.
+
+    :param str source: Name of the file to copy
+    :param str destination: Name of the copy
+
+    """
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        try:
+            import fcntl
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except (ImportError, IOError):
+            shutil.copyfileobj(src, dst, HASH_BLOCK)
+
+class Cache:
+    """Class to keep the outputs of conversions on disk, by content
+
+    An output is stored under a key made of the hash of the csv and of
+    everything that changes the output: the format, pretty printing,
+    the sort key, the validation schema, the columns read and their
+    types. The hash of a csv is kept with its size and modification
+    time, and only computed again when they change. Outputs are copied,
+    or reflinked, from and to the cache, so writing an output never
+    changes the cache. The size of an output is kept with it, and an
+    output whose size changed is not used.
+
+    """
+
+    def __init__(self, directory=CACHE_DIR, size=CACHE_SIZE):
+        """Method to initialize `Cache`
+
+        :param str directory: Directory of the cache
+        :param int size: Size of the cache in megabytes
+
+        """
+        self.directory = directory
+        self.size = size * 1024 * 1024
+        for name in ('inputs', 'objects'):
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def get_digest(self, csv_file):
+        """Method to return the hash of the content of a csv
+
+        :param str csv_file: Name of the csv file
+        :rtype: str hexadecimal sha1 of the file
+
+        """
+        csv_file = os.path.abspath(csv_file)
+        stat = os.stat(csv_file)
+        entry = os.path.join(self.directory, 'inputs', hashlib.sha1(json.dumps(csv_file)).hexdigest())
+        signature = [stat.st_size, stat.st_mtime, stat.st_ino]
+        try:
+            with open(entry) as f:
+                known = json.load(f)
+            if known['signature'] == signature:
+                return known['digest']
+        except (IOError, ValueError, KeyError):
+            pass
+        log.debug("Hashing {}".format(csv_file))
+        digest = hashlib.sha1()
+        with open(csv_file, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b''):
+                digest.update(block)
+        digest = digest.hexdigest()
+        self.write(entry, json.dumps({'signature': signature, 'digest': digest}))
+        return digest
+
+    def get_key(self, digest, output_format, pretty=False, sort_key=None, schema=None, columns=None, types=None, compress=None):
+        """Method to return the key of an output in the cache
+
+        :param str digest: Hash of the csv
+        :param str output_format: Format of the output
+        :param bool pretty: Pretty printing of the output
+        :param str sort_key: Column the data is sorted on
+        :param dict schema: Validation schema
+        :param list columns: Names of the columns read
+        :param dict types: Types the columns are converted to
+        :param str compress: Compression of the output
+        :rtype: str
+
+        """
+        options = [CACHE_VERSION, digest, output_format.lower(), bool(pretty), sort_key, schema, columns, types, compress]
+        return hashlib.sha1(json.dumps(options, sort_keys=True)).hexdigest()
+
+    def get_object_name(self, key):
+        """Method to return the name of the file of an output in the cache"""
+        return os.path.join(self.directory, 'objects', key)
+
+    def get_details(self, key):
+        """Method to return the details of an output in the cache
+
+        :param str key: Key of the output
+        :rtype: dict of the details of the conversion, None if the
+        output is not in the cache
+
+        """
+        name = self.get_object_name(key)
+        try:
+            with open('{}.json'.format(name)) as f:
+                details = json.load(f)
+            size = os.path.getsize(name)
+        except (IOError, OSError, ValueError):
+            return None
+        if details.pop('size', None) != size:
+            log.debug("{} changed in the cache".format(key))
+            return None
+        return details
+
+    def fetch(self, key, output_name):
+        """Method to take an output from the cache
+
+        :param str key: Key of the output
+        :param str output_name: Name of the output file
+        :raises: OSError if the output is no longer in the cache
+
+        """
+        name = self.get_object_name(key)
+        # The modification time orders the outputs for eviction
+        os.utime(name, None)
+        log.debug("{} taken from the cache".format(output_name))
+        self.place(name, output_name)
+
+    def store(self, key, output_name, details):
+        """Method to add an output to the cache
+
+        :param str key: Key of the output
+        :param str output_name: Name of the output file
+        :param dict details: Details of the conversion, like the number
+        of rows
+
+        """
+        name = self.get_object_name(key)
+        self.place(output_name, name)
+        details = dict(details, size=os.path.getsize(name))
+        self.write('{}.json'.format(name), json.dumps(details))
+        self.evict()
+
+    def place(self, source, destination):
+        """Method to copy a file to another name atomically"""
+        temporary = '{}.{}.tmp'.format(destination, os.getpid())
+        try:
+            clone(source, temporary)
+        except:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        os.rename(temporary, destination)
+
+    def write(self, file_name, content):
+        """Method to write a small file of the cache atomically"""
+        f = tempfile.NamedTemporaryFile(dir=os.path.dirname(file_name), suffix='.tmp', delete=False)
+        with f:
+            f.write(content)
+        os.rename(f.name, file_name)
+
+    def evict(self):
+        """Method to remove the least recently used outputs beyond the size of the cache"""
+        directory = os.path.join(self.directory, 'objects')
+        objects = []
+        for name in os.listdir(directory):
+            if name.endswith('.json') or name.endswith('.tmp'):
+                continue
+            stat = os.stat(os.path.join(directory, name))
+            objects.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in objects)
+        for mtime, size, name in sorted(objects):
+            if total <= self.size:
+                break
+            log.debug("Evicting {} from the cache".format(name))
+            name = os.path.join(directory, name)
+            for path in (name, '{}.json'.format(name)):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
@@ -0,0 +1,234 @@
+from converttool import *
+from converttool.exceptions import *
+from converttool.validate import Validate
+from converttool.mmapreader import MmapReader, record_end
+from converttool.columns import iter_columns
+from converttool.formats import iter_batches
+from click import progressbar
+from cStringIO import StringIO
+from collections import deque
+from contextlib import contextmanager
+import multiprocessing
+import mmap
+import unicodecsv as csv
+
+log = logging.getLogger('converttool.Chunks')
+
+# Smallest chunk of the csv worth sending to another process
+MIN_CHUNK_SIZE = 1 << 20
+# Largest chunk of the csv, the encoded rows of a chunk are sent back
+# at once, so large files are split in more chunks instead
+MAX_CHUNK_SIZE = 16 << 20
+
+def split_csv(csv_file, chunks, min_chunk_size=MIN_CHUNK_SIZE, max_chunk_size=MAX_CHUNK_SIZE):
+    """Split the csv into byte ranges aligned on record boundaries
+
+    A newline only ends a record when it is outside of a quoted field,
+    and a quote only opens a quoted field at the start of the field, as
+    the csv module reads them. The records are scanned from the memory
+    mapped file with `record_end`, from one boundary to the next, so the
+    file is never parsed.
+
+    :param str csv_file: Name of the csv file
+    :param int chunks: Number of chunks wanted, more if they would be
+    larger than `max_chunk_size`
+    :param int min_chunk_size: Smallest size of a chunk in bytes
+    :param int max_chunk_size: Largest size of a chunk in bytes, but
+    for a single record larger than it
+    :rtype: tuple of the raw header record and the list of
+    `(start, end)` byte ranges of the records
+
+    """
+    try:
+        f = open(csv_file, 'rb')
+    except IOError:
+        raise CSVNotFound("{} not found!".format(csv_file))
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        # Empty files can not be mapped
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else ''
+        try:
+            return _split(data, size, chunks, min_chunk_size, max_chunk_size)
+        finally:
+            if size:
+                data.close()
+
+def _split(data, size, chunks, min_chunk_size, max_chunk_size):
+    """Split the mapped csv into byte ranges aligned on record boundaries"""
+    start = record_end(data, 0, size)
+    if start == -1:
+        start = size
+    header = data[:start]
+    chunks = max(chunks, -(-(size - start) // max(1, max_chunk_size)))
+    chunks = max(1, min(chunks, (size - start) // max(1, min_chunk_size)))
+    first = start
+    ranges = []
+    for i in range(1, chunks):
+        target = first + (size - first) * i // chunks
+        if target <= start:
+            continue
+        end = record_end(data, start, size, target)
+        if end == -1 or end >= size:
+            break
+        ranges.append((start, end))
+        start = end
+    if start < size:
+        ranges.append((start, size))
+    return header, ranges
+
+def read_chunk(csv_file, header, start, end, columns=None):
+    """Generator to parse the rows of a byte range of the csv
+
+    :param str csv_file: Name of the csv file
+    :param str header: Raw header record of the csv
+    :param int start: Offset of the first record of the range
+    :param int end: Offset following the last record of the range
+    :param list columns: Names of the columns to read, all of them by
+    default
+    :rtype: iterator of dictionaries, one for every row
+
+    """
+    with open(csv_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if columns is None:
+        rows = csv.DictReader(StringIO(header + data), encoding="utf-8")
+    else:
+        rows = iter_columns(StringIO(header + data), columns)
+    for row in rows:
+        yield row
+
+def read_mapped_chunk(csv_file, start, end, columns=None):
+    """Generator to parse the rows of a byte range of the csv from a memory map
+
+    The range is read in place from the mapped file, that the processes
+    share through the page cache.
+
+    """
+    with MmapReader(csv_file, columns) as reader:
+        for row in reader.iter_rows(start, end):
+            yield row
+
+def _encode_chunk(task):
+    """Validate the rows of a chunk once and encode them in every format in a worker process"""
+    formats, csv_file, header, start, end, schema, strict, reader, columns, types = task
+    if reader == 'mmap':
+        rows = read_mapped_chunk(csv_file, start, end, columns)
+    else:
+        rows = read_chunk(csv_file, header, start, end, columns)
+    parsed = [0]
+    rejected = []
+    indexes = []
+
+    def count(rows):
+        for row in rows:
+            parsed[0] += 1
+            yield row
+
+    rows = count(rows)
+    if schema is not None:
+        rows = Validate(rows, schema).filter(strict, lambda row, errors: rejected.append((row, errors)), rejected=indexes)
+    if types is not None:
+        rows = types.convert(rows)
+    writers = [format_class(pretty) for format_class, pretty in formats]
+    items = [[] for _ in writers]
+    # Items are merged as a whole, every writer encodes the same batches
+    for batch in iter_batches(rows, min(writer.batch_size for writer in writers)):
+        for writer, encoded in zip(writers, items):
+            encoded.extend(writer.encode_batch(batch))
+    return parsed[0], items, zip(indexes, rejected)
+
+@contextmanager
+def _open_sinks(formatters):
+    """Context manager opening the outputs of the formatters as sinks"""
+    if not formatters:
+        yield []
+        return
+    formatter = formatters[0]
+    with formatter.format_class.open_output(formatter.output_name, 'ab' if formatter.append else 'wb', formatter.compress) as sink:
+        with _open_sinks(formatters[1:]) as sinks:
+            yield [sink] + sinks
+
+def convert_in_chunks(formatters, csv_file, jobs, min_chunk_size=MIN_CHUNK_SIZE, schema=None, strict=False, rejects=None, reader='csv', columns=None, types=None, max_chunk_size=MAX_CHUNK_SIZE, rejected=None):
+    """Convert the csv to splittable formats with a pool of processes
+
+    The chunks of the csv are validated once and encoded in parallel by
+    writers of every format, and the encoded rows are written in the
+    original order by another writer per format, so the outputs are
+    identical to the outputs of a serial conversion. Chunks are at most
+    `max_chunk_size` bytes, and only a couple of chunks per process are
+    encoded ahead of the one written, so the memory used does not grow
+    with the csv.
+
+    :param list formatters: `Format` objects to convert to, their
+    `csv_data` is not used
+    :param str csv_file: Name of the csv file
+    :param int jobs: Number of processes
+    :param int min_chunk_size: Smallest size of a chunk in bytes
+    :param dict schema: Cerberus schema to validate the rows with
+    :param bool strict: Raise ValidationError on the first invalid row
+    :param RejectFile rejects: File the invalid rows are written in
+    :param str reader: `csv` reads the chunks with `unicodecsv`, `mmap`
+    with `MmapReader`
+    :param list columns: Names of the columns to read, all of them by
+    default
+    :param ColumnTypes types: Types the values are converted to
+    :param int max_chunk_size: Largest size of a chunk in bytes
+    :param list rejected: List the index of every invalid row of the
+    csv is appended to, None by default
+    :rtype: int number of rows parsed
+
+    """
+    for formatter in formatters:
+        if not getattr(formatter.find_format_class(), 'splittable', False):
+            raise ConversionError("{} format can not be converted in chunks".format(formatter.output_format))
+    header, ranges = split_csv(csv_file, jobs * 4, min_chunk_size, max_chunk_size)
+    log.debug("Converting {} chunks with {} processes".format(len(ranges), jobs))
+    formats = [(formatter.format_class, formatter.pretty) for formatter in formatters]
+    tasks = [(formats, csv_file, header, start, end, schema, strict, reader, columns, types) for start, end in ranges]
+    counts = []
+
+    def write_chunks(pool, writers):
+        pending = deque()
+        label = "Converting {}".format('|'.join(formatter.output_format for formatter in formatters).upper())
+        with progressbar(length=len(tasks), label=label) as bar:
+
+            def write_next():
+                count, items, invalid = pending.popleft().get()
+                for index, (row, errors) in invalid:
+                    if rejects is not None:
+                        rejects.write(row, errors)
+                    if rejected is not None:
+                        rejected.append(sum(counts) + index)
+                counts.append(count)
+                bar.update(1)
+                for writer, encoded in zip(writers, items):
+                    writer.write_items(encoded)
+
+            for task in tasks:
+                # Chunks encoded out of order wait for the ones before
+                # them, so only a couple per process are sent at once
+                if len(pending) >= 2 * jobs:
+                    write_next()
+                pending.append(pool.apply_async(_encode_chunk, (task,)))
+            while pending:
+                write_next()
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        with _open_sinks(formatters) as sinks:
+            writers = []
+            for formatter, sink in zip(formatters, sinks):
+                writer = formatter.format_class(formatter.pretty, formatter.buffer_size)
+                writer.open(sink)
+                writers.append(writer)
+            write_chunks(pool, writers)
+            for writer in writers:
+                writer.close()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return sum(counts)
@@ -0,0 +1,137 @@
+from converttool import *
+from converttool.exceptions import ServiceUnavailable
+import httplib
+import socket
+import json
+import time
+import sys
+
+log = logging.getLogger('converttool.Client')
+
+# Directory of the socket and the tokens of the service, under
+# $XDG_RUNTIME_DIR or ~/.cache
+SERVICE_DIR = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or os.path.expanduser('~/.cache'), 'converttool')
+# Unix socket the service listens on by default
+SOCKET_PATH = os.path.join(SERVICE_DIR, 'service.sock')
+# Address of the service, `host:port` or the path of a unix socket
+SERVER = os.environ.get('CONVERTTOOL_SERVER', SOCKET_PATH)
+# Header of the requests carrying the token of the service
+TOKEN_HEADER = 'X-Converttool-Token'
+# Number of times a job refused by a busy service is sent again
+RETRIES = 8
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    """Class to talk http to a server listening on a unix socket"""
+
+    def __init__(self, path, timeout=None):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+def token_path(server):
+    """Return the name of the file the service writes its token in
+
+    :param str server: `host:port` or the path of a unix socket
+    :rtype: str name of the file, next to the unix socket or in
+    `SERVICE_DIR` for a port
+
+    """
+    if '/' in server:
+        return '{}.token'.format(server)
+    return os.path.join(SERVICE_DIR, 'service-{}.token'.format(server.replace(':', '-')))
+
+def read_token(server):
+    """Return the token of the service, only readable by its user
+
+    :param str server: `host:port` or the path of a unix socket
+    :rtype: str token
+    :raises: ServiceUnavailable if there is no token for the service
+
+    """
+    try:
+        with open(token_path(server)) as f:
+            return f.read().strip()
+    except IOError:
+        raise ServiceUnavailable("No converttool service on {}: {} can not be read".format(server, token_path(server)))
+
+def connect(server=SERVER, timeout=None):
+    """Return a connection to the service
+
+    :param str server: `host:port` or the path of a unix socket
+    :param float timeout: Timeout of the connection in seconds
+    :rtype: httplib.HTTPConnection
+
+    """
+    if '/' in server:
+        return UnixHTTPConnection(server, timeout=timeout)
+    return httplib.HTTPConnection(server, timeout=timeout)
+
+def request(method, path, body=None, server=SERVER):
+    """Send a request to the service
+
+    :rtype: tuple of the status of the response and its json content
+    :raises: ServiceUnavailable if the service can not be reached
+
+    """
+    headers = {'Content-Type': 'application/json', TOKEN_HEADER: read_token(server)}
+    connection = connect(server)
+    try:
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    except (socket.error, httplib.HTTPException) as e:
+        raise ServiceUnavailable("No converttool service on {}: {}".format(server, e))
+    finally:
+        connection.close()
+
+def submit(args, cwd=None, server=SERVER, retries=RETRIES):
+    """Run a conversion in the service, as the command line would
+
+    A busy service refuses the job, which is sent again after waiting
+    longer and longer.
+
+    :param list args: Arguments of the `converttool` command line
+    :param str cwd: Directory the paths are relative to, the current
+    directory by default
+    :param str server: `host:port` or the path of a unix socket
+    :param int retries: Number of times a refused job is sent again
+    :rtype: dict of the exit `status` and the `output` of the command
+    :raises: ServiceUnavailable if the service can not be reached, or
+    is still busy
+
+    """
+    body = json.dumps({'args': list(args), 'cwd': cwd or os.getcwd()})
+    delay = 0.1
+    for attempt in range(retries + 1):
+        status, content = request('POST', '/jobs', body, server)
+        if status != 503:
+            break
+        if attempt < retries:
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+    if status != 200:
+        raise ServiceUnavailable(content.get('error', 'Service answered {}'.format(status)))
+    return content
+
+def main(args=None):
+    """Run a `converttool` command line in the service
+
+    Only the command line and the working directory are sent, the
+    client does not import the conversion code and starts fast.
+
+    """
+    try:
+        result = submit(sys.argv[1:] if args is None else args)
+    except ServiceUnavailable as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
+    sys.stdout.write(result['output'].encode('utf-8'))
+    sys.exit(result['status'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+from converttool import *
+from converttool.validate import COERCERS
+from converttool.constants import INFER_SAMPLE
+from itertools import islice
+import re
+
+log = logging.getLogger('converttool.Columns')
+
+# Csv representations of the inferred types. Integers with leading
+# zeros, like zip codes, are not numbers
+INTEGER = re.compile(r'-?(?:0|[1-9][0-9]*)$')
+FLOAT = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?$')
+
+def iter_columns(lines, columns, fieldnames=None):
+    """Generator to parse some of the columns of the lines of a csv
+
+    Only the values of the columns are decoded, the rows are the
+    dictionaries `unicodecsv.DictReader` would have built with only
+    these keys.
+
+    :param iterable lines: Lines of the csv
+    :param list columns: Names of the columns to read
+    :param list fieldnames: Header of the csv, read from the first line
+    by default
+    :rtype: iterator of dictionaries, one for every row
+
+    """
+    reader = csv.reader(lines)
+    if fieldnames is None:
+        fieldnames = [value.decode('utf-8') for value in next(reader, [])]
+    positions = [fieldnames.index(column) for column in columns]
+    for values in reader:
+        if not values:
+            continue
+        length = len(values)
+        yield dict(zip(columns, [values[i].decode('utf-8') if i < length else None for i in positions]))
+
+def project_schema(schema, columns):
+    """Return the rules of a validation schema for some of the columns
+
+    :param dict schema: Cerberus schema
+    :param list columns: Names of the columns read
+    :rtype: dict schema of the columns only
+
+    """
+    return dict((field, rules) for field, rules in schema.items() if field in columns)
+
+class ColumnTypes:
+    """Class to convert the values of the columns of the csv to their types
+
+    The type of a column is inferred from a sample of its first rows:
+    `integer` when all of its values are integers, `float` when they are
+    all numbers, `string` otherwise. Types declared in the validation
+    schema are used as they are. The types are the types of the schema,
+    converted by the same coercers, and added to the schema so that the
+    rows with values of another type are rejected by the validation.
+
+    """
+
+    def __init__(self, types):
+        """Method to initialize `ColumnTypes`
+
+        :param dict types: Name of the type of every column
+
+        """
+        self.types = types
+
+    @classmethod
+    def infer(cls, rows, fieldnames, schema=None, sample=INFER_SAMPLE):
+        """Method to infer the types of the columns from their first rows
+
+        :param iterable rows: Dictionaries of the rows of the csv
+        :param list fieldnames: Names of the columns
+        :param dict schema: Cerberus schema, its types are used for the
+        columns declaring one
+        :param int sample: Number of rows sampled
+        :rtype: ColumnTypes
+
+        """
+        candidates = dict((field, ['integer', 'float']) for field in fieldnames)
+        seen = set()
+        for row in islice(rows, sample):
+            for field, types in candidates.items():
+                value = row.get(field)
+                if not value or not types:
+                    continue
+                seen.add(field)
+                if types[0] == 'integer' and not INTEGER.match(value):
+                    types.pop(0)
+                if types and not FLOAT.match(value):
+                    del types[:]
+        types = {}
+        for field in fieldnames:
+            declared = (schema or {}).get(field, {}).get('type')
+            if declared in COERCERS:
+                types[field] = declared
+            elif field in seen and candidates[field]:
+                types[field] = candidates[field][0]
+            else:
+                types[field] = 'string'
+        log.debug("Types of the columns: {}".format(types))
+        return cls(types)
+
+    def apply(self, schema):
+        """Method to add the types to the columns of a schema without one
+
+        :param dict schema: Cerberus schema
+        :rtype: dict schema checking the types
+
+        """
+        typed = {}
+        for field, rules in schema.items():
+            if 'type' not in rules and self.types.get(field, 'string') != 'string':
+                rules = dict(rules, type=self.types[field])
+            typed[field] = rules
+        return typed
+
+    def convert(self, rows):
+        """Generator to convert the values of the typed columns of the rows
+
+        Empty values become None. Values that are not of the type of
+        their column are left as they are.
+
+        :param iterable rows: Dictionaries of the rows
+        :rtype: iterator of the rows, converted in place
+
+        """
+        coercers = [(field, COERCERS[name]) for field, name in self.types.items() if COERCERS.get(name) is not None]
+        for row in rows:
+            for field, coerce in coercers:
+                value = row.get(field)
+                if value is None:
+                    continue
+                if value == '':
+                    row[field] = None
+                    continue
+                try:
+                    row[field] = coerce(value)
+                except ValueError:
+                    pass
+            yield row
+
+    def __repr__(self):
+        return '<COLUMNTYPES>:<{}>'.format('|'.join('{}={}'.format(field, name) for field, name in sorted(self.types.items())))
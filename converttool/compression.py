@@ -0,0 +1,261 @@
+from converttool import *
+from converttool.exceptions import *
+from converttool.constants import COMPRESSIONS
+from collections import deque
+import io
+import bz2
+import zlib
+import time
+import struct
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        # Python 2 only has xz with backports.lzma
+        lzma = None
+
+log = logging.getLogger('converttool.Compression')
+
+# Extensions of the compressed files
+EXTENSIONS = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz'}
+# First bytes of the compressed files
+MAGIC = {'gzip': b'\x1f\x8b', 'bz2': b'BZh', 'xz': b'\xfd7zXZ\x00'}
+# Size of the blocks compressed at once, and of the reads of compressed data
+BLOCK_SIZE = 1 << 20
+READ_SIZE = 1 << 16
+
+def detect_compression(name):
+    """Return the compression of a file, from its first bytes
+
+    :param str name: Name of the file
+    :rtype: str compression, None if the file is not compressed or
+    can not be read
+
+    """
+    try:
+        with open(name, 'rb') as f:
+            start = f.read(max(len(magic) for magic in MAGIC.values()))
+    except IOError:
+        return None
+    for compression, magic in MAGIC.items():
+        if start.startswith(magic):
+            return compression
+    return None
+
+def strip_extension(name):
+    """Return the name of a file without the extension of its compression"""
+    for extension in EXTENSIONS.values():
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+def check_compression(compression):
+    """Check that a compression can be read and written, before any file
+    is opened for it
+
+    :param str compression: `gzip`, `bz2` or `xz`
+    :raises: CompressionNotSupported for an unknown compression, or xz
+    when lzma is not installed
+
+    """
+    if compression not in COMPRESSIONS:
+        raise CompressionNotSupported("{} compression is not supported".format(compression))
+    if compression == 'xz' and lzma is None:
+        raise CompressionNotSupported("xz needs the backports.lzma package on python 2")
+
+def _decompressor(compression):
+    """Return a decompressor object of a compression"""
+    check_compression(compression)
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    return lzma.LZMADecompressor()
+
+def open_input(name, compression=None):
+    """Open a file for reading, decompressed on the fly
+
+    :param str name: Name of the file
+    :param str compression: Compression of the file, None if it is not
+    compressed
+    :rtype: file object, reading the decompressed bytes
+
+    """
+    f = open(name, 'rb')
+    if compression is None:
+        return f
+    return decompress(f, compression)
+
+def decompress(fileobj, compression):
+    """Return a buffered file object reading the decompressed bytes of a file
+
+    :param fileobj: File object of the compressed data, closed with the
+    decompressed file
+    :param str compression: Compression of the data
+    :rtype: io.BufferedReader
+
+    """
+    return io.BufferedReader(DecompressedFile(fileobj, compression), READ_SIZE)
+
+class DecompressedFile(io.RawIOBase):
+    """Class to read the decompressed bytes of a compressed file object
+
+    The data is decompressed as it is read, so the decompressed file is
+    never written to disk. Files made of several compressed streams one
+    after the other, like appended outputs, are read to their end.
+
+    """
+
+    def __init__(self, fileobj, compression):
+        """Method to initialize `DecompressedFile`
+
+        :param fileobj: File object of the compressed data
+        :param str compression: Compression of the data
+
+        """
+        self.fileobj = fileobj
+        self.compression = compression
+        self.decompressor = _decompressor(compression)
+        self.buffer = b''
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.position == len(self.buffer):
+            data = self.fileobj.read(READ_SIZE)
+            if not data:
+                return 0
+            self.buffer = self.decompress(data)
+            self.position = 0
+        size = min(len(b), len(self.buffer) - self.position)
+        b[:size] = self.buffer[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def decompress(self, data):
+        """Method to decompress data, starting a new stream where one ends"""
+        chunks = []
+        while data:
+            try:
+                chunks.append(self.decompressor.decompress(data))
+            except EOFError:
+                # The stream ended with the previous data
+                self.decompressor = _decompressor(self.compression)
+                continue
+            data = self.decompressor.unused_data
+            if data:
+                self.decompressor = _decompressor(self.compression)
+        return b''.join(chunks)
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.close()
+        io.RawIOBase.close(self)
+
+def _deflate(block, level):
+    """Compress a block on its own, as a part of a deflate stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # A sync flush ends the block on a byte boundary, without ending the
+    # stream, so the compressed blocks can be put one after the other
+    return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+class CompressedSink:
+    """Class of a file object compressing what is written into a file
+
+    The data is compressed in blocks of `block_size` bytes by a pool of
+    threads, while the caller goes on writing. The compressors release
+    the GIL, so compression runs next to the conversion instead of
+    after it. Gzip blocks are compressed in parallel by all the threads,
+    as pigz does, into a single deflate stream. Bz2 and xz streams are
+    compressed in a single background thread.
+
+    """
+
+    def __init__(self, fileobj, compression, level=6, threads=None, block_size=BLOCK_SIZE):
+        """Method to initialize `CompressedSink`
+
+        :param fileobj: File object the compressed data is written into
+        :param str compression: `gzip`, `bz2` or `xz`
+        :param int level: Compression level
+        :param int threads: Number of threads compressing gzip blocks,
+        the number of cpus by default
+        :param int block_size: Size of the blocks compressed at once
+
+        """
+        from multiprocessing.pool import ThreadPool
+        import multiprocessing
+        check_compression(compression)
+        self.fileobj = fileobj
+        self.compression = compression
+        self.level = level
+        self.block_size = block_size
+        if compression == 'gzip':
+            self.threads = threads or multiprocessing.cpu_count()
+            self.crc = zlib.crc32(b'')
+            self.size = 0
+            # Header of a gzip member without a name
+            fileobj.write(b'\x1f\x8b\x08\x00' + struct.pack('<I', int(time.time())) + b'\x00\xff')
+        else:
+            self.threads = 1
+            if compression == 'bz2':
+                self.compressor = bz2.BZ2Compressor(level)
+            else:
+                self.compressor = lzma.LZMACompressor(preset=level)
+        self.pool = ThreadPool(self.threads)
+        self.pending = deque()
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, data):
+        """Method to write data, compressed once its block is full"""
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.block_size:
+            self.compress_block()
+
+    def compress_block(self):
+        """Method to hand the buffered data to the pool of threads"""
+        block = b''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        if self.compression == 'gzip':
+            self.crc = zlib.crc32(block, self.crc)
+            self.size += len(block)
+            self.pending.append(self.pool.apply_async(_deflate, (block, self.level)))
+        else:
+            # A single thread, the blocks are compressed in order
+            self.pending.append(self.pool.apply_async(self.compressor.compress, (block,)))
+        # Compressed blocks are written in order, holding a couple of
+        # blocks per thread at most
+        while self.pending and (self.pending[0].ready() or len(self.pending) > 2 * self.threads):
+            self.fileobj.write(self.pending.popleft().get())
+
+    def close(self):
+        """Method to compress the rest of the data and end the stream"""
+        if self.buffered:
+            self.compress_block()
+        while self.pending:
+            self.fileobj.write(self.pending.popleft().get())
+        self.pool.close()
+        self.pool.join()
+        if self.compression == 'gzip':
+            # A final empty block ends the deflate stream
+            self.fileobj.write(zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS).flush(zlib.Z_FINISH))
+            self.fileobj.write(struct.pack('<II', self.crc & 0xffffffff, self.size & 0xffffffff))
+        else:
+            self.fileobj.write(self.compressor.flush())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pool.terminate()
+            self.pool.join()
@@ -0,0 +1,27 @@
+from converttool import *
+
+# Defaults and choices of the options. The command line reads them
+# without importing the modules implementing the options, which import
+# them from here.
+
+# Executors running the formats, one after the other or all at once
+EXECUTORS = ('serial', 'thread', 'process')
+# Readers of the csv, `csv` reads it line by line with `unicodecsv`
+READERS = ('csv', 'mmap')
+# Compressions of the csv files and of the outputs
+COMPRESSIONS = ('gzip', 'bz2', 'xz')
+# Kinds of profiles of the stages
+PROFILES = ('cpu', 'mem')
+# Number of functions or allocation sites reported for every stage
+PROFILE_TOP = 20
+# Number of rows sampled to infer the types of the columns
+INFER_SAMPLE = 1000
+# Memory budget of the sort in megabytes
+SORT_MEMORY = 256
+# Directory of the cache, under $XDG_CACHE_HOME or ~/.cache
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'converttool')
+# Size of the cache in megabytes, the least recently used outputs are
+# evicted beyond it
+CACHE_SIZE = 1024
+# Size of the encoded output a writer buffers before writing it at once
+BUFFER_SIZE = 1 << 20
@@ -1,14 +1,26 @@
 from converttool import *
 from converttool.formats import Format
 from converttool.exceptions import *
-from converttool.validate import Validate
+from converttool.validate import Validate, RejectFile
+from converttool.rowtable import RowTable
+# The modules of the options are imported where the options are used
+from converttool.constants import SORT_MEMORY, PROFILE_TOP, CACHE_DIR, CACHE_SIZE, INFER_SAMPLE, BUFFER_SIZE
 from click import progressbar, echo
 import re
+from contextlib import contextmanager
 import codecs
 import unicodecsv as csv
 
 log = logging.getLogger('converttool.Converter')
 
+# Number of bytes read between two updates of the progress bar
+PROGRESS_STEP = 1 << 16
+
+@contextmanager
+def _no_stage():
+    """Context manager standing for a stage when stats or profiles are disabled"""
+    yield None
+
 class Converter:
     """Class to handle the conversion of data
     
@@ -17,7 +29,7 @@ class Converter:
     format. The output name is optional.
 
     """
-    def __init__(self, csv_file, output_format, output_name=None, pretty=False, loglevel="notset", strict=False):
+    def __init__(self, csv_file, output_format, output_name=None, pretty=False, loglevel="notset", strict=False, stream=False, append=False, executor="serial", workers=None, jobs=1, schema=None, sort_key=None, sort_memory=SORT_MEMORY, stats=False, profile=None, profile_top=PROFILE_TOP, cache=False, cache_dir=CACHE_DIR, cache_size=CACHE_SIZE, incremental=False, reader='csv', columns=None, infer_types=False, infer_sample=INFER_SAMPLE, compress=None, buffer_size=BUFFER_SIZE):
         """Method to initialize converter
 
         :param str csv_file: Name of the csv file
@@ -28,55 +40,717 @@ class Converter:
         :param bool pretty: A flag to specify pretty printing
         :param str loglevel: A loglevel for the logging module
         :param bool strict: Boolean for validation. If set, will raise 
-        ValidationError. False by default, and only removes 
+        ValidationError. False by default, and only removes the invalid
+        rows and writes them in <output_name>.rejects.csv
+        :param bool stream: If set, the csv is not loaded in memory, 
+        rows are read lazily and handed over to the formatters as they 
+        are parsed. False by default
+        :param bool append: If set, the data is appended to existing 
+        output files. Only supported by appendable formats like jsonl
+        :param str executor: `serial` converts the formats one after 
+        the other. `thread` or `process` parse the csv once and convert 
+        to all the formats at the same time in threads or processes. 
+        Streamed rows are always parsed once for all the formats, in 
+        threads with `serial`
+        :param int workers: Maximum number of formats converted at the 
+        same time by the executor. All of them by default
+        :param int jobs: Number of processes converting chunks of the 
+        csv in parallel, to all the formats. Implies `stream`. 
+        Sorted data is converted in a single pass. 1 by default
+        :param dict schema: Cerberus schema to validate the rows with.
+        By default validate.json is used if there is one
+        :param str sort_key: Name of the column to sort the data on. 
+        Numbers are sorted numerically
+        :param int sort_memory: Memory budget of the sort in megabytes. 
+        Rows that do not fit are sorted in temporary files
+        :param bool stats: If set, the time, rows, bytes and peak memory 
+        of every stage are measured in `self.metrics`. False by default
+        :param str profile: `cpu` or `mem` to profile the parsing of the 
+        csv and every format on its own in `self.profiler`. None by default
+        :param int profile_top: Number of functions or allocation sites 
+        reported for every stage
+        :param bool cache: If set, outputs are taken from the cache when 
+        the csv and the options did not change, and added to it 
+        otherwise. Not used when appending. False by default
+        :param str cache_dir: Directory of the cache
+        :param int cache_size: Size of the cache in megabytes, the least 
+        recently used outputs are evicted beyond it
+        :param bool incremental: If set, only the rows added at the end 
+        of the csv since the last conversion are converted, and added to 
+        the outputs of extendable formats. Outputs are rebuilt when the 
+        header or the rows converted before changed. Implies `stream`, 
+        and is not used with a sort key. False by default
+        :param str reader: `csv` reads the csv line by line with 
+        `unicodecsv`, `mmap` maps it in memory and parses it in blocks 
+        of records. `csv` by default
+        :param list columns: Names of the columns to read, the other 
+        columns are never decoded nor kept. All of them by default
+        :param bool infer_types: If set, the types of the columns are 
+        inferred from their first rows, and their values converted to 
+        integers or floats. Rows with values of another type are 
+        rejected by the validation. False by default
+        :param int infer_sample: Number of rows the types are inferred from
+        :param str compress: `gzip`, `bz2` or `xz` to compress the outputs
+        as they are written. Compressed outputs are rebuilt instead of 
+        converted incrementally. None by default
+        :param int buffer_size: Size in bytes of the output the formats 
+        buffer before writing it at once
+
+        Compressed csv files, gzip, bz2 or xz, are decompressed as they 
+        are read. They are read from their start in a single pass, so 
+        they are streamed instead of converted in chunks, with the `csv` 
+        reader, and are not converted incrementally.
 
         """
+        from converttool.compression import detect_compression, check_compression
         self.csv_file = csv_file
+        self.compression = detect_compression(csv_file)
+        # Compressions that can not be read or written fail before any 
+        # output is opened
+        for compression in set([self.compression, compress]) - set([None]):
+            check_compression(compression)
+        if self.compression is not None:
+            log.debug("{} is compressed with {}, it is read in a single pass".format(csv_file, self.compression))
+            stream = stream or jobs > 1
+            jobs = 1
+            reader = 'csv'
+            incremental = False
+        self.compress = compress
+        self.buffer_size = buffer_size
         self.output_format = output_format
         self.output_name = output_name
         self.pretty=pretty
-        self.data = self.parse_csv()
+        # Rows read in chunks, or sorted when they can not be, are not
+        # held in memory
+        self.stream = stream or jobs > 1
+        self.append = append
+        self.executor = executor
+        self.workers = workers
+        self.jobs = jobs
+        self.strict = strict
+        self.reader = reader
+        self.incremental = incremental and sort_key is None and compress is None
+        self.columns = self.check_columns(columns) if columns else None
+        self.schema = schema if schema is not None else self.load_schema()
+        if self.columns is not None and self.schema is not None:
+            from converttool.columns import project_schema
+            self.schema = project_schema(self.schema, self.columns)
+        self.rejects = None
+        self.rejected = None
+        self.sort_key = sort_key
+        self.sort_memory = sort_memory
+        self.types = self.infer_types(infer_sample) if infer_types else None
+        if self.types is not None and self.schema is not None:
+            self.schema = self.types.apply(self.schema)
+        self.metrics = None
+        if stats:
+            from converttool.metrics import Metrics
+            self.metrics = Metrics(self.get_stages())
+        self.profiler = None
+        if profile:
+            from converttool.profiling import Profiler
+            self.profiler = Profiler(profile, output_name, profile_top)
+        if sort_key is not None and sort_key not in self.get_columns():
+            raise SortKeyNotFound("{} is not a column of {}".format(sort_key, self.csv_file))
+        self.total_data = 0
+        self.cache = None
+        if cache and not (append or self.incremental):
+            from converttool.cache import Cache
+            self.cache = Cache(cache_dir, cache_size)
+        self.cached = self.find_cached() if self.cache is not None else {}
+        self.pending = [format for format in output_format if format not in self.cached]
+        if not self.pending:
+            # Every output is in the cache, the csv is not read
+            self.total_data = max(details['rows'] for details in self.cached.values())
+            self.data = None
+        elif stream or jobs > 1 or self.incremental:
+            self.csv_size = self.get_csv_size()
+            self.data = self.read_rows()
+        else:
+            with self.profile('parse_csv'):
+                self.data = self.parse_csv()
         log.setLevel(getattr(logging, loglevel.upper()))
         self.loglevel = loglevel
-        self.strict = strict
-        self.total_data = len(self.data)
+
+    def load_schema(self):
+        """Method to load the validation schema, None if there is none"""
+        try:
+            return Validate.load_schema()
+        except SettingsNotFound:
+            log.debug("No validate.json found, rows are not validated")
+            return None
+
+    def check_columns(self, columns):
+        """Method to check the columns to read against the header of the csv
+
+        :param list columns: Names of the columns
+        :rtype: list of the names of the columns
+        :raises: ColumnNotFound if a column is not in the header
+
+        """
+        fieldnames = self.get_fieldnames()
+        columns = [column.decode('utf-8') if isinstance(column, str) else column for column in columns]
+        for column in columns:
+            if column not in fieldnames:
+                raise ColumnNotFound(u"{} is not a column of {}".format(column, self.csv_file))
+        return columns
+
+    def infer_types(self, sample):
+        """Method to infer the types of the columns from the first rows of the csv
+
+        :param int sample: Number of rows sampled
+        :rtype: ColumnTypes
+
+        """
+        from converttool.columns import ColumnTypes
+        from converttool.compression import open_input
+        try:
+            f = open_input(self.csv_file, self.compression)
+        except IOError:
+            raise CSVNotFound("{} not found!".format(self.csv_file))
+        with f:
+            return ColumnTypes.infer(self.parse_lines(f), self.get_columns(), self.schema, sample)
+
+    def get_csv_size(self):
+        """Method to return the size of the csv file in bytes"""
+        try:
+            return os.path.getsize(self.csv_file)
+        except OSError:
+            log.debug("OS Error Occured")
+            raise CSVNotFound("{} not found!".format(self.csv_file))
+
+    def find_cached(self):
+        """Method to find the outputs already in the cache
+
+        :rtype: dict of the keys and details of the cached outputs, by format
+
+        """
+        self.get_csv_size()
+        digest = self.cache.get_digest(self.csv_file)
+        types = self.types.types if self.types is not None else None
+        self.cache_keys = dict((format, self.cache.get_key(digest, format, self.pretty, self.sort_key, self.schema, self.columns, types, self.compress)) for format in self.output_format)
+        cached = {}
+        for format, key in self.cache_keys.items():
+            details = self.cache.get_details(key)
+            if details is not None:
+                log.debug("{} format is in the cache".format(format))
+                cached[format] = details
+        return cached
+
+    def get_output_name(self, format):
+        """Method to return the name of the output file of a format"""
+        return Format(output_format=format, csv_data=None, output_name=self.output_name, compress=self.compress).output_name
 
     def parse_csv(self):
-        """Method to parse the csv and load the data"""
+        """Method to parse the csv and load the data
+
+        The rows are kept column by column in a `RowTable`, that hands
+        them out as read-only dictionaries.
+
+        """
         
         log.info("Parsing CSV")
-        data = []
+        rows = self.convert_rows(self.validate_rows(self.iter_csv()))
+        with self.measure('table', source=self.last_stage()):
+            table = RowTable(self.get_columns(), rows)
+        if self.sort_key is not None:
+            from converttool.sort import sort_key
+            log.info("Sorting on {}".format(self.sort_key))
+            with self.measure('sort') as stage:
+                table.sort(key=sort_key, field=self.sort_key)
+            if stage is not None:
+                stage.rows += len(table)
+        return table
+
+    def read_rows(self, label="Reading CSV", start=0):
+        """Method to return the valid rows of the csv, read lazily
+
+        When there is a sort key, the rows are sorted in memory if they 
+        fit in the memory budget, and in temporary files otherwise.
+
+        :param str label: Label of the progress bar
+        :param int start: Offset of the first row to read, after the header
+
+        """
+        rows = self.convert_rows(self.validate_rows(self.iter_csv(label=label, start=start)))
+        if self.sort_key is not None:
+            from converttool.sort import ExternalSort
+            rows = ExternalSort(self.get_columns(), self.sort_key, self.sort_memory).sort(rows)
+            rows = self.timed('sort', rows, source=self.row_stage())
+        return rows
+
+    def validate_rows(self, rows):
+        """Method to add the validation stage to a stream of rows
+
+        Invalid rows are dropped and written in the reject file, or
+        raise ValidationError in strict mode. Rows are returned as they
+        are when there is no schema.
+
+        :param iterable rows: Iterator of dictionaries
+        :rtype: iterator of the valid rows
+
+        """
+        if self.schema is None:
+            return rows
+        rows = self.profile_rows('validate', rows, self.iter_valid_rows)
+        return self.timed('validate', rows, source='decode')
+
+    def iter_valid_rows(self, rows):
+        """Generator to validate a stream of rows against the schema
+
+        The rows are validated once per run, in the first pass over the
+        csv, which writes the reject file. Passes reading the same rows
+        again for other formats drop the rows rejected by their index.
+
+        """
+        if self.rejected is not None:
+            for index, row in enumerate(rows):
+                if index not in self.rejected:
+                    yield row
+            return
+        self.rejects = RejectFile(self.get_rejects_name(), self.get_columns())
+        rejected = []
+        try:
+            for row in Validate(rows, self.schema).filter(self.strict, self.rejects.write, rejected=rejected):
+                yield row
+        finally:
+            self.rejects.close()
+        self.rejected = set(rejected)
+
+    def convert_rows(self, rows):
+        """Method to add the conversion of the values to their types to a stream of rows
+
+        Rows are returned as they are when the types are not inferred.
+
+        :param iterable rows: Iterator of dictionaries
+        :rtype: iterator of the converted rows
+
+        """
+        if self.types is None:
+            return rows
+        return self.timed('types', self.types.convert(rows), source='validate' if self.schema is not None else 'decode')
+
+    def get_fieldnames(self):
+        """Method to return the header of the csv"""
+        from converttool.compression import open_input
+        try:
+            with open_input(self.csv_file, self.compression) as f:
+                return next(csv.reader(f, encoding="utf-8"), [])
+        except IOError:
+            raise CSVNotFound("{} not found!".format(self.csv_file))
+
+    def get_columns(self):
+        """Method to return the names of the columns read, the header of the csv by default"""
+        return self.columns if self.columns is not None else self.get_fieldnames()
+
+    def parse_lines(self, lines, fieldnames=None):
+        """Method to parse the lines of the csv into rows of the columns read
+
+        :param iterable lines: Lines of the csv, starting with its 
+        header unless `fieldnames` is given
+        :param list fieldnames: Header of the csv
+        :rtype: iterator of dictionaries, one for every row
+
+        """
+        if self.columns is None:
+            return csv.DictReader(lines, fieldnames=fieldnames, encoding="utf-8")
+        from converttool.columns import iter_columns
+        return iter_columns(lines, self.columns, fieldnames)
+
+    def get_rejects_name(self):
+        """Method to return the name of the file of the rejected rows"""
+        return os.path.join(os.getcwd(), '{}.rejects.csv'.format(self.output_name or 'output'))
+
+    def get_stages(self):
+        """Method to return the names of the stages of a pass over the csv, in order"""
+        if self.jobs > 1 and self.sort_key is None:
+            # Chunks are read and validated in the pool of processes
+            return []
+        # Mapped files are read and decoded in a single stage
+        stages = ['decode'] if self.reader == 'mmap' else ['read', 'decode']
+        if self.schema is not None:
+            stages.append('validate')
+        if self.types is not None:
+            stages.append('types')
+        if not (self.stream or self.incremental):
+            stages.append('table')
+        if self.sort_key is not None:
+            stages.append('sort')
+        return stages
+
+    def timed(self, name, rows, source=None):
+        """Method to measure a stage producing rows, if stats are enabled
+
+        :param str name: Name of the stage
+        :param iterable rows: Rows produced by the stage
+        :param str source: Name of the stage the rows are read from
+        :rtype: iterator of the rows, the rows themselves without stats
+
+        """
+        if self.metrics is None:
+            return rows
+        return self.metrics.iterate(name, rows, source)
+
+    def measure(self, name, source=None):
+        """Method to measure a stage consuming rows, if stats are enabled
+
+        :rtype: context manager giving the `Stage`, or None without stats
+
+        """
+        if self.metrics is None:
+            return _no_stage()
+        return self.metrics.measure(name, source)
+
+    def profile(self, name):
+        """Method to profile a stage, if profiles are enabled
+
+        :rtype: context manager
+
+        """
+        if self.profiler is None:
+            return _no_stage()
+        return self.profiler.profile(name)
+
+    def profile_rows(self, name, rows, produce):
+        """Method to profile a stage producing rows on its own, if profiles are enabled
+
+        :param str name: Name of the stage
+        :param iterable rows: Rows read by the stage
+        :param function produce: Called with the rows to read, returns
+        the rows made by the stage
+        :rtype: iterator of the rows made by the stage
+
+        """
+        if self.profiler is None:
+            return produce(rows)
+        return self.profiler.iterate(name, rows, produce)
+
+    def last_stage(self):
+        """Method to return the name of the last stage producing rows in a pass over the csv"""
+        if self.sort_key is not None and self.stream:
+            return 'sort'
+        return self.row_stage()
+
+    def row_stage(self):
+        """Method to return the name of the last stage producing rows before they are kept or sorted"""
+        if self.types is not None:
+            return 'types'
+        return 'validate' if self.schema is not None else 'decode'
+
+    def measure_format(self, formatter, source=None):
+        """Method to convert to a format, measured as a stage if stats are enabled
+
+        :param Format formatter: Formatter holding the rows to convert
+        :param str source: Name of the stage the rows are read from,
+        None if they are held in memory
+
+        """
+        with self.profile(formatter.output_format), self.measure(formatter.output_format, source=source) as stage:
+            formatter.convert_data()
+        if stage is not None:
+            if source is None:
+                stage.rows += len(self.data)
+            stage.bytes_out += os.path.getsize(formatter.output_name)
+
+    def iter_csv(self, label="Reading CSV", start=0):
+        """Generator to lazily read the rows of the csv in a single pass
+
+        The file is read line by line, so only a small buffer is kept 
+        in memory. The progress bar is driven by the number of bytes 
+        read against the size of the file. In incremental mode, a last 
+        record without a line break may still be being written, and is 
+        left for the next conversion. `self.offset` is the end of the 
+        last record read.
+
+        :param str label: Label of the progress bar
+        :param int start: Offset of the first row to read, after the 
+        header. 0 reads the file from its header
+        :rtype: iterator of dictionaries, one for every row
+
+        """
+        if self.reader == 'mmap':
+            for row in self.iter_mapped_csv(label, start):
+                yield row
+            return
         try:
             log.debug("Trying to open {}".format(self.csv_file))
-            with open(self.csv_file) as f:
-                length = len(f.readlines())
-                f.seek(0)
-                f_csv = csv.DictReader(f, encoding="utf-8")
-                with progressbar(f_csv,
-                        label="Reading CSV",
-                        length=length) as bar:
-                    for row in bar:
-                        data.append(row)
-            return data
+            f = open(self.csv_file, 'rb')
         except IOError:
             log.debug("IO Error Occured")
             raise CSVNotFound("{} not found!".format(self.csv_file))
+        with f:
+            length = os.fstat(f.fileno()).st_size
+            fieldnames = None
+            if start:
+                fieldnames = self.get_fieldnames()
+                f.seek(start)
+            self.offset = start
+            # readline keeps f.tell() accurate, iterating over the file 
+            # uses a read-ahead buffer. Compressed files are decompressed 
+            # as they are read, and the progress follows the compressed 
+            # bytes read
+            source = f
+            if self.compression is not None:
+                from converttool.compression import decompress
+                source = decompress(f, self.compression)
+            lines = iter(source.readline, b'')
+            if self.incremental:
+                lines = self.iter_complete_lines(lines)
+            lines = self.timed('read', lines)
+            f_csv = self.timed('decode', self.parse_lines(lines, fieldnames), source='read')
+            total = 0
+            with progressbar(length=length, label=label) as bar:
+                bar.update(start)
+                position = start
+                for row in f_csv:
+                    total += 1
+                    yield row
+                    current = f.tell()
+                    if current - position >= PROGRESS_STEP:
+                        bar.update(current - position)
+                        position = current
+                bar.update(length - position)
+            self.total_data = total
+            if not self.incremental:
+                self.offset = f.tell()
+            if self.metrics is not None:
+                self.metrics.stage('read').bytes_in += f.tell() - start
+
+    def iter_mapped_csv(self, label="Reading CSV", start=0):
+        """Generator to read the rows of the csv from a memory map
+
+        :param str label: Label of the progress bar
+        :param int start: Offset of the first row to read, after the 
+        header. 0 reads the file from its header
+        :rtype: iterator of dictionaries, one for every row
+
+        """
+        from converttool.mmapreader import MmapReader
+        with MmapReader(self.csv_file, self.columns) as reader:
+            rows = self.timed('decode', reader.iter_rows(start or None, complete=self.incremental))
+            total = 0
+            with progressbar(length=reader.size, label=label) as bar:
+                bar.update(start)
+                position = start
+                for row in rows:
+                    total += 1
+                    yield row
+                    if reader.offset - position >= PROGRESS_STEP:
+                        bar.update(reader.offset - position)
+                        position = reader.offset
+                bar.update(reader.size - position)
+            self.total_data = total
+            self.offset = reader.offset
+            if self.metrics is not None:
+                self.metrics.stage('decode').bytes_in += reader.offset - start
+
+    def iter_complete_lines(self, lines):
+        """Generator to yield the lines of the complete records of the csv
+
+        A record is complete at a line break outside of quoted fields,
+        that is after an even number of quotes.
+
+        :param iterable lines: Lines of the csv
+        :rtype: iterator of the lines, `self.offset` following the end of
+        the last complete record
+
+        """
+        record = []
+        quotes = 0
+        for line in lines:
+            if not line.endswith(b'\n'):
+                break
+            record.append(line)
+            quotes += line.count(b'"')
+            if quotes % 2 == 0:
+                for line in record:
+                    self.offset += len(line)
+                    yield line
+                record = []
+                quotes = 0
 
     def convert(self):
-        """Method to convert the csv data into the specified formats"""
+        """Method to convert the csv data into the specified formats
+
+        Outputs found in the cache are taken from it, and the others are
+        added to it once converted, unless rows were rejected.
+
+        """
         log.info("Converting to other formats")
-        with progressbar(self.output_format,
-                label="Converting {}".format('|'.join(self.output_format).upper()),
-                length=len(self.output_format)) as bar:
+        for format in self.cached:
+            self.cache.fetch(self.cache_keys[format], self.get_output_name(format))
+        if not self.pending:
+            return
+        if self.incremental:
+            self.convert_incremental()
+        elif self.jobs > 1 and self.sort_key is None:
+            self.convert_chunks()
+        elif self.executor != 'serial' or (self.stream and len(self.pending) > 1):
+            # Streamed rows are read once, and fed to all the formats
+            self.fan_out()
+        else:
+            self.convert_serial()
+        if self.cache is not None and not self.get_total_rejected():
+            for format in self.pending:
+                self.cache.store(self.cache_keys[format], self.get_output_name(format), {'rows': self.total_data})
+
+    def convert_serial(self):
+        """Method to convert the csv data into the formats one after the other
+
+        Streamed rows are only converted here for a single format, more
+        formats are fed from a single pass by `fan_out`.
+
+        """
+        with progressbar(self.pending,
+                label="Converting {}".format('|'.join(self.pending).upper()),
+                length=len(self.pending)) as bar:
             for format in bar:
                 log.debug("Process for :{} format".format(format))
-                self.formatter = Format(output_format=format, csv_data=self.data, output_name=self.output_name, pretty=self.pretty, loglevel=self.loglevel)
-                self.formatter.convert_data()
-    
+                data = self.data
+                if self.stream:
+                    data = self.read_rows(label="Converting {}".format(format.upper()))
+                self.formatter = Format(output_format=format, csv_data=data, output_name=self.output_name, pretty=self.pretty, loglevel=self.loglevel, append=self.append, compress=self.compress, buffer_size=self.buffer_size)
+                self.measure_format(self.formatter, source=self.last_stage() if self.stream else None)
+
+    def convert_incremental(self):
+        """Method to convert the rows added to the csv since the last conversion
+
+        Every format is converted from the end of the rows its output 
+        was converted from, all of them in a single pass, and its 
+        checkpoint is saved once the rows are added to it. Outputs 
+        without a checkpoint matching the csv, or of formats that can 
+        not be extended, are rebuilt. The rows converted before are 
+        hashed once for all the outputs, and only the rows added are 
+        hashed for the new checkpoints.
+
+        """
+        from converttool.incremental import Checkpoint, PrefixHash, hash_options
+        header = hash_options(self.get_fieldnames())
+        types = self.types.types if self.types is not None else None
+        options = hash_options(bool(self.pretty), self.schema, self.columns, types)
+        prefix = PrefixHash(self.csv_file)
+        checkpoints = dict((format, Checkpoint.load(self.get_output_name(format))) for format in self.pending)
+        # Checkpoints are checked from the smallest offset, so the csv 
+        # is hashed in a single pass
+        for format in sorted(self.pending, key=lambda format: checkpoints[format].offset if checkpoints[format] else 0):
+            checkpoint = checkpoints[format]
+            extendable = getattr(Format(output_format=format, csv_data=None).find_format_class(), 'extendable', False)
+            if checkpoint is None or not extendable or not checkpoint.matches(self.csv_file, self.get_output_name(format), header, options, prefix):
+                checkpoints[format] = Checkpoint(header=header, options=options)
+        # The csv is read and validated once, from the smallest offset. 
+        # Outputs converted further skip the valid rows they already 
+        # hold, counted by the checkpoints of the same options
+        first = min((checkpoints[format] for format in self.pending), key=lambda checkpoint: checkpoint.offset)
+        formatters = []
+        for format in self.pending:
+            checkpoint = checkpoints[format]
+            extend = checkpoint.offset > 0
+            log.debug("{} {} from offset {}".format('Extending' if extend else 'Rebuilding', format, checkpoint.offset))
+            formatters.append(Format(output_format=format, csv_data=None, output_name=self.output_name, pretty=self.pretty, loglevel=self.loglevel, extend=extend, buffer_size=self.buffer_size))
+        data = self.read_rows(label="Converting {}".format('|'.join(self.pending).upper()), start=first.offset)
+        if len(formatters) == 1:
+            self.formatter = formatters[0]
+            self.formatter.csv_data = data
+            self.measure_format(self.formatter, source=self.last_stage())
+        else:
+            from converttool.fanout import FanOut
+            skips = [checkpoints[format].rows - first.rows for format in self.pending]
+            formats = '|'.join(self.pending)
+            with self.profile('parse_csv'), self.measure(formats, source=self.last_stage()) as stage:
+                FanOut(formatters, self.get_columns(), executor=self.executor if self.executor != 'serial' else 'thread', profiler=self.profiler, skips=skips).run(data)
+            if stage is not None:
+                stage.bytes_out += sum(os.path.getsize(formatter.output_name) for formatter in formatters)
+        rows = first.rows + self.total_data - self.get_total_rejected()
+        for format in self.pending:
+            output_name = self.get_output_name(format)
+            checkpoint = checkpoints[format]
+            checkpoint.rows = rows
+            checkpoint.offset = self.offset
+            checkpoint.prefix = prefix.hexdigest(self.offset)
+            checkpoint.output_size = os.path.getsize(output_name)
+            checkpoint.save(output_name)
+
+    def fan_out(self, formats=None):
+        """Method to convert the csv data into all the formats at once
+
+        The csv is parsed once for every group of `workers` formats and
+        its rows are sent to all the formatters of the group, which run
+        in parallel with the executor. Streamed rows of the `serial`
+        executor are sent to formatters in threads.
+
+        :param list formats: Formats to convert to, the pending formats
+        by default
+
+        """
+        from converttool.fanout import FanOut
+        executor = self.executor if self.executor != 'serial' else 'thread'
+        pending = formats or self.pending
+        workers = self.workers or len(pending)
+        for i in range(0, len(pending), workers):
+            formats = pending[i:i + workers]
+            log.debug("Fan out for :{} formats".format('|'.join(formats)))
+            data = self.data
+            if self.stream:
+                data = self.read_rows(label="Converting {}".format('|'.join(formats).upper()))
+            formatters = [Format(output_format=format, csv_data=None, output_name=self.output_name, pretty=self.pretty, loglevel=self.loglevel, append=self.append, compress=self.compress, buffer_size=self.buffer_size) for format in formats]
+            # The formatters run at the same time, they are measured as one 
+            # stage, and profiled on their own in their thread or process. 
+            # Streamed rows are parsed in this thread, profiled apart
+            with self.profile('parse_csv') if self.stream else _no_stage(), self.measure('|'.join(formats), source=self.last_stage() if self.stream else None) as stage:
+                FanOut(formatters, self.get_columns(), executor=executor, profiler=self.profiler).run(data)
+            if stage is not None:
+                if not self.stream:
+                    stage.rows += len(self.data)
+                stage.bytes_out += sum(os.path.getsize(formatter.output_name) for formatter in formatters)
+
+    def convert_chunks(self):
+        """Method to convert the csv data with a pool of processes
+
+        The chunks of the csv are validated once and converted to all
+        the formats in parallel. Formats that can not be split are
+        converted in a single pass.
+
+        """
+        from converttool.chunks import convert_in_chunks
+        formatters = [Format(output_format=format, csv_data=None, output_name=self.output_name, pretty=self.pretty, loglevel=self.loglevel, append=self.append, compress=self.compress, buffer_size=self.buffer_size) for format in self.pending]
+        splittable = [formatter for formatter in formatters if getattr(formatter.find_format_class(), 'splittable', False)]
+        if splittable:
+            formats = '|'.join(formatter.output_format for formatter in splittable)
+            log.debug("Process in chunks for :{} formats".format(formats))
+            rejects = rejected = None
+            if self.schema is not None:
+                self.rejects = rejects = RejectFile(self.get_rejects_name(), self.get_columns())
+                rejected = []
+            # Reading, validation and formatting all happen in the pool
+            with self.profile(formats), self.measure(formats) as stage:
+                try:
+                    self.total_data = convert_in_chunks(splittable, self.csv_file, self.jobs, schema=self.schema, strict=self.strict, rejects=rejects, reader=self.reader, columns=self.columns, types=self.types, rejected=rejected)
+                finally:
+                    if rejects is not None:
+                        rejects.close()
+            if rejected is not None:
+                self.rejected = set(rejected)
+            if stage is not None:
+                stage.rows += self.total_data
+                stage.bytes_in += self.csv_size
+                stage.bytes_out += sum(os.path.getsize(formatter.output_name) for formatter in splittable)
+        others = [formatter.output_format for formatter in formatters if formatter not in splittable]
+        # The rows rejected in the chunks are dropped without validating
+        # them again
+        if len(others) > 1:
+            self.fan_out(others)
+        elif others:
+            self.formatter = Format(output_format=others[0], csv_data=self.read_rows(label="Converting {}".format(others[0].upper())), output_name=self.output_name, pretty=self.pretty, loglevel=self.loglevel, append=self.append, compress=self.compress, buffer_size=self.buffer_size)
+            self.measure_format(self.formatter, source=self.last_stage())
+
     def get_total_data(self):
         """Method to retun the total data parsed from csv"""
         return self.total_data
 
+    def get_total_rejected(self):
+        """Method to return the number of invalid rows of the run"""
+        return self.rejects.total if self.rejects is not None else 0
+
     def __repr__(self):
         return '<CONVERTER>:<{}>:<{}>'.format(self.csv_file, '|'.join(self.output_format))
 
@@ -27,3 +27,25 @@ class SettingsNotFound(Error):
 
 class InvalidValidationSchema(Error):
     """Exception raised when validate.json is invalid"""
+
+class SortKeyNotFound(Error):
+    """Exception raised when the sort key is not a column of the csv"""
+
+class ColumnNotFound(Error):
+    """Exception raised when a column to read is not a column of the csv"""
+
+class ServiceBusy(Error):
+    """Exception raised when the service runs or queues too many jobs 
+    to accept another one"""
+
+class ServiceUnavailable(Error):
+    """Exception raised when the service can not be reached, or stays 
+    busy"""
+
+class OutputNameConflict(Error):
+    """Exception raised when files of a batch would be converted to the 
+    same outputs, like a.csv and a.csv.gz"""
+
+class CompressionNotSupported(Error):
+    """Exception raised when a compression can not be read or written, 
+    like xz without backports.lzma"""
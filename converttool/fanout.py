@@ -0,0 +1,151 @@
+from converttool import *
+from converttool.exceptions import *
+from converttool.constants import EXECUTORS
+from converttool.rowtable import make_row
+import Queue
+import itertools
+import threading
+import multiprocessing
+
+log = logging.getLogger('converttool.FanOut')
+
+class FanOut:
+    """Class to send a single stream of rows to several formatters at once
+
+    The rows are parsed once and put in batches on a bounded queue per
+    formatter. Every formatter consumes its own queue in a thread or in
+    a process, so a slow formatter only stalls the others once its
+    queue is full, and the total time gets close to the time of the
+    slowest formatter instead of the sum of all of them.
+
+    Unpickled dictionaries get their keys inserted in the order they
+    were iterated, which can change the order of the keys of rows
+    longer than the header. Rows are sent to processes as values in the
+    order of the header, and built again in them as `csv.DictReader`
+    builds them.
+
+    """
+
+    def __init__(self, formatters, fieldnames, executor='thread', queue_size=64, batch_size=512, profiler=None, skips=None):
+        """Method to initialize `FanOut`
+
+        :param list formatters: `Format` objects to feed, their
+        `csv_data` is replaced by the rows coming from their queue
+        :param list fieldnames: Header of the rows
+        :param str executor: `thread` or `process`
+        :param int queue_size: Number of batches a queue can hold
+        :param int batch_size: Number of rows in a batch
+        :param Profiler profiler: Profiler the formatters are profiled
+        for, each in its own thread or process and reported as a stage
+        of its own. None by default
+        :param list skips: Number of rows at the start of the stream
+        every formatter leaves out. None sends all the rows to all the
+        formatters
+
+        """
+        if executor not in ('thread', 'process'):
+            raise ValueError("{} executor is not supported".format(executor))
+        self.formatters = formatters
+        self.fieldnames = fieldnames
+        self.executor = executor
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.profiler = profiler
+        self.skips = skips or [0] * len(formatters)
+
+    def run(self, rows):
+        """Method to feed the rows to every formatter and wait for them
+
+        :param iterable rows: List or iterator of dictionaries
+        :raises: The first error raised by a formatter
+
+        """
+        if self.executor == 'thread':
+            queues = [Queue.Queue(self.queue_size) for _ in self.formatters]
+            results = Queue.Queue()
+            workers = [threading.Thread(target=_consume, args=(i, f, q, results, self.profiler, None, skip))
+                    for i, (f, q, skip) in enumerate(zip(self.formatters, queues, self.skips))]
+            pack = None
+        else:
+            queues = [multiprocessing.Queue(self.queue_size) for _ in self.formatters]
+            results = multiprocessing.Queue()
+            workers = [multiprocessing.Process(target=_consume, args=(i, f, q, results, self.profiler, self.fieldnames, skip))
+                    for i, (f, q, skip) in enumerate(zip(self.formatters, queues, self.skips))]
+            fieldnames = self.fieldnames
+            pack = lambda batch: [([row.get(field) for field in fieldnames], row.get(None)) for row in batch]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        try:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == self.batch_size:
+                    if pack is not None:
+                        batch = pack(batch)
+                    for q in queues:
+                        q.put(batch)
+                    batch = []
+            if batch:
+                if pack is not None:
+                    batch = pack(batch)
+                for q in queues:
+                    q.put(batch)
+        finally:
+            # Always unblock and wait for the formatters, even if parsing
+            # or validation failed
+            for q in queues:
+                q.put(None)
+            outcomes = sorted(results.get() for _ in workers)
+            for worker in workers:
+                worker.join()
+        if self.profiler is not None:
+            for _, _, reports in outcomes:
+                self.profiler.reports.extend(reports)
+        for _, error, _ in outcomes:
+            if error is not None:
+                raise error
+
+def _iter_queue(queue, fieldnames=None):
+    """Generator to yield the rows of the batches put on a queue
+
+    :param list fieldnames: Header of the rows sent as values, None if
+    the rows are sent as they are
+    """
+    for batch in iter(queue.get, None):
+        if fieldnames is None:
+            for row in batch:
+                yield row
+        else:
+            for values, extra in batch:
+                yield make_row(fieldnames, values, extra)
+
+def _consume(index, formatter, queue, results, profiler=None, fieldnames=None, skip=0):
+    """Run a formatter on the rows of its queue and report the outcome
+
+    If the formatter fails, the rest of its queue is drained so the
+    producer never blocks on it. The formatter is profiled by a profiler
+    of its own, whose reports are sent back with the outcome. The first
+    `skip` rows are not given to the formatter.
+    """
+    rows = _iter_queue(queue, fieldnames)
+    formatter.csv_data = itertools.islice(rows, skip, None)
+    profile = None
+    if profiler is not None:
+        from converttool.profiling import Profiler
+        profile = Profiler(profiler.kind, profiler.output_name, profiler.top)
+    try:
+        if profile is None:
+            formatter.convert_data()
+        else:
+            with profile.profile(formatter.output_format):
+                formatter.convert_data()
+        error = None
+    except Error as e:
+        error = e
+    except Exception as e:
+        log.debug('There was an error in {}: {}'.format(formatter.output_format, e))
+        error = ConversionError("There was an error converting to {}".format(formatter.output_format.upper()))
+    for _ in rows:
+        pass
+    results.put((index, error, profile.reports if profile is not None else []))
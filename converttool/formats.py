@@ -1,15 +1,111 @@
 from converttool import * 
 from converttool.exceptions import *
-from dicttoxml import dicttoxml
-from xml.dom.minidom import parseString
-from click import progressbar
-import simplejson as json
-import codecs
-import unicodecsv as csv
-import traceback
+from converttool.constants import BUFFER_SIZE
+from contextlib import contextmanager
+from cStringIO import StringIO
+import importlib
+import itertools
+import re
 
 log = logging.getLogger('converttool.Format')
 
+# Classes implementing the formats, as `module:class` by name of the
+# format. A class, and the libraries it needs, are only imported once
+# its format is used
+FORMATS = {
+    'JSON': 'converttool.formats:FormatJSON',
+    'JSONL': 'converttool.formats:FormatJSONL',
+    'XML': 'converttool.formats:FormatXML',
+}
+
+# Group of the entry points declaring the formats of other packages
+ENTRY_POINTS = 'converttool.formats'
+
+# Groups of entry points already registered
+LOADED_ENTRY_POINTS = set()
+
+# Number of rows handed to a writer at once, unless it prefers another
+BATCH_SIZE = 512
+
+def register_format(output_format, path):
+    """Register the class implementing a format
+
+    :param str output_format: Name of the format, like `yaml`
+    :param str path: Module and name of the class, as `module:class`,
+    imported when the format is first used
+
+    """
+    FORMATS[output_format.upper()] = path
+
+def load_entry_points(group=ENTRY_POINTS):
+    """Register the formats declared as entry points by installed packages
+
+    A package provides formats by declaring them in its `setup.py`:
+    ```
+    entry_points={
+        'converttool.formats': ['yaml = mypackage.formats:FormatYAML'],
+    }
+    ```
+    The entry points are only listed, their modules are imported when
+    their format is used. Formats registered already are kept.
+
+    :param str group: Group of the entry points
+
+    """
+    if group in LOADED_ENTRY_POINTS:
+        return
+    LOADED_ENTRY_POINTS.add(group)
+    try:
+        import pkg_resources
+    except ImportError:
+        log.debug('pkg_resources is not available, formats of other packages are not registered')
+        return
+    for entry_point in pkg_resources.iter_entry_points(group):
+        if entry_point.name.upper() in FORMATS:
+            log.debug('{} format is registered already, {} is ignored'.format(entry_point.name, entry_point))
+            continue
+        register_format(entry_point.name, '{}:{}'.format(entry_point.module_name, '.'.join(entry_point.attrs)))
+
+def load_format_class(output_format):
+    """Import the class implementing a format
+
+    Formats that are not registered are looked up in the entry points
+    of the installed packages.
+
+    :param str output_format: Name of the format
+    :rtype: class implementing the format
+    :raises: FormatterNotFound if no class is registered for the format,
+    or it can not be imported
+
+    """
+    if output_format.upper() not in FORMATS:
+        load_entry_points()
+    try:
+        module, name = FORMATS[output_format.upper()].split(':')
+    except KeyError:
+        raise FormatterNotFound("{} format is not supported yet".format(output_format))
+    try:
+        return reduce(getattr, name.split('.'), importlib.import_module(module))
+    except (ImportError, AttributeError) as e:
+        log.debug('Can not import {}: {}'.format(FORMATS[output_format.upper()], e))
+        raise FormatterNotFound("{} format is not supported yet".format(output_format))
+
+def iter_batches(rows, batch_size):
+    """Generator to group rows into lists of `batch_size` rows
+
+    :param iterable rows: List or iterator of dictionaries
+    :param int batch_size: Number of rows in a batch, the last batch
+    has less
+    :rtype: iterator of the lists of rows
+
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
 class Format:
     """Base class to represent a format. 
 
@@ -17,15 +113,28 @@ class Format:
     of data to the format to the implementing class, so that the api can
     use Format without caring about implementing classes. This reduces 
     code maintain overhead for the api using Format
-    
+
     It's very easy to add your own formats. The requirements are:
         * The implementing class should have the naming convention as
           follows: 
           `Format<format_name>` where `format_name` is capitalized
-          eg: `FormatJSON` or `FormatXML` or `FormatYAML`
+          eg: `FormatJSON` or `FormatXML` or `FormatYAML`, and be 
+          registered with `register_format('yaml', 'module:FormatYAML')`
+          or declared as an entry point of the `converttool.formats`
+          group by the package providing it, see `load_entry_points`.
+          The module is only imported when the format is used, so it 
+          should import the libraries it needs itself
+
+        * The implementing class should subclass `FormatWriter`, and
+          write the rows with its streaming protocol: `open(sink)`,
+          `write_batch(rows)` for every batch of rows and `close()`.
+          The rows are never all held in memory, and the capabilities
+          of the writer tell whether the format can be appended to,
+          extended and converted in parallel chunks, see `FormatWriter`.
 
-        * The implementing function should implement a `classmethod`
-          with a specific signature as follows:
+        * Classes that do not stream implement a `classmethod` with a
+          specific signature as follows, which `FormatWriter`
+          implements on top of the streaming protocol:
           ```
           @classmethod
           def convert_data(cls, output_name, data, pretty):
@@ -38,11 +147,12 @@ class Format:
           ```
           The parameters of the above classmethod are as follows:
           :param str output_name: Name of the output file
-          :param List data: List of dictionaries parsed from csv_data
+          :param iterable data: List or iterator of dictionaries parsed 
+          from csv_data. Iterators must only be consumed once
           :param bool pretty: A boolean flag to specify pretty printing
     """
 
-    def __init__(self, output_format, csv_data, output_name=None, pretty=False, loglevel="notset"):
+    def __init__(self, output_format, csv_data, output_name=None, pretty=False, loglevel="notset", append=False, extend=False, compress=None, buffer_size=BUFFER_SIZE):
         """Method to initialize `Format`
 
         The `output_format` can be lower case or upper case, but it should         
@@ -56,19 +166,36 @@ class Format:
 
         :param str output_format: the format in which the data needs to be
         converted. 
-        :param List csv_data: Data parsed from csv as list of dictionaries
+        :param iterable csv_data: Data parsed from csv as list or lazy
+        iterator of dictionaries
         :param str output_name: Name of the output file or None
         :param bool pretty: A boolean to specify pretty printing
-        
+        :param bool append: A boolean to append to an existing output 
+        file. Only supported by appendable formats
+        :param bool extend: A boolean to add the data to the document of
+        an existing output file. Only supported by extendable formats
+        :param str compress: `gzip`, `bz2` or `xz` to compress the output
+        file, named with the extension of the compression. Only
+        supported by formats implementing `FormatWriter`
+        :param int buffer_size: Size in bytes of the output buffered by
+        formats implementing `FormatWriter` before they write it
+
         """
         self.output_format = output_format
         self.csv_data = csv_data
         self.pretty = pretty
+        self.append = append
+        self.extend = extend
+        self.compress = compress
+        self.buffer_size = buffer_size
         log.setLevel(getattr(logging, loglevel.upper()))
         if output_name is None:
             self.output_name = os.path.join(os.getcwd(), 'output.{}'.format(self.output_format))
         else:
             self.output_name = os.path.join(os.getcwd(), '{}.{}'.format(output_name, self.output_format))
+        if compress is not None:
+            from converttool.compression import EXTENSIONS
+            self.output_name += EXTENSIONS[compress]
 
     def convert_data(self):
         """Method to convert data to the given format
@@ -76,74 +203,603 @@ class Format:
         This method delegates the task of converting the data to the 
         class implementing the format in which the data is to be 
         converted. 
-        
+
         Any API that uses `Format` need not worry about the implementing
         classes, rather just uses `Format.convert_data()`. `Format` takes
         care of delegating the conversion to the right class.
-        
+
+        """
+        self.find_format_class()
+        log.debug('Delegating to {}'.format(self.format_class))
+        kwargs = {'compress': self.compress} if self.compress is not None else {}
+        if hasattr(self.format_class, 'write_batch'):
+            kwargs['buffer_size'] = self.buffer_size
+        if self.extend:
+            kwargs.pop('compress', None)
+            self.format_class.extend_data(self.output_name, self.csv_data, self.pretty, **kwargs)
+        elif self.append:
+            self.format_class.convert_data(self.output_name, self.csv_data, self.pretty, append=True, **kwargs)
+        else:
+            self.format_class.convert_data(self.output_name, self.csv_data, self.pretty, **kwargs)
+
+    def find_format_class(self):
+        """Method to find the class implementing the format
+
+        :rtype: class the conversion is delegated to
+        :raises: FormatterNotFound if there is no such class, 
+        ConversionError if the class can not append to, extend or 
+        compress the output, CompressionNotSupported if the compression
+        can not be written
+
         """
         log.info('Finding the class to delegate')
+        self.formatter = 'Format{}'.format(self.output_format.upper())
+        self.format_class = load_format_class(self.output_format)
+        if self.append and not getattr(self.format_class, 'appendable', False):
+            raise ConversionError("{} format can not be appended to".format(self.output_format))
+        if self.extend and not getattr(self.format_class, 'extendable', False):
+            raise ConversionError("{} format can not be extended".format(self.output_format))
+        if self.compress is not None and (self.extend or not hasattr(self.format_class, 'write_batch')):
+            raise ConversionError("{} format can not be {}compressed".format(self.output_format, 'extended once ' if self.extend else ''))
+        if self.compress is not None:
+            # Checked before the output is opened, which would truncate it
+            from converttool.compression import check_compression
+            check_compression(self.compress)
+        return self.format_class
+
+    def __repr__(self):
+        return 'Formatter: {}'.format(self.output_format)
+
+    def __str__(self):  
+        return 'Formatter: {}'.format(self.output_format)
+
+# Characters escaped in xml text and attribute values
+XML_SPECIAL = re.compile(u'[&<">]')
+
+def _escape_xml(text):
+    """Escape text and attribute values the same way as `minidom`"""
+    if XML_SPECIAL.search(text) is None:
+        return text
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;').replace('>', '&gt;')
+
+def _is_xml_name(name):
+    """Check that name is a valid xml element name"""
+    from xml.parsers import expat
+    parser = expat.ParserCreate(namespace_separator=' ')
+    try:
+        parser.Parse(u'<{0}/>'.format(name).encode('utf-8'), True)
+        return True
+    except expat.ExpatError:
+        return False
+
+def _is_document(output_name, document):
+    """Check that a file holds exactly the given document"""
+    document = document.encode('utf-8')
+    with open(output_name, 'rb') as f:
+        return f.read(len(document) + 1) == document
+
+class FormatWriter:
+    """Base class of the formats writing the rows as a stream of batches
+
+    A writer is created for every output, and writes it in a sink, a
+    file object open in binary mode:
+        * `open(sink)` starts the output
+        * `write_batch(rows)` writes a list of rows. It is called for
+          every batch of rows, in order
+        * `close()` ends the output. The sink is closed by its owner
+
+    Writers implement `encode_batch(rows)`, returning the rows encoded
+    as unicode, and may override `write_items(items)` to write the
+    encoded rows inside an envelope. Every batch is encoded to utf-8
+    at once, and kept in a buffer written into the sink once it holds
+    `buffer_size` bytes.
+
+    The capabilities of a format are class attributes of its writer:
+        * `appendable`: Outputs can be concatenated, `--append` writes
+          a new output at the end of the file
+        * `splittable`: Rows are encoded without the envelope, so that
+          the batches can be encoded in other processes, with
+          `encode_batch(rows)`, and merged by `write_items(items)` in
+          order
+        * `extendable`: Rows can be added to a complete output. Its
+          end, `get_end()`, is cut off and the writer goes on after
+          `resume(sink)` instead of `open(sink)`
+        * `batch_size`: Number of rows in the batches
+    """
+
+    appendable = False
+
+    splittable = False
+
+    extendable = False
+
+    batch_size = BATCH_SIZE
+
+    def __init__(self, pretty=False, buffer_size=BUFFER_SIZE):
+        """Method to initialize `FormatWriter`
+
+        :param bool pretty: A boolean flag to specify pretty printing
+        :param int buffer_size: Size in bytes of the output buffered
+        before it is written into the sink
+
+        """
+        self.pretty = pretty
+        self.buffer_size = buffer_size
+        self.sink = None
+        self.buffer = []
+        self.buffered = 0
+
+    def open(self, sink):
+        """Method to start writing an output
+
+        :param sink: File object open in binary mode
+
+        """
+        self.sink = sink
+
+    def resume(self, sink):
+        """Method to go on writing an output whose end was cut off
+
+        :param sink: File object open in binary mode, at the end of the
+        rows of the output
+
+        """
+        self.sink = sink
+
+    def write_batch(self, rows):
+        """Method to write a batch of rows
+
+        :param list rows: Dictionaries of the rows
+
+        """
+        self.write_items(self.encode_batch(rows))
+
+    def encode_batch(self, rows):
+        """Method to encode a batch of rows
+
+        :param list rows: Dictionaries of the rows
+        :rtype: list of the encoded rows
+
+        """
+        raise NotImplementedError
+
+    def write_items(self, items):
+        """Method to write encoded rows
+
+        :param list items: Rows encoded by `encode_batch`
+
+        """
+        self.write(u''.join(items))
+
+    def write(self, text):
+        """Method to write text, encoded in utf-8, through the buffer"""
+        data = text.encode('utf-8')
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Method to write the buffer into the sink in a single call"""
+        if self.buffer:
+            self.sink.write(b''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        """Method to end the output, writers ending it write before"""
+        self.flush()
+
+    def get_end(self):
+        """Method to return the text ending an output with rows"""
+        return u''
+
+    @classmethod
+    @contextmanager
+    def open_output(cls, output_name, mode='wb', compress=None):
+        """Method to open the file of an output as a sink
+
+        :param str output_name: Name of the output file
+        :param str mode: Mode of the file, binary
+        :param str compress: `gzip`, `bz2` or `xz` to compress what is
+        written into the file in other threads, see `CompressedSink`
+        :raises: ConversionError if the output can not be written
+
+        """
         try:
-            self.formatter = 'Format{}'.format(self.output_format.upper())
-            self.format_class = globals()[self.formatter]
-            log.debug('Delegating to {}'.format(self.format_class))
-            self.format_class.convert_data(self.output_name, self.csv_data, self.pretty)
-        except KeyError:
-            log.debug('Delgation class not found')
-            raise FormatterNotFound("{} format is not supported yet".format(self.output_format))
-
-class FormatJSON:
+            with open(output_name, mode) as f:
+                if compress is None:
+                    yield f
+                else:
+                    from converttool.compression import CompressedSink
+                    with CompressedSink(f, compress) as sink:
+                        yield sink
+        except Error:
+            raise
+        except Exception as e:
+            log.debug('There was an error in writing {}: {}'.format(output_name, e))
+            raise ConversionError("There was an error converting to {}".format(cls.__name__.replace('Format', '', 1)))
+
+    @classmethod
+    def convert_data(cls, output_name, data, pretty, append=False, compress=None, buffer_size=BUFFER_SIZE):
+        """Method to write the rows into an output, batch by batch
+
+        :param str output_name: Name of the output file
+        :param iterable data: List or iterator of dictionaries
+        :param bool pretty: A boolean flag to specify pretty printing
+        :param bool append: A boolean to append to an existing file.
+        Compressed outputs are appended as another compressed stream
+        :param str compress: Compression of the output, None by default
+        :param int buffer_size: Size in bytes of the output buffered
+        before it is written
+
+        """
+        log.info('Converting to {}'.format(cls.__name__))
+        with cls.open_output(output_name, 'ab' if append else 'wb', compress) as sink:
+            writer = cls(pretty, buffer_size)
+            writer.open(sink)
+            for batch in iter_batches(data, writer.batch_size):
+                writer.write_batch(batch)
+            writer.close()
+
+    @classmethod
+    def extend_data(cls, output_name, data, pretty, buffer_size=BUFFER_SIZE):
+        """Method to add rows at the end of an existing output
+
+        Only the end of the output is rewritten. An empty output is
+        written again.
+
+        :param str output_name: Name of the output file
+        :param iterable data: List or iterator of dictionaries
+        :param bool pretty: A boolean flag to specify pretty printing,
+        as the output was written
+        :param int buffer_size: Size in bytes of the output buffered
+        before it is written
+        :raises: ConversionError if the output does not end like an
+        output of the format
+
+        """
+        log.info('Extending {}'.format(cls.__name__))
+        if _is_document(output_name, cls.dumps([], pretty)):
+            return cls.convert_data(output_name, data, pretty, buffer_size=buffer_size)
+        writer = cls(pretty, buffer_size)
+        end = writer.get_end().encode('utf-8')
+        with cls.open_output(output_name, 'r+b') as sink:
+            sink.seek(0, os.SEEK_END)
+            size = sink.tell()
+            sink.seek(max(size - len(end), 0))
+            if sink.read() != end:
+                raise ConversionError("{} does not end like a document it can be extended".format(output_name))
+            sink.seek(size - len(end))
+            sink.truncate()
+            writer.resume(sink)
+            for batch in iter_batches(data, writer.batch_size):
+                writer.write_batch(batch)
+            writer.close()
+
+    @classmethod
+    def dumps(cls, data, pretty=False):
+        """Method to return the output of the rows as unicode
+
+        :param iterable data: List or iterator of dictionaries
+        :param bool pretty: A boolean flag to specify pretty printing
+        :rtype: unicode
+
+        """
+        sink = StringIO()
+        writer = cls(pretty)
+        writer.open(sink)
+        for batch in iter_batches(data, writer.batch_size):
+            writer.write_batch(batch)
+        writer.close()
+        return sink.getvalue().decode('utf-8')
+
+class JSONTemplates:
+    """Class to encode rows as json objects, with a template per header
+
+    The keys of a header are encoded once, into a template the encoded
+    values of its rows are put in. Rows holding other values than
+    strings are encoded by the `json` encoder. Both are identical.
+
+    """
+
+    def __init__(self, pretty=False):
+        """Method to initialize `JSONTemplates`
+
+        :param bool pretty: A boolean flag to specify pretty printing,
+        the objects being indented as elements of an array
+
+        """
+        import simplejson as json
+        from simplejson.encoder import encode_basestring
+        self.pretty = pretty
+        self.encoder = json.JSONEncoder(indent=4 if pretty else None, ensure_ascii=False)
+        self.encode_string = encode_basestring
+        self.templates = {}
+
+    def get_template(self, keys):
+        """Method to return the template of the rows of a header
+
+        :param tuple keys: Keys of the rows, in the order of their values
+        :rtype: unicode template, None if the keys are not all strings
+
+        """
+        if not keys or not all(isinstance(key, basestring) for key in keys):
+            return None
+        fields = [self.encode_string(key).replace(u'%', u'%%') + u': %s' for key in keys]
+        if self.pretty:
+            return u'{\n        ' + u',\n        '.join(fields) + u'\n    }'
+        return u'{' + u', '.join(fields) + u'}'
+
+    def encode(self, rows):
+        """Method to encode rows
+
+        :param list rows: Dictionaries of the rows
+        :rtype: list of the encoded rows
+
+        """
+        encode_string, templates = self.encode_string, self.templates
+        items = []
+        for row in rows:
+            keys = tuple(row)
+            try:
+                template = templates[keys]
+            except KeyError:
+                template = templates[keys] = self.get_template(keys)
+            if template is not None:
+                try:
+                    items.append(template % tuple(map(encode_string, row.values())))
+                    continue
+                except TypeError:
+                    # Values that are not strings
+                    pass
+            item = self.encoder.encode(row)
+            if self.pretty:
+                # Strings never contain a raw newline once encoded, every
+                # newline is an indentation that is nested one level deeper
+                item = item.replace('\n', '\n    ')
+            items.append(item)
+        return items
+
+class FormatJSON(FormatWriter):
     """Class that converts the data into json
-    
+
     Implementing Class. API should not use this class directly, but
     rather use `Format` with the `output_format` parameter set to 
     `json`
-    
+
+    The rows are encoded one at a time, and the output is identical to
+    the output of `json.dump` on the list of rows.
+
     """
 
     log = logging.getLogger('converttool.FormatJSON')
-    
-    @classmethod
-    def convert_data(cls, output_name, data, pretty):
-        log.info('Converting to json')
-        try:
-            with codecs.open(output_name, 'w', encoding='utf-8') as f:
-                if pretty:
-                    json.dump(data, f, indent=4, ensure_ascii=False)
-                else:
-                    json.dump(data, f, ensure_ascii=False)
-        except Exception as e:
-            log.debug('There was an error in dumping to json')
-            raise ConversionError("There was an error converting to JSON")
 
-class FormatXML:
+    splittable = True
+
+    extendable = True
+
+    def __init__(self, pretty=False, buffer_size=BUFFER_SIZE):
+        FormatWriter.__init__(self, pretty, buffer_size)
+        self.templates = JSONTemplates(pretty)
+        if pretty:
+            self.start, self.separator, self.end = u'[\n    ', u',\n    ', u'\n]'
+        else:
+            self.start, self.separator, self.end = u'[', u', ', u']'
+        self.prefix = self.start
+
+    def resume(self, sink):
+        FormatWriter.resume(self, sink)
+        self.prefix = self.separator
+
+    def encode_batch(self, rows):
+        """Method to encode every row as an element of the json array"""
+        return self.templates.encode(rows)
+
+    def write_items(self, items):
+        """Method to write the encoded rows into the json array"""
+        if items:
+            self.write(self.prefix + self.separator.join(items))
+            self.prefix = self.separator
+
+    def close(self):
+        self.write(self.end if self.prefix is self.separator else u'[]')
+        FormatWriter.close(self)
+
+    def get_end(self):
+        return self.end
+
+class FormatJSONL(FormatWriter):
+    """Class that converts the data into json lines
+
+    Implementing Class. API should not use this class directly, but
+    rather use `Format` with the `output_format` parameter set to 
+    `jsonl`
+
+    Every row is written as a json object on its own line, so the
+    output can be split and loaded in parallel, and extended by
+    appending new rows to it. Pretty printing does not apply.
+
+    """
+
+    log = logging.getLogger('converttool.FormatJSONL')
+
+    appendable = True
+
+    splittable = True
+
+    extendable = True
+
+    def __init__(self, pretty=False, buffer_size=BUFFER_SIZE):
+        FormatWriter.__init__(self, pretty, buffer_size)
+        self.templates = JSONTemplates()
+
+    def encode_batch(self, rows):
+        """Method to encode every row as a line"""
+        return [item + u'\n' for item in self.templates.encode(rows)]
+
+class FormatXML(FormatWriter):
     """Class that converts the data into xml
-    
+
     Implementing Class. API should not use this class directly, but
     rather use `Format` with the `output_format` parameter set to 
     `xml`
-    
+
+    The document has the `root`/`item` structure of `dicttoxml`, and is
+    identical to the output of `dicttoxml` serialized with `minidom`,
+    without building either document in memory. Pretty printing
+    indents with tabs.
+
     """
 
     log = logging.getLogger('converttool.FormatXML')
 
+    splittable = True
+
+    extendable = True
+
+    def __init__(self, pretty=False, buffer_size=BUFFER_SIZE):
+        FormatWriter.__init__(self, pretty, buffer_size)
+        self.newline = u'\n' if pretty else u''
+        self.indent = u'\t' if pretty else u''
+        self.header = u'<?xml version="1.0" ?>' + self.newline
+        # Element names of the keys of the rows
+        self.names = {}
+        # Serialized elements of the keys, by header
+        self.templates = {}
+
+    def resume(self, sink):
+        FormatWriter.resume(self, sink)
+        self.header = None
+
+    def get_template(self, keys):
+        """Method to serialize the elements of the keys of a header once
+
+        :param tuple keys: Keys of the rows, in the order of their values
+        :rtype: list of tuples of the start of the element up to its
+        type, the start and the end of an element of a string, and an
+        empty element of a string, for every key
+
+        """
+        template = []
+        for key in keys:
+            if key not in self.names:
+                self.names[key] = self.element_name(key)
+            tag, attrs = self.names[key]
+            start = u'{0}<{1}{2} type="'.format(self.indent * 2, tag, attrs)
+            end = u'</{0}>{1}'.format(tag, self.newline)
+            template.append((start, start + u'str">', end, start + u'str"/>' + self.newline))
+        return template
+
+    def encode_batch(self, rows):
+        """Method to serialize every row as an `item` element"""
+        newline, templates = self.newline, self.templates
+        head = u'{0}<item type="dict">{1}'.format(self.indent, newline)
+        tail = u'{0}</item>{1}'.format(self.indent, newline)
+        items = []
+        for row in rows:
+            keys = tuple(row)
+            try:
+                template = templates[keys]
+            except KeyError:
+                template = templates[keys] = self.get_template(keys)
+            chunk = [head]
+            for (start, string, end, empty), value in itertools.izip(template, row.values()):
+                if type(value) is unicode:
+                    chunk.append(string + _escape_xml(value) + end if value else empty)
+                    continue
+                chunk.append(self.encode_element(start, end, value, 2))
+            chunk.append(tail)
+            items.append(u''.join(chunk))
+        return items
+
+    def encode_element(self, start, end, value, depth):
+        """Method to serialize the element of a value that is not a string
+
+        Lists, like the values of rows longer than the header, hold an
+        `item` element for every value, as in `dicttoxml`.
+
+        :param str start: Start of the element up to its type
+        :param str end: End of the element
+        :param value: Value of the element
+        :param int depth: Depth of the element in the document
+        :rtype: str
+
+        """
+        if isinstance(value, (list, tuple)):
+            if not value:
+                return u'{0}list"/>{1}'.format(start, self.newline)
+            item_start = u'{0}<item type="'.format(self.indent * (depth + 1))
+            item_end = u'</item>' + self.newline
+            items = [self.encode_element(item_start, item_end, item, depth + 1) for item in value]
+            return u'{0}list">{1}{2}{3}{4}'.format(start, self.newline, u''.join(items), self.indent * depth, end)
+        xml_type, text = self.element_value(value)
+        if text:
+            return u'{0}{1}">{2}{3}'.format(start, xml_type, _escape_xml(text), end)
+        return u'{0}{1}"/>{2}'.format(start, xml_type, self.newline)
+
+    def write_items(self, items):
+        """Method to write the serialized rows into the `root` element"""
+        if not items:
+            return
+        if self.header is not None:
+            items = [self.header, u'<root>', self.newline] + items
+            self.header = None
+        self.write(u''.join(items))
+
+    def close(self):
+        if self.header is not None:
+            self.write(self.header + u'<root/>' + self.newline)
+        else:
+            self.write(self.get_end())
+        FormatWriter.close(self)
+
+    def get_end(self):
+        return u'</root>' + self.newline
+
     @classmethod
-    def convert_data(cls, output_name, data, pretty):
-        log.info('Converting to XML')
-        xml = dicttoxml(data)
-        dom = parseString(xml)
-        try:
-            with codecs.open(output_name, 'w', encoding='utf8') as f:
-                if pretty:
-                    f.write(dom.toprettyxml())
-                else:
-                    f.write(dom.toxml())
-        except Exception:
-            log.debug('There was an error in dumping to xml')
-            raise ConversionError("There was an error converting to XML")
+    def element_name(cls, key):
+        """Method to turn a key into a valid element name
 
-    def __repr__(self):
-        return 'Formatter: {}'.format(self.output_format)
+        Follows the rules of `dicttoxml`: numeric keys are prefixed with
+        `n`, spaces are replaced by underscores and keys that are still 
+        invalid are moved into the `name` attribute of a `key` element.
 
-    def __str__(self):  
-        return 'Formatter: {}'.format(self.output_format)
\ No newline at end of file
+        :param str key: Key of the row, `None` for the values of rows
+        longer than the header
+        :rtype: tuple of the element name and its extra attributes
+
+        """
+        if isinstance(key, str):
+            key = key.decode('utf-8')
+        elif not isinstance(key, unicode):
+            key = unicode(key)
+        if _is_xml_name(key):
+            return key, ''
+        if key.isdigit():
+            return u'n' + key, ''
+        if _is_xml_name(key.replace(' ', '_')):
+            return key.replace(' ', '_'), ''
+        return u'key', u' name="{0}"'.format(_escape_xml(key))
+
+    @classmethod
+    def element_value(cls, value):
+        """Method to return the `type` attribute and text of a value
+
+        :param value: Value of the row
+        :rtype: tuple of the type and the text of the element
+
+        """
+        if value is None:
+            return 'null', u''
+        if isinstance(value, str):
+            return 'str', value.decode('utf-8')
+        if isinstance(value, unicode):
+            return 'str', value
+        if isinstance(value, bool):
+            return 'bool', unicode(value)
+        if isinstance(value, (int, long)):
+            return 'int', unicode(value)
+        if isinstance(value, float):
+            return 'float', unicode(value)
+        raise TypeError('Unsupported data type: {}'.format(type(value).__name__))
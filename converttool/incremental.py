@@ -0,0 +1,161 @@
+from converttool import *
+import hashlib
+import tempfile
+import simplejson as json
+
+log = logging.getLogger('converttool.Checkpoint')
+
+# Bump whenever the checkpoints or the outputs change, so the outputs of
+# an older converttool are rebuilt
+CHECKPOINT_VERSION = 1
+# Number of bytes hashed at once
+HASH_BLOCK = 1 << 20
+
+def hash_prefix(csv_file, offset):
+    """Return the hash of the first bytes of a file
+
+    :param str csv_file: Name of the file
+    :param int offset: Number of bytes to hash
+    :rtype: str hexadecimal sha1 of the bytes
+
+    """
+    return PrefixHash(csv_file).hexdigest(offset)
+
+class PrefixHash:
+    """Class to hash the first bytes of a file, up to growing offsets
+
+    The sha1 is kept, and only updated with the bytes following the
+    last offset hashed, so the checkpoints of every output, and the
+    offsets they are moved to once the rows added are converted, are
+    hashed in a single pass over the file. The hashes of the offsets
+    are kept, an offset before the last one hashed is hashed again from
+    the start of the file.
+
+    """
+
+    def __init__(self, csv_file):
+        """Method to initialize `PrefixHash`
+
+        :param str csv_file: Name of the file
+
+        """
+        self.csv_file = csv_file
+        self.digest = hashlib.sha1()
+        self.position = 0
+        self.digests = {}
+
+    def hexdigest(self, offset):
+        """Method to return the hash of the bytes of the file before an offset
+
+        :param int offset: Number of bytes to hash
+        :rtype: str hexadecimal sha1 of the bytes
+
+        """
+        if offset not in self.digests:
+            if offset < self.position:
+                self.digest = hashlib.sha1()
+                self.position = 0
+            with open(self.csv_file, 'rb') as f:
+                f.seek(self.position)
+                while self.position < offset:
+                    block = f.read(min(offset - self.position, HASH_BLOCK))
+                    if not block:
+                        break
+                    self.digest.update(block)
+                    self.position += len(block)
+            self.digests[offset] = self.digest.hexdigest()
+        return self.digests[offset]
+
+def hash_options(*options):
+    """Return the hash of the options changing an output"""
+    return hashlib.sha1(json.dumps([CHECKPOINT_VERSION] + list(options), sort_keys=True)).hexdigest()
+
+class Checkpoint:
+    """Class to remember how much of a csv an output was converted from
+
+    The checkpoint of an output is kept next to it, in
+    `<output>.checkpoint`. It holds the offset of the end of the last
+    row converted, the number of rows in the output, the hashes of the
+    header, of the bytes before the offset and of the options, and the
+    size of the output when it was written. An output can only be
+    extended when all of them still match.
+
+    """
+
+    def __init__(self, offset=0, rows=0, header=None, prefix=None, options=None, output_size=0):
+        """Method to initialize `Checkpoint`
+
+        :param int offset: Offset of the end of the last row converted
+        :param int rows: Number of rows in the output
+        :param str header: Hash of the header of the csv
+        :param str prefix: Hash of the bytes of the csv before the offset
+        :param str options: Hash of the options changing the output
+        :param int output_size: Size of the output in bytes
+
+        """
+        self.offset = offset
+        self.rows = rows
+        self.header = header
+        self.prefix = prefix
+        self.options = options
+        self.output_size = output_size
+
+    @classmethod
+    def get_name(cls, output_name):
+        """Method to return the name of the checkpoint of an output"""
+        return '{}.checkpoint'.format(output_name)
+
+    @classmethod
+    def load(cls, output_name):
+        """Method to load the checkpoint of an output
+
+        :param str output_name: Name of the output file
+        :rtype: Checkpoint, None if there is none
+
+        """
+        try:
+            with open(cls.get_name(output_name)) as f:
+                return cls(**json.load(f))
+        except (IOError, ValueError, TypeError):
+            return None
+
+    def save(self, output_name):
+        """Method to write the checkpoint next to the output, atomically"""
+        name = self.get_name(output_name)
+        f = tempfile.NamedTemporaryFile(dir=os.path.dirname(name), suffix='.tmp', delete=False)
+        with f:
+            json.dump(self.__dict__, f)
+        os.rename(f.name, name)
+
+    def matches(self, csv_file, output_name, header, options, prefix=None):
+        """Method to check that an output can be extended from the checkpoint
+
+        :param str csv_file: Name of the csv file
+        :param str output_name: Name of the output file
+        :param str header: Hash of the header of the csv
+        :param str options: Hash of the options changing the output
+        :param PrefixHash prefix: Hash of the csv shared by the
+        checkpoints of the outputs, a new one by default
+        :rtype: bool
+
+        """
+        if options != self.options:
+            log.debug("Options of {} changed, rebuilding it".format(output_name))
+            return False
+        if header != self.header:
+            log.debug("Header of {} changed, rebuilding {}".format(csv_file, output_name))
+            return False
+        try:
+            output_size = os.path.getsize(output_name)
+            csv_size = os.path.getsize(csv_file)
+        except OSError:
+            return False
+        if output_size != self.output_size:
+            log.debug("{} changed since it was converted, rebuilding it".format(output_name))
+            return False
+        if prefix is None:
+            prefix = PrefixHash(csv_file)
+        if csv_size < self.offset or prefix.hexdigest(self.offset) != self.prefix:
+            log.debug("Rows of {} converted before changed, rebuilding {}".format(csv_file, output_name))
+            return False
+        return True
@@ -0,0 +1,169 @@
+from converttool import *
+from contextlib import contextmanager
+import resource
+import time
+
+log = logging.getLogger('converttool.Metrics')
+
+class Stage(object):
+    """Measures of a stage of the conversion
+
+    Times are exclusive: the time a stage spends waiting for the rows
+    of the stage before it is not counted. Rows are the items the stage
+    produced, lines for the reading of the file. Peak memory is the peak
+    resident memory of the process when the stage last finished.
+
+    """
+
+    __slots__ = ('name', 'wall', 'cpu', 'rows', 'bytes_in', 'bytes_out', 'peak_memory')
+
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rows = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.peak_memory = 0
+
+    def as_dict(self):
+        """Method to return the measures of the stage as a dictionary"""
+        measures = dict((name, getattr(self, name)) for name in self.__slots__)
+        measures['rows_per_sec'] = self.rows / self.wall if self.wall else None
+        return measures
+
+class TimedIterator(object):
+    """Iterator timing the production of every row of a stage
+
+    The times are inclusive of the stages before it, and the times of
+    the `source` stage of the same run are subtracted when the
+    iteration ends.
+
+    """
+
+    __slots__ = ('metrics', 'name', 'iterator', 'source', 'wall', 'cpu', 'rows', 'done')
+
+    def __init__(self, metrics, name, iterable, source=None):
+        self.metrics = metrics
+        self.name = name
+        self.iterator = iter(iterable)
+        self.source = source
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rows = 0
+        self.done = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        wall, cpu = time.time(), time.clock()
+        try:
+            row = next(self.iterator)
+        except StopIteration:
+            self.wall += time.time() - wall
+            self.cpu += time.clock() - cpu
+            self.finish()
+            raise
+        self.wall += time.time() - wall
+        self.cpu += time.clock() - cpu
+        self.rows += 1
+        return row
+
+    def finish(self):
+        """Method to add the measures of the run to its stage"""
+        if not self.done:
+            self.done = True
+            self.metrics.add(self.name, self.wall, self.cpu, self.rows, self.source)
+
+class Metrics:
+    """Class to collect the measures of every stage of a conversion
+
+    Stages are the reading of the csv, its decoding, the validation, the
+    sort and every formatter. A stage that runs several times, like the
+    reading of the csv for every format, adds up its measures.
+
+    """
+
+    def __init__(self, stages=()):
+        """Method to initialize `Metrics`
+
+        :param iterable stages: Names of the stages known beforehand, 
+        in the order they are reported. Other stages are reported after 
+        them, in the order they start
+
+        """
+        self.stages = [Stage(name) for name in stages]
+        self.runs = {}
+
+    def stage(self, name):
+        """Method to return the measures of a stage, creating it if needed"""
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        stage = Stage(name)
+        self.stages.append(stage)
+        return stage
+
+    def iterate(self, name, rows, source=None):
+        """Method to time a stage that produces rows
+
+        :param str name: Name of the stage
+        :param iterable rows: Rows produced by the stage
+        :param str source: Name of the stage the rows are read from
+        :rtype: iterator of the rows
+
+        """
+        run = self.runs[name] = TimedIterator(self, name, rows, source)
+        self.stage(name)
+        return run
+
+    @contextmanager
+    def measure(self, name, source=None):
+        """Context manager to time a stage that consumes rows
+
+        :param str name: Name of the stage
+        :param str source: Name of the stage the rows are read from
+        :rtype: Stage
+
+        """
+        stage = self.stage(name)
+        wall, cpu = time.time(), time.clock()
+        try:
+            yield stage
+        finally:
+            wall, cpu = time.time() - wall, time.clock() - cpu
+            upstream = self.runs.get(source)
+            if upstream is not None:
+                # Rows left unread when the stage ended
+                upstream.finish()
+                stage.rows += upstream.rows
+            self.add(name, wall, cpu, 0, source)
+
+    def add(self, name, wall, cpu, rows, source=None):
+        """Method to add the measures of a run to a stage"""
+        upstream = self.runs.get(source)
+        if upstream is not None:
+            wall -= upstream.wall
+            cpu -= upstream.cpu
+        stage = self.stage(name)
+        stage.wall += max(wall, 0.0)
+        stage.cpu += max(cpu, 0.0)
+        stage.rows += rows
+        stage.peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def as_dict(self):
+        """Method to return the measures of every stage, in order"""
+        return {'stages': [stage.as_dict() for stage in self.stages]}
+
+    def format_table(self):
+        """Method to format the measures of every stage as a table"""
+        lines = ['{:<16} {:>10} {:>9} {:>9} {:>11} {:>9} {:>9} {:>9}'.format(
+            'Stage', 'Rows', 'Wall (s)', 'CPU (s)', 'Rows/s', 'MB in', 'MB out', 'Peak MB')]
+        for stage in self.stages:
+            lines.append('{:<16} {:>10} {:>9.3f} {:>9.3f} {:>11.0f} {:>9.2f} {:>9.2f} {:>9.1f}'.format(
+                stage.name, stage.rows, stage.wall, stage.cpu,
+                stage.rows / stage.wall if stage.wall else 0,
+                stage.bytes_in / 1048576.0, stage.bytes_out / 1048576.0,
+                stage.peak_memory / 1048576.0))
+        return '\n'.join(lines)
@@ -0,0 +1,213 @@
+from converttool import *
+from converttool.exceptions import *
+from converttool.constants import READERS
+from cStringIO import StringIO
+import mmap
+import csv
+import re
+
+log = logging.getLogger('converttool.MmapReader')
+
+# Size of the blocks of records parsed at once
+BLOCK_SIZE = 1 << 20
+# A quote only opens a quoted field at the start of the field, the
+# quotes inside unquoted fields are read as they are
+OPENING_QUOTE = re.compile(b'[,\n]"')
+
+def _opening_quote(data, offset, end, record_start=False):
+    """Return the offset of the next quote opening a field, -1 if there is none
+
+    :param bool record_start: True if offset is at the start of a record
+    """
+    if record_start and offset < end and data[offset] == b'"':
+        return offset
+    match = OPENING_QUOTE.search(data, offset, end)
+    return -1 if match is None else match.end() - 1
+
+def _quoted_end(data, quote, end):
+    """Return the offset following the quote closing a quoted field, -1 if it is not closed"""
+    find = data.find
+    offset = find(b'"', quote + 1, end)
+    # Escaped quotes are doubled
+    while offset != -1 and offset + 1 < end and data[offset + 1] == b'"':
+        offset = find(b'"', offset + 2, end)
+    return -1 if offset == -1 else offset + 1
+
+def record_end(data, offset, end, target=None):
+    """Return the end of the first record ending at or after target
+
+    Records are scanned like the csv module reads them: newlines end
+    records outside of quoted fields, and quotes only open a field at
+    its start, so `24" monitor` is an unquoted value. Unquoted parts of
+    the records are skipped up to the next quote opening a field, so
+    the scan only loops over the quoted fields.
+
+    :param data: `str` or `mmap` of the csv
+    :param int offset: Offset of the start of a record
+    :param int end: Offset the record must end before
+    :param int target: Offset the newline ending the record must be at
+    or after, `offset` by default
+    :rtype: int offset following the newline of the record, -1 if the
+    record does not end with a newline before `end`
+
+    """
+    target = offset if target is None else target
+    quote = _opening_quote(data, offset, end, True)
+    while True:
+        if quote == -1 or quote > target:
+            newline = data.find(b'\n', max(offset, target), end if quote == -1 else quote)
+            if newline != -1:
+                return newline + 1
+            if quote == -1:
+                return -1
+        offset = _quoted_end(data, quote, end)
+        if offset == -1:
+            return -1
+        quote = _opening_quote(data, offset, end)
+
+def last_record_end(data, start, end):
+    """Return the end of the last record ending with a newline before end
+
+    :param data: `str` or `mmap` of the csv
+    :param int start: Offset of the start of a record
+    :rtype: int offset following the newline, `start` if there is no
+    complete record
+
+    """
+    last = start
+    offset = start
+    quote = _opening_quote(data, offset, end, True)
+    while True:
+        newline = data.rfind(b'\n', offset, end if quote == -1 else quote)
+        if newline != -1:
+            last = newline + 1
+        if quote == -1:
+            return last
+        offset = _quoted_end(data, quote, end)
+        if offset == -1:
+            return last
+        quote = _opening_quote(data, offset, end)
+
+class MmapReader:
+    """Class to read the rows of a local csv from a memory map
+
+    The file is mapped once, and split into blocks of records with
+    searches in the mapped buffer: a record ends at the first newline
+    outside of quoted fields, see `record_end`. Every block is parsed in
+    a single pass of the csv module, and only the values of the columns
+    read are decoded, so the rows are the same as the rows of
+    `unicodecsv.DictReader` without its per row overhead. Rows are read
+    between byte offsets, so ranges of the file can be read on their own,
+    in other processes.
+
+    """
+
+    def __init__(self, csv_file, fields=None):
+        """Method to initialize `MmapReader`
+
+        :param str csv_file: Name of the csv file
+        :param list fields: Names of the columns of the rows, the other
+        columns are not decoded. All of them by default
+        :raises: CSVNotFound if the file can not be opened
+
+        """
+        try:
+            self.file = open(csv_file, 'rb')
+        except IOError:
+            raise CSVNotFound("{} not found!".format(csv_file))
+        self.size = os.fstat(self.file.fileno()).st_size
+        # Empty files can not be mapped
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else ''
+        self.header_end = record_end(self.map, 0, self.size)
+        if self.header_end == -1:
+            self.header_end = self.size
+        self.positions = None
+        self.fieldnames = next(self.iter_values(self.map[:self.header_end]), [])
+        self.fields = fields
+        if fields is not None:
+            self.positions = [self.fieldnames.index(field) for field in fields]
+        self.offset = self.header_end
+
+    def iter_values(self, data):
+        """Generator to parse the records of a block of the csv
+
+        :param str data: Complete records of the csv
+        :rtype: iterator of lists of values, one for every record
+
+        """
+        positions = self.positions
+        for values in csv.reader(StringIO(data)):
+            if not values:
+                continue
+            if positions is None:
+                yield [value.decode('utf-8') for value in values]
+            else:
+                yield [values[i].decode('utf-8') if i < len(values) else None for i in positions]
+
+    def iter_blocks(self, start, end, complete=False):
+        """Generator to split the csv between two offsets into blocks of records
+
+        A block ends at the first record boundary after `BLOCK_SIZE`
+        bytes, found by scanning the records of the block from its start.
+
+        :rtype: iterator of the offsets following the end of every block
+
+        """
+        offset = start
+        while offset < end:
+            target = offset + BLOCK_SIZE
+            block_end = -1
+            if target < end:
+                block_end = record_end(self.map, offset, end, target)
+            if block_end == -1:
+                block_end = end
+                if complete:
+                    block_end = last_record_end(self.map, offset, end)
+                    if block_end == offset:
+                        return
+            yield block_end
+            offset = block_end
+
+    def iter_rows(self, start=None, end=None, complete=False):
+        """Generator to read the rows of the csv between two offsets
+
+        Offsets must be on record boundaries. `self.offset` follows the
+        last block of records read.
+
+        :param int start: Offset of the first record, the record after
+        the header by default
+        :param int end: Offset following the last record, the end of the
+        file by default
+        :param bool complete: If set, a last record without a newline is
+        not read, as it may still be being written
+        :rtype: iterator of dictionaries, one for every row
+
+        """
+        start = self.header_end if start is None else start
+        end = self.size if end is None else end
+        fieldnames = self.fieldnames if self.fields is None else self.fields
+        width = len(fieldnames)
+        self.offset = offset = start
+        for block_end in self.iter_blocks(start, end, complete):
+            for values in self.iter_values(self.map[offset:block_end]):
+                row = dict(zip(fieldnames, values))
+                if len(values) != width:
+                    if len(values) > width:
+                        row[None] = values[width:]
+                    else:
+                        for field in fieldnames[len(values):]:
+                            row[field] = None
+                yield row
+            self.offset = offset = block_end
+
+    def close(self):
+        """Method to unmap and close the file"""
+        if self.size:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
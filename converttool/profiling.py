@@ -0,0 +1,196 @@
+from converttool import *
+from converttool.constants import PROFILES, PROFILE_TOP
+from contextlib import contextmanager
+from collections import Counter
+from cStringIO import StringIO
+import resource
+import gc
+
+try:
+    import tracemalloc
+except ImportError:
+    # Only python builds patched with pytracemalloc have it on python 2
+    tracemalloc = None
+
+log = logging.getLogger('converttool.Profiler')
+
+class Profiler:
+    """Class to profile every stage of a conversion on its own
+
+    `cpu` runs every stage under cProfile, writes its profile in
+    `<output_name>.<stage>.pstats` and reports its hottest functions.
+    `mem` reports the sites allocating the most memory in every stage
+    with tracemalloc. Where tracemalloc is not available, the growth of
+    the resident memory and of the live objects, by type, is reported
+    instead.
+
+    Only the calling thread is profiled. Formats converted at once by
+    the executors are profiled in their own thread or process, by a
+    profiler each, and formats converted in chunks are profiled from
+    the main process only. Memory reports without tracemalloc are of
+    the whole process, so formats converted in threads share theirs.
+
+    Stages producing rows from the rows of another stage, like the
+    validation, are profiled on their own with `iterate`, the stage
+    pulling their rows being paused while they run. Memory is traced
+    for the whole process, so their memory is reported in the stage
+    pulling their rows.
+
+    """
+
+    def __init__(self, kind, output_name=None, top=PROFILE_TOP):
+        """Method to initialize `Profiler`
+
+        :param str kind: `cpu` or `mem`
+        :param str output_name: Name of the output, the pstats files are
+        named after it
+        :param int top: Number of functions or allocation sites reported
+        for every stage
+        :raises: ValueError if the kind of profile is not supported
+
+        """
+        if kind not in PROFILES:
+            raise ValueError("{} is not a profile, use one of {}".format(kind, ', '.join(PROFILES)))
+        self.kind = kind
+        self.output_name = output_name or 'output'
+        self.top = top
+        self.reports = []
+        # cProfile profiles of the calling thread, the last one running
+        self.active = []
+
+    def get_stats_name(self, stage):
+        """Method to return the name of the pstats file of a stage"""
+        return os.path.join(os.getcwd(), '{}.{}.pstats'.format(self.output_name, stage.replace('|', '-')))
+
+    @contextmanager
+    def profile(self, stage):
+        """Context manager to profile a stage
+
+        :param str stage: Name of the stage, `parse_csv` or a format
+
+        """
+        if self.kind == 'cpu':
+            import cProfile
+            profiler = cProfile.Profile()
+            outer = self.active[-1] if self.active else None
+            self.active.append(profiler)
+            _switch(outer, profiler)
+            try:
+                yield
+            finally:
+                _switch(profiler, outer)
+                self.active.pop()
+                self.reports.append((stage, self.report_cpu(stage, profiler)))
+        elif tracemalloc is not None:
+            tracemalloc.start()
+            try:
+                yield
+            finally:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.reports.append((stage, self.report_tracemalloc(snapshot, peak)))
+        else:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            gc.collect()
+            objects = Counter(type(o).__name__ for o in gc.get_objects())
+            try:
+                yield
+            finally:
+                self.reports.append((stage, self.report_objects(rss, objects)))
+
+    def iterate(self, stage, rows, produce):
+        """Generator to profile a stage producing rows on its own
+
+        A thread only runs one cProfile profile at a time. The profile
+        of the stage pulling the rows is paused while the stage makes
+        its rows, and runs again while the stage reads its own rows, so
+        they are profiled in the stage pulling them. The stage is 
+        reported once all its rows are made. Memory profiles trace the
+        whole process, and the stage is not profiled on its own.
+
+        :param str stage: Name of the stage
+        :param iterable rows: Rows the stage reads
+        :param function produce: Called with the rows to read, returns
+        the rows made by the stage
+        :rtype: iterator of the rows made by the stage
+
+        """
+        if self.kind != 'cpu':
+            for row in produce(rows):
+                yield row
+            return
+        import cProfile
+        profiler = cProfile.Profile()
+        # Profile of the stage pulling the rows, when they are pulled
+        outer = [None]
+
+        def read(rows):
+            iterator = iter(rows)
+            while True:
+                _switch(profiler, outer[0])
+                try:
+                    row = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _switch(outer[0], profiler)
+                yield row
+
+        made = produce(read(rows))
+        try:
+            while True:
+                outer[0] = self.active[-1] if self.active else None
+                _switch(outer[0], profiler)
+                try:
+                    row = next(made)
+                except StopIteration:
+                    break
+                finally:
+                    _switch(profiler, outer[0])
+                yield row
+        finally:
+            self.reports.append((stage, self.report_cpu(stage, profiler)))
+
+    def report_cpu(self, stage, profiler):
+        """Method to write the pstats file of a stage and report its hottest functions"""
+        import pstats
+        name = self.get_stats_name(stage)
+        profiler.dump_stats(name)
+        log.debug("Profile of {} written in {}".format(stage, name))
+        report = StringIO()
+        report.write("Profile written in {}\n".format(name))
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(self.top)
+        return report.getvalue()
+
+    def report_tracemalloc(self, snapshot, peak):
+        """Method to report the sites allocating the most memory"""
+        lines = ["Peak traced memory: {:.1f} KB".format(peak / 1024.0)]
+        for statistic in snapshot.statistics('lineno')[:self.top]:
+            lines.append(str(statistic))
+        return '\n'.join(lines)
+
+    def report_objects(self, rss, objects):
+        """Method to report the growth of the memory and of the live objects"""
+        growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        gc.collect()
+        counts = Counter(type(o).__name__ for o in gc.get_objects())
+        counts.subtract(objects)
+        lines = ["tracemalloc is not available, showing the growth of the peak RSS and of live objects",
+                 "Peak RSS growth: {} KB".format(growth)]
+        for name, count in counts.most_common(self.top):
+            if count <= 0:
+                break
+            lines.append("{:>10} {}".format(count, name))
+        return '\n'.join(lines)
+
+    def format_reports(self):
+        """Method to format the reports of every stage, in order"""
+        return '\n'.join("=== {} ===\n{}".format(stage, report) for stage, report in self.reports)
+
+def _switch(source, target):
+    """Pause the profile `source` and run the profile `target`, either may be None"""
+    if source is not None:
+        source.disable()
+    if target is not None:
+        target.enable()
@@ -0,0 +1,229 @@
+from converttool import *
+from array import array
+from itertools import imap, izip
+
+log = logging.getLogger('converttool.RowTable')
+
+# Number of distinct values of a column after which its values are no
+# longer interned, most of them being unique
+POOL_LIMIT = 1 << 16
+
+def make_row(fieldnames, values, extra=None):
+    """Build the dictionary of a row, as `csv.DictReader` does
+
+    :param list extra: Values of a row longer than the header, kept
+    under the `None` key
+    """
+    row = dict(zip(fieldnames, values))
+    if extra is not None:
+        row[None] = extra
+    return row
+
+class RowView(tuple):
+    """Base class of the rows of a `RowTable`
+
+    A row is a tuple of the values in the order of the header, that
+    also behaves like the dictionary `csv.DictReader` would have built:
+    keys are iterated in the same order, so the formatters write the
+    same output. `RowTable` derives a class for its header.
+
+    """
+
+    __slots__ = ()
+
+    fieldnames = ()
+    positions = {}
+    order = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            try:
+                return tuple.__getitem__(self, self.positions[key])
+            except KeyError:
+                raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        position = self.positions.get(key)
+        return default if position is None else tuple.__getitem__(self, position)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [key for key, position in self.order]
+
+    def values(self):
+        return [tuple.__getitem__(self, position) for key, position in self.order]
+
+    def items(self):
+        return [(key, tuple.__getitem__(self, position)) for key, position in self.order]
+
+    def _asdict(self):
+        return make_row(self.fieldnames, tuple.__iter__(self))
+
+    def __reduce__(self):
+        # Rows are sent to other processes as dictionaries
+        return (make_row, (self.fieldnames, tuple(tuple.__iter__(self))))
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return self._asdict() == other
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self._asdict())
+
+class RowTable:
+    """Class to hold the rows of the csv in memory, column by column
+
+    The header is stored once, and every column is a list of values.
+    Repeated values of a column share a single string, and columns that
+    only hold integers are stored in typed arrays. Rows are handed out
+    as `RowView` tuples, built when they are read. The values of rows
+    longer than the header, that `csv.DictReader` puts under the `None`
+    key, are kept by row apart from the columns, and these rows are
+    handed out as dictionaries.
+
+    """
+
+    def __init__(self, fieldnames, rows=None):
+        """Method to initialize `RowTable`
+
+        :param list fieldnames: Header of the csv
+        :param iterable rows: Dictionaries to add to the table
+
+        """
+        self.fieldnames = tuple(fieldnames)
+        positions = dict((field, i) for i, field in enumerate(self.fieldnames))
+        # Keys of a dictionary built from the header come in this order
+        order = tuple((key, positions[key]) for key in make_row(self.fieldnames, self.fieldnames))
+        self.row_class = type('Row', (RowView,), {'__slots__': (), 'fieldnames': self.fieldnames, 'positions': positions, 'order': order})
+        self.columns = [array('l') for _ in self.fieldnames]
+        self.typed = [True for _ in self.fieldnames]
+        self.pools = [{} for _ in self.fieldnames]
+        # Values beyond the header, by row
+        self.extra = {}
+        self.length = 0
+        if rows is not None:
+            self.extend(rows)
+
+    def append(self, row):
+        """Method to add a row at the end of the table
+
+        :param dict row: Values of the row by field
+
+        """
+        for i, field in enumerate(self.fieldnames):
+            value = row.get(field)
+            column = self.columns[i]
+            if self.typed[i]:
+                try:
+                    number = int(value)
+                    if unicode(number) == value:
+                        column.append(number)
+                        continue
+                except (TypeError, ValueError, OverflowError):
+                    pass
+                column = self.columns[i] = self.untype(i)
+            pool = self.pools[i]
+            # Numbers converted to their types are not pooled, 1 and 1.0
+            # would share a value
+            if pool is not None and isinstance(value, basestring):
+                value = pool.setdefault(value, value)
+                if len(pool) > POOL_LIMIT:
+                    self.pools[i] = None
+            column.append(value)
+        extra = row.get(None)
+        if extra is not None:
+            self.extra[self.length] = extra
+        self.length += 1
+
+    def extend(self, rows):
+        """Method to add rows at the end of the table"""
+        for row in rows:
+            self.append(row)
+
+    def untype(self, i):
+        """Method to turn a typed column back into a list of strings"""
+        log.debug("Column {} is not an integer column".format(self.fieldnames[i]))
+        self.typed[i] = False
+        pool = self.pools[i]
+        return [pool.setdefault(value, value) for value in imap(unicode, self.columns[i])]
+
+    def column(self, field):
+        """Method to return the values of a column as they were read
+
+        :param str field: Name of the column
+        :rtype: iterator of the values
+
+        """
+        i = self.fieldnames.index(field)
+        if self.typed[i]:
+            return imap(unicode, self.columns[i])
+        return iter(self.columns[i])
+
+    def sort(self, key=None, field=None, reverse=False):
+        """Method to sort the rows of the table in place
+
+        Only the keys of the column are compared, and every column is
+        then reordered once.
+
+        :param function key: Function of the value giving the sort key
+        :param str field: Name of the column to sort on
+        :param bool reverse: Sort in descending order
+
+        """
+        i = self.fieldnames.index(field)
+        values = self.columns[i]
+        if not self.typed[i] and key is not None:
+            values = map(key, values)
+        elif self.typed[i] and key is not None:
+            values = map(key, imap(unicode, values))
+        permutation = sorted(xrange(self.length), key=values.__getitem__, reverse=reverse)
+        for i, column in enumerate(self.columns):
+            if self.typed[i]:
+                self.columns[i] = array(column.typecode, (column[j] for j in permutation))
+            else:
+                self.columns[i] = [column[j] for j in permutation]
+        if self.extra:
+            extra = self.extra
+            self.extra = dict((i, extra[j]) for i, j in enumerate(permutation) if j in extra)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        values = [unicode(column[index]) if typed else column[index]
+                for column, typed in zip(self.columns, self.typed)]
+        if index in self.extra:
+            return make_row(self.fieldnames, values, self.extra[index])
+        return self.row_class(values)
+
+    def __iter__(self):
+        row_class = self.row_class
+        columns = [imap(unicode, column) if typed else column
+                for column, typed in zip(self.columns, self.typed)]
+        if not self.extra:
+            for values in izip(*columns):
+                yield row_class(values)
+            return
+        extra = self.extra
+        for index, values in enumerate(izip(*columns)):
+            if index in extra:
+                yield make_row(self.fieldnames, values, extra[index])
+            else:
+                yield row_class(values)
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return '<ROWTABLE>:<{}>:<{}>'.format('|'.join(self.fieldnames), self.length)
@@ -0,0 +1,422 @@
+from converttool import *
+from converttool.exceptions import *
+from converttool.app import main
+from converttool.validate import Validate
+from converttool.formats import FORMATS, load_entry_points, load_format_class
+from converttool.client import SOCKET_PATH, TOKEN_HEADER, token_path
+# The command line imports the conversion code lazily, the workers
+# forked by the service have it imported already
+from converttool.converter import Converter
+from converttool.batch import Batch
+import cerberus
+from cStringIO import StringIO
+import BaseHTTPServer
+import SocketServer
+import multiprocessing
+import threading
+import Queue
+import traceback
+import binascii
+import errno
+import hmac
+import socket
+import signal
+import sys
+import click
+import simplejson as json
+
+log = logging.getLogger('converttool.Service')
+
+# Host the service listens on when it is given a port instead of a
+# unix socket
+SERVICE_HOST = '127.0.0.1'
+# Number of jobs waiting for a worker beyond which new jobs are refused
+QUEUE_SIZE = 16
+# Seconds between two checks that the worker running a job is alive
+WATCH_INTERVAL = 1.0
+
+def _make_dir(name):
+    """Create a directory only the user can read, if it does not exist"""
+    try:
+        os.makedirs(name, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+def _remove(name):
+    """Remove a file, if it still exists"""
+    try:
+        os.remove(name)
+    except OSError:
+        pass
+
+def write_token(name):
+    """Write a new random token in a file only the user can read
+
+    :param str name: Name of the file, replaced if it exists
+    :rtype: str token
+
+    """
+    token = binascii.hexlify(os.urandom(16))
+    _remove(name)
+    # The file is created with its mode, it is never readable by others
+    fd = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return token
+
+def run_job(job):
+    """Run a conversion job as the command line would, in a worker
+
+    The worker moves to the working directory of the client, and the
+    output of the command is captured.
+
+    :param dict job: `args` of the command line and `cwd` of the client
+    :rtype: dict of the exit `status` and the `output` of the command
+
+    """
+    output = StringIO()
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = output
+    status = 0
+    try:
+        os.chdir(job['cwd'])
+        main.main(args=job['args'], prog_name='converttool', standalone_mode=False)
+    except click.ClickException as e:
+        e.show(file=output)
+        status = e.exit_code
+    except click.Abort:
+        status = 1
+    except SystemExit as e:
+        status = e.code or 0
+    except Exception:
+        log.debug("Job {} failed".format(job))
+        output.write(traceback.format_exc())
+        status = 1
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    return {'status': status, 'output': output.getvalue()}
+
+def _work(connection):
+    """Run the jobs sent on a pipe in a worker process, until None comes"""
+    # The service stops the workers once their jobs are done
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        for job in iter(connection.recv, None):
+            connection.send(run_job(job))
+    except EOFError:
+        pass
+
+class Worker:
+    """Class of a worker process, and of the thread of the service feeding it
+
+    The thread takes the jobs of the pool one at a time, sends them to
+    the process on a pipe of its own, and waits for the result while
+    checking that the process is alive. A process that died, killed for
+    its memory or crashed, fails its job and is replaced by a new one.
+
+    """
+
+    def __init__(self, jobs):
+        """Method to initialize `Worker`
+
+        :param Queue.Queue jobs: Jobs of the pool, with the entry their
+        result is handed in, None stops the worker
+
+        """
+        self.jobs = jobs
+        self.start()
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def start(self):
+        """Method to start a worker process"""
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_work, args=(child,))
+        self.process.start()
+        # Only the process holds its end, so its death ends the pipe
+        child.close()
+
+    def restart(self):
+        """Method to replace a worker process that died"""
+        log.warning("Worker {} died with exit code {}, starting another one".format(self.process.pid, self.process.exitcode))
+        self.connection.close()
+        self.process.join()
+        self.start()
+
+    def serve(self):
+        """Method to run the jobs of the pool in the process, until None comes"""
+        for entry, job in iter(self.jobs.get, None):
+            if not self.process.is_alive():
+                self.restart()
+            try:
+                self.connection.send(job)
+                while not self.connection.poll(WATCH_INTERVAL):
+                    if not self.process.is_alive():
+                        raise EOFError
+                result = self.connection.recv()
+            except (EOFError, IOError):
+                result = {'status': 1, 'output': 'The worker running the job died with exit code {}\n'.format(self.process.exitcode)}
+                self.restart()
+            entry[1] = result
+            entry[0].set()
+        if self.process.is_alive():
+            self.connection.send(None)
+        self.process.join()
+        self.connection.close()
+
+class WorkerPool:
+    """Class to run jobs in worker processes started once
+
+    The workers are forked from the service once everything is imported
+    and the validation schema is loaded, so jobs start warm. Workers are
+    not daemonic, and jobs can convert with processes of their own.
+    Workers that die are replaced, and their job fails.
+
+    """
+
+    def __init__(self, workers):
+        """Method to initialize `WorkerPool`
+
+        :param int workers: Number of worker processes
+
+        """
+        self.jobs = Queue.Queue()
+        self.workers = [Worker(self.jobs) for _ in range(workers)]
+
+    def run(self, job):
+        """Method to run a job in a worker and wait for its result
+
+        :param dict job: Job given to `run_job`
+        :rtype: dict result of `run_job`
+
+        """
+        entry = [threading.Event(), None]
+        self.jobs.put((entry, job))
+        # A wait without timeout can not be interrupted on python 2
+        while not entry[0].wait(WATCH_INTERVAL):
+            pass
+        return entry[1]
+
+    def close(self):
+        """Method to stop the workers once they finished their jobs"""
+        for worker in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.thread.join()
+
+class ConversionService:
+    """Class to run the conversion jobs of the clients
+
+    At most `workers` jobs run at the same time, and `queue_size` more
+    wait for a worker. Beyond that, jobs are refused until one of them
+    is done, so clients back off instead of piling up work.
+
+    """
+
+    def __init__(self, workers=None, queue_size=QUEUE_SIZE):
+        """Method to initialize `ConversionService`
+
+        :param int workers: Number of worker processes, the number of
+        cpus by default
+        :param int queue_size: Number of jobs waiting for a worker
+
+        """
+        # Schemas and formats are cached by the workers forked from here
+        try:
+            Validate.load_schema()
+        except SettingsNotFound:
+            pass
+        load_entry_points()
+        for output_format in FORMATS.keys():
+            load_format_class(output_format)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.queue_size = queue_size
+        self.slots = threading.Semaphore(self.workers + queue_size)
+        self.jobs = 0
+        self.lock = threading.Lock()
+        self.pool = WorkerPool(self.workers)
+
+    def run(self, job):
+        """Method to run a job, if the service is not busy
+
+        :param dict job: `args` of the command line and `cwd` of the client
+        :rtype: dict result of `run_job`
+        :raises: ServiceBusy if too many jobs are running or waiting
+
+        """
+        if not self.slots.acquire(False):
+            raise ServiceBusy("{} jobs are running or waiting".format(self.workers + self.queue_size))
+        with self.lock:
+            self.jobs += 1
+        try:
+            return self.pool.run(job)
+        finally:
+            with self.lock:
+                self.jobs -= 1
+            self.slots.release()
+
+    def status(self):
+        """Method to return the number of workers and of jobs of the service"""
+        return {'workers': self.workers, 'queue_size': self.queue_size, 'jobs': self.jobs}
+
+    def close(self):
+        """Method to stop the workers of the service"""
+        self.pool.close()
+
+class JobHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Class to handle the requests of the clients
+
+    `POST /jobs` runs the job in the json body, and answers with its
+    result. `503` is answered when the service is busy. `GET /status`
+    answers with the status of the service.
+
+    Jobs write files as the user of the service, so every request
+    carries the token of the service, that only its user can read, or
+    is answered `401`. Jobs are only accepted as `application/json`,
+    which a browser can not send to another origin without asking
+    first, and is answered `415` otherwise.
+
+    """
+
+    def authorized(self):
+        """Method to check the token of the request, answering `401` without it"""
+        if hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), self.server.token):
+            return True
+        self.reply(401, {'error': 'The token of the service is needed'})
+        return False
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        if self.path != '/status':
+            return self.reply(404, {'error': 'Not found'})
+        self.reply(200, self.server.service.status())
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if self.path != '/jobs':
+            return self.reply(404, {'error': 'Not found'})
+        if self.headers.get('Content-Type', '').split(';')[0].strip() != 'application/json':
+            return self.reply(415, {'error': 'Jobs are sent as application/json'})
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            job = {'args': [unicode(arg) for arg in job['args']], 'cwd': job['cwd']}
+        except (ValueError, KeyError, TypeError):
+            return self.reply(400, {'error': 'A job needs the args of the command line and a cwd'})
+        try:
+            result = self.server.service.run(job)
+        except ServiceBusy as e:
+            return self.reply(503, {'error': str(e)})
+        self.reply(200, result)
+
+    def reply(self, code, content):
+        """Method to answer with json content"""
+        body = json.dumps(content)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if code == 503:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+class ServiceServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Class of the service listening on a TCP port"""
+
+    daemon_threads = True
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        _remove(self.token_file)
+
+class UnixServiceServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Class of the service listening on a unix socket"""
+
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        # Only the user of the service can connect to the socket, from
+        # the moment it is created
+        umask = os.umask(0o177)
+        try:
+            SocketServer.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+        os.chmod(self.server_address, 0o600)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        _remove(self.server_address)
+        _remove(self.token_file)
+
+    def get_request(self):
+        request, address = SocketServer.UnixStreamServer.get_request(self)
+        # Unix sockets have no client address
+        return request, ('unix', 0)
+
+def make_server(service, host=SERVICE_HOST, port=None, socket_path=SOCKET_PATH):
+    """Return a server handing the requests to the service
+
+    A new token is written next to the unix socket, or in `SERVICE_DIR`
+    for a port, readable by the user of the service only, and removed
+    with the server.
+
+    :param ConversionService service: Service running the jobs
+    :param str host: Host to listen on, with a port
+    :param int port: Port to listen on instead of the unix socket, 0 for
+    any free port
+    :param str socket_path: Path of the unix socket to listen on
+    :rtype: server, `serve_forever` serves the requests
+
+    """
+    if port is None:
+        _make_dir(os.path.dirname(os.path.abspath(socket_path)))
+        server = UnixServiceServer(socket_path, JobHandler)
+        address = socket_path
+    else:
+        server = ServiceServer((host, port), JobHandler)
+        address = '{}:{}'.format(host, server.server_address[1])
+    server.service = service
+    server.address = address
+    server.token_file = token_path(address)
+    try:
+        _make_dir(os.path.dirname(server.token_file))
+        server.token = write_token(server.token_file)
+    except (IOError, OSError):
+        server.server_close()
+        raise
+    return server
+
+@click.command()
+@click.option('--socket', 'socket_path', default=SOCKET_PATH, help='Path of the unix socket to listen on, only the user can connect to it. {} by default'.format(SOCKET_PATH.replace(os.path.expanduser('~'), '~')))
+@click.option('--port', default=None, type=int, help='Port to listen on instead of the unix socket, clients need the token of the service. Disabled by default')
+@click.option('--host', default=SERVICE_HOST, help='Host to listen on with --port. 127.0.0.1 by default')
+@click.option('--workers', default=None, type=int, help='Number of jobs converted at the same time. The number of cpus by default')
+@click.option('--queue-size', default=QUEUE_SIZE, type=int, help='Number of jobs waiting for a worker, more jobs are refused. 16 by default')
+@click.option('--log', default="notset", help='Enable logging for the service', type=click.Choice(['info', 'debug', 'notset']))
+def serve(socket_path, port, host, workers, queue_size, log):
+    """Run conversion jobs sent by converttool-client"""
+    logging.getLogger('converttool.Service').setLevel(getattr(logging, log.upper()))
+    service = ConversionService(workers, queue_size)
+    try:
+        server = make_server(service, host, port, socket_path)
+    except (socket.error, IOError, OSError) as e:
+        service.close()
+        raise click.ClickException("Can not listen on {}: {}".format(socket_path if port is None else '{}:{}'.format(host, port), e))
+    click.echo("Serving on {} with {} workers, token in {}".format(server.address, service.workers, server.token_file))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,153 @@
+from converttool import *
+from converttool.constants import SORT_MEMORY
+from converttool.rowtable import make_row
+from heapq import merge
+from itertools import islice
+import cPickle as pickle
+import sys
+import tempfile
+
+log = logging.getLogger('converttool.Sort')
+
+# Number of rows sampled to estimate the memory used by a row
+SAMPLE_SIZE = 1000
+# Number of rows pickled at once in a run
+PICKLE_BATCH = 1000
+# Largest number of runs merged at once
+MERGE_WIDTH = 64
+
+def sort_key(value):
+    """Return the typed sort key of a csv value
+
+    Numbers sort numerically and before strings, so `stars` sorts as
+    numbers while `name` sorts as strings. Empty values sort last.
+
+    """
+    if value is None or value == '':
+        return (2, u'')
+    try:
+        number = float(value)
+    except ValueError:
+        return (1, value)
+    if number != number:
+        # nan does not compare, sort it as a string
+        return (1, value)
+    return (0, number)
+
+def _decorate(records, key, run):
+    """Generator to make the records of a run comparable and stable"""
+    for position, record in enumerate(records):
+        yield key(record), run, position, record
+
+class ExternalSort:
+    """Class to sort a stream of rows within a memory budget
+
+    Rows are kept in memory, and sorted there, as long as they fit in
+    the budget. Beyond it, sorted runs of rows are spilled to temporary
+    files and merged back with `heapq.merge`. The sort is stable.
+    Rows are held as tuples of their values in the order of the header,
+    followed by the values `csv.DictReader` puts under the `None` key
+    for rows longer than the header.
+
+    """
+
+    def __init__(self, fieldnames, field, memory=SORT_MEMORY, tmpdir=None):
+        """Method to initialize `ExternalSort`
+
+        :param list fieldnames: Header of the csv
+        :param str field: Name of the column to sort on
+        :param int memory: Memory budget in megabytes
+        :param str tmpdir: Directory of the runs, the default temporary
+        directory if None
+        :raises: ValueError if field is not a column of the csv
+
+        """
+        self.fieldnames = tuple(fieldnames)
+        self.field = field
+        position = self.fieldnames.index(field)
+        self.key = lambda record: sort_key(record[position])
+        self.budget = memory * 1024 * 1024
+        self.tmpdir = tmpdir
+        self.runs = 0
+
+    def sort(self, rows):
+        """Generator to yield the rows sorted on the column
+
+        :param iterable rows: Iterator of dictionaries
+        :rtype: iterator of the sorted rows
+
+        """
+        fieldnames = self.fieldnames
+        width = len(fieldnames)
+        records = (self.record(row) for row in rows)
+        run = list(islice(records, SAMPLE_SIZE))
+        run_length = max(SAMPLE_SIZE, self.budget // self.estimate(run))
+        run.extend(islice(records, run_length - len(run)))
+        runs = []
+        while True:
+            run.sort(key=self.key)
+            extra = next(records, None)
+            if extra is None:
+                break
+            runs.append(self.spill(run))
+            run = [extra]
+            run.extend(islice(records, run_length - 1))
+        if runs:
+            runs.append(self.spill(run))
+            run = None
+            log.debug("Merging {} sorted runs".format(len(runs)))
+            while len(runs) > MERGE_WIDTH:
+                runs = [self.spill(self.merge(runs[i:i + MERGE_WIDTH]))
+                        for i in range(0, len(runs), MERGE_WIDTH)]
+            run = self.merge(runs)
+        for record in run:
+            yield make_row(fieldnames, record[:width], record[width] if len(record) > width else None)
+
+    def record(self, row):
+        """Method to turn a row into a record"""
+        record = tuple(row.get(field) for field in self.fieldnames)
+        extra = row.get(None)
+        return record if extra is None else record + (extra,)
+
+    def estimate(self, records):
+        """Method to estimate the memory used by a record, in bytes"""
+        if not records:
+            return 1
+        size = sum(sys.getsizeof(record) + sum(sys.getsizeof(value) for value in record)
+                for record in records)
+        return max(1, size // len(records))
+
+    def spill(self, records):
+        """Method to write sorted records into a temporary file
+
+        :param iterable records: Sorted records
+        :rtype: file the records can be read back from
+
+        """
+        self.runs += 1
+        f = tempfile.TemporaryFile(dir=self.tmpdir)
+        records = iter(records)
+        while True:
+            batch = list(islice(records, PICKLE_BATCH))
+            if not batch:
+                break
+            pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+        f.seek(0)
+        return f
+
+    def read(self, run):
+        """Generator to read back the records of a run, and delete it"""
+        with run:
+            while True:
+                try:
+                    batch = pickle.load(run)
+                except EOFError:
+                    break
+                for record in batch:
+                    yield record
+
+    def merge(self, runs):
+        """Generator to merge sorted runs into sorted records"""
+        streams = [_decorate(self.read(run), self.key, i) for i, run in enumerate(runs)]
+        for key, run, position, record in merge(*streams):
+            yield record
@@ -1,56 +1,355 @@
 import json
 import logging
-from cerberus import Validator, SchemaError
+import re
+import copy
+from itertools import islice
 from converttool import *
 from converttool.settings import BASE_DIR
-from converttool.exceptions import SettingsNotFound
+from converttool.exceptions import SettingsNotFound, InvalidValidationSchema, ValidationError
+import unicodecsv as csv
 
 log = logging.getLogger('converttool.Validate')
 
+# Rules checked by the compiled schema, any other rule of a field is
+# left to cerberus
+COMPILED_RULES = frozenset(['type', 'required', 'nullable', 'empty', 'regex',
+    'min', 'max', 'minlength', 'maxlength', 'allowed'])
+
+def _coerce_boolean(value):
+    """Convert the csv representation of a boolean"""
+    lower = value.lower()
+    if lower in ('true', '1', 'yes'):
+        return True
+    if lower in ('false', '0', 'no'):
+        return False
+    raise ValueError(value)
+
+def _coerce_number(value):
+    """Convert the csv representation of an integer or a float"""
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+# Converters of the csv strings for the types of the schema, strings
+# are kept as they are
+COERCERS = {
+    'string': None,
+    'integer': int,
+    'float': float,
+    'number': _coerce_number,
+    'boolean': _coerce_boolean,
+}
+
+# Directory validate.json is looked up in before the project root
+CONFIG_DIR = os.path.expanduser('~/.config')
+
+# Schemas loaded from validate.json, with the modification time of the
+# file, so a long running process only reads it again when it changed
+SCHEMAS = {}
+
+class CompiledSchema:
+    """Class to validate rows against a schema compiled once
+
+    Cerberus walks the whole schema again for every row. The compiled
+    schema turns the rules of every field once into a checker, and runs
+    the checkers column by column over batches of rows. Csv values are
+    always strings, so the `type` rule converts them to the type before
+    `allowed`, `min` and `max` are checked. Rules that are not compiled
+    are validated by cerberus.
+
+    """
+
+    def __init__(self, schema):
+        """Method to compile the schema
+
+        :param dict schema: Cerberus schema of validate.json
+        :raises: SchemaError if the schema is invalid
+
+        """
+        # cerberus is only imported when rows are validated
+        from cerberus import Validator
+        Validator(schema)
+        self.schema = schema
+        self.checkers = {}
+        self.required = []
+        fallback = {}
+        for field, rules in schema.items():
+            compiled = {}
+            for rule, constraint in rules.items():
+                if rule in COMPILED_RULES and (rule != 'type' or constraint in COERCERS):
+                    compiled[rule] = constraint
+                else:
+                    fallback.setdefault(field, {})[rule] = constraint
+            if compiled.get('required'):
+                self.required.append(field)
+            self.checkers[field] = self.compile_field(compiled)
+        self.required = frozenset(self.required)
+        self.fallback = None
+        if fallback:
+            log.debug('Rules left to cerberus: {}'.format(fallback))
+            self.fallback = Validator(fallback, allow_unknown=True)
+
+    @classmethod
+    def compile_field(cls, rules):
+        """Method to turn the rules of a field into a checker
+
+        :param dict rules: Compiled rules of the field
+        :rtype: function returning the list of errors of a value
+
+        """
+        type_name = rules.get('type', 'string')
+        coerce = COERCERS[type_name]
+        nullable = rules.get('nullable', False)
+        empty = rules.get('empty', True)
+        regex = None
+        if 'regex' in rules:
+            pattern = rules['regex']
+            regex = re.compile(pattern if pattern.endswith('$') else pattern + '$')
+        minlength = rules.get('minlength')
+        maxlength = rules.get('maxlength')
+        allowed = rules.get('allowed')
+        if allowed is not None:
+            allowed = frozenset(allowed)
+        minimum = rules.get('min')
+        maximum = rules.get('max')
+
+        def check(value):
+            if value is None:
+                return [] if nullable else ["null value not allowed"]
+            if value == '':
+                if not empty:
+                    return ["empty values not allowed"]
+                if coerce is not None:
+                    # An empty cell of a typed column has no value to check
+                    return []
+            errors = []
+            if coerce is not None and isinstance(value, basestring):
+                try:
+                    value = coerce(value)
+                except ValueError:
+                    return ["must be of {} type".format(type_name)]
+            if isinstance(value, basestring):
+                if regex is not None and not regex.match(value):
+                    errors.append("value does not match regex '{}'".format(rules['regex']))
+                if minlength is not None and len(value) < minlength:
+                    errors.append("min length is {}".format(minlength))
+                if maxlength is not None and len(value) > maxlength:
+                    errors.append("max length is {}".format(maxlength))
+            if allowed is not None and value not in allowed:
+                errors.append("unallowed value {}".format(value))
+            if minimum is not None and value < minimum:
+                errors.append("min value is {}".format(minimum))
+            if maximum is not None and value > maximum:
+                errors.append("max value is {}".format(maximum))
+            return errors
+
+        return check
+
+    def validate_column(self, field, values):
+        """Method to validate all the values of a column
+
+        :param str field: Name of the column
+        :param list values: Values of the column
+        :rtype: list of the list of errors of every value
+
+        """
+        check = self.checkers[field]
+        return [check(value) for value in values]
+
+    def validate_batch(self, rows):
+        """Method to validate a batch of rows, column by column
+
+        :param list rows: List of dictionaries
+        :rtype: list of the errors of every row, as dictionaries of the
+        list of messages of every invalid field, like cerberus
+
+        """
+        results = [{} for _ in rows]
+        for field, check in self.checkers.items():
+            for errors, row in zip(results, rows):
+                if field in row:
+                    messages = check(row[field])
+                    if messages:
+                        errors[field] = messages
+                elif field in self.required:
+                    errors[field] = ["required field"]
+        for errors, row in zip(results, rows):
+            for field in row:
+                if field not in self.checkers:
+                    errors[field] = ["unknown field"]
+            if self.fallback is not None and not self.fallback.validate(row):
+                for field, messages in self.fallback.errors.items():
+                    errors.setdefault(field, []).extend(messages)
+        return results
+
+def format_errors(errors):
+    """Format the errors of a row as a single line
+
+    :param dict errors: List of messages of every invalid field
+    :rtype: str
+
+    """
+    return '; '.join('{}: {}'.format(field, ', '.join(messages)) for field, messages in sorted(errors.items()))
+
+class RejectFile:
+    """Class to write the rejected rows in a csv, with the reasons
+
+    The file is only created once the first row is rejected. A reject
+    file left by a previous run is removed.
+
+    """
+
+    def __init__(self, file_name, fieldnames):
+        """Initialize the reject file
+
+        :param str file_name: Name of the reject file
+        :param list fieldnames: Header of the csv
+        """
+        self.file_name = file_name
+        self.fieldnames = list(fieldnames) + ['errors']
+        self.total = 0
+        self.f = None
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+    def write(self, row, errors):
+        """Method to write a rejected row and its errors"""
+        if self.f is None:
+            self.f = open(self.file_name, 'wb')
+            self.writer = csv.DictWriter(self.f, self.fieldnames, extrasaction='ignore', encoding='utf-8')
+            self.writer.writeheader()
+        row = dict(row)
+        row['errors'] = format_errors(errors)
+        self.writer.writerow(row)
+        self.total += 1
+
+    def close(self):
+        """Method to close the reject file"""
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
 class Validate:
     """Class to dynamically add new validations to the schema"""
-    
-    def __init__(self, data):
+
+    def __init__(self, data, schema=None):
         """Initialize the Validator
-        
-        :param list data: List of dictionaries of tha actual data
-        #TODO: Make the schema a parameter to the initializer rather 
-        than keep it fixed to validate.json
+
+        :param iterable data: List or iterator of dictionaries of tha
+        actual data
+        :param dict schema: Cerberus schema. By default validate.json
+        is loaded from ~/.config or the project root
         """
         self.data = data
-        if not os.path.exists(os.path.join(os.path.expanduser('~/.config'), 'validate.json')):
+        self.schema = schema if schema is not None else self.load_schema()
+
+    @classmethod
+    def load_schema(cls):
+        """Method to load the schema from validate.json
+
+        The schema is only read again when the file changed.
+
+        #TODO: Make the location of validate.json configurable
+        :rtype: dict schema
+        :raises: SettingsNotFound if there is no validate.json
+
+        """
+        if not os.path.exists(os.path.join(CONFIG_DIR, 'validate.json')):
             # Use validate.json from project root
-            self.settings = os.path.join(BASE_DIR, 'validate.json')
-        else: 
+            settings = os.path.join(BASE_DIR, 'validate.json')
+        else:
             # Use validate.json from ~/.config
-            self.settings = os.path.join(os.path.expanduser('~/.config'), 'validate.json')
+            settings = os.path.join(CONFIG_DIR, 'validate.json')
         try:
-            # load the schema
-            with open(self.settings) as f:
-                self.schema = json.load(f)
-        except IOError:
+            mtime = os.path.getmtime(settings)
+            if settings not in SCHEMAS or SCHEMAS[settings][0] != mtime:
+                # load the schema
+                with open(settings) as f:
+                    SCHEMAS[settings] = (mtime, json.load(f))
+        except (IOError, OSError):
             raise SettingsNotFound("Please make sure that validate.json is present in the ~/.config or project root")
+        return copy.deepcopy(SCHEMAS[settings][1])
 
+    def compile(self):
+        """Method to compile the schema once for all the rows
+
+        :rtype: CompiledSchema
 
-    def validate(self):
-        """Method to validate the schema against the data
-        
-        rtype: int errors: Number of errors found. 
-        
         """
+        from cerberus import SchemaError
         try:
-            v = Validator(self.schema)
+            return CompiledSchema(self.schema)
         except SchemaError:
-            return InvalidValidationSchema("There is a problem with yoru scheme. Please check validate.json again")
-        errors = 0
-        for d in self.data:
-            v.validate(d, self.schema)
-        if v.errors:
-            errors+=1
-        return errors
+            raise InvalidValidationSchema("There is a problem with yoru scheme. Please check validate.json again")
+
+    def iter_batches(self, batch_size=1024):
+        """Generator to validate the data in batches
+
+        :param int batch_size: Number of rows validated at once
+        :rtype: iterator of tuples of every row and its errors
+
+        """
+        compiled = self.compile()
+        rows = iter(self.data)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            for row, errors in zip(batch, compiled.validate_batch(batch)):
+                yield row, errors
+
+    def iter_errors(self, batch_size=1024):
+        """Generator to validate the data in batches
+
+        :param int batch_size: Number of rows validated at once
+        :rtype: iterator of the index and the errors of invalid rows
+
+        """
+        for index, (row, errors) in enumerate(self.iter_batches(batch_size)):
+            if errors:
+                yield index, errors
+
+    def filter(self, strict=False, rejects=None, batch_size=1024, rejected=None):
+        """Generator to yield the valid rows of the data
+
+        The data is validated as it is read, so it is never held in
+        memory.
+
+        :param bool strict: Raise ValidationError on the first invalid row
+        :param function rejects: Called with every invalid row and its
+        errors when not strict, like `RejectFile.write`
+        :param int batch_size: Number of rows validated at once
+        :param list rejected: List the index of every invalid row is
+        appended to when not strict, None by default
+        :rtype: iterator of the valid rows
+
+        """
+        for index, (row, errors) in enumerate(self.iter_batches(batch_size)):
+            if not errors:
+                yield row
+            elif strict:
+                raise ValidationError("Row {} is invalid: {}".format(index + 1, format_errors(errors)))
+            else:
+                if rejects is not None:
+                    rejects(row, errors)
+                if rejected is not None:
+                    rejected.append(index)
+
+    def validate(self):
+        """Method to validate the schema against the data
+
+        The errors of every invalid row are kept in `self.errors` as a
+        list of tuples of the index of the row and its errors.
+
+        rtype: int errors: Number of errors found.
+
+        """
+        self.errors = list(self.iter_errors())
+        return sum(len(messages) for index, errors in self.errors for messages in errors.values())
 
     def __repr__(self):
         return "Validator"
 
-    def __str__(self):  
+    def __str__(self):
         return "Validator"
@@ -39,14 +39,14 @@ setup(
     license=license,
     packages=['converttool'],
     install_requires=[
-        'dicttoxml==1.7.4',
         'click==6.6',
         'unicodecsv==0.14.1',
     ],
     tests_require='pytest==3.0.2',
     entry_points={
         'console_scripts':[
-            'converttool = converttool.app:main',
+            'converttool = converttool.app:run',
+            'converttool-client = converttool.client:main',
             ]
         },
     cmdclass={'test': PyTest},
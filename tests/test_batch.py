@@ -0,0 +1,96 @@
+#coding: utf-8
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from converttool import validate
+from converttool.batch import Batch, find_inputs, get_output_name
+from converttool.exceptions import *
+
+HEADER = 'name,address,stars,contact,phone,uri\n'
+ROW = 'Jürgen-{0},"{0} Lowe Knoll, East Maxine",{1},Dr. Sinda Wyman,1-270-665-9933,http://www.paucek.com/{0}\n'
+
+class TestBatch(unittest.TestCase):
+    """Tests for the conversion of many csv files at once"""
+
+    def setUp(self):
+        """Setup csv files of different sizes, and one without the sort key"""
+        self.tmpdir = tempfile.mkdtemp()
+        # Rows are not validated, whatever validate.json there is
+        self.addCleanup(setattr, validate, 'CONFIG_DIR', validate.CONFIG_DIR)
+        self.addCleanup(setattr, validate, 'BASE_DIR', validate.BASE_DIR)
+        validate.CONFIG_DIR = validate.BASE_DIR = self.tmpdir
+        self.sizes = {'small.csv': 2, 'large.csv': 50, 'medium.csv': 10}
+        for name, rows in self.sizes.items():
+            with open(os.path.join(self.tmpdir, name), 'w') as f:
+                f.write(HEADER + ''.join(ROW.format(i, i % 6) for i in range(rows)))
+        with open(os.path.join(self.tmpdir, 'other.csv'), 'w') as f:
+            f.write('x,y\n1,2\n')
+        with open(os.path.join(self.tmpdir, 'notes.txt'), 'w') as f:
+            f.write('not a csv')
+
+    def tearDown(self):
+        """Remove the test data"""
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def test_find_inputs(self):
+        """Method to test that the csv files are found largest first"""
+        expected = [self.path(name) for name in ('large.csv', 'medium.csv', 'small.csv', 'other.csv')]
+        self.assertEqual(find_inputs(self.tmpdir), expected)
+        self.assertEqual(find_inputs(self.path('*.csv')), expected)
+        self.assertEqual(find_inputs(self.path('m*.csv')), [self.path('medium.csv')])
+        self.assertEqual(get_output_name(self.path('small.csv')), self.path('small'))
+        self.assertEqual(get_output_name(self.path('small.csv.gz')), self.path('small'))
+        with open(self.path('small.csv.gz'), 'wb') as f:
+            f.write(b'')
+        self.assertRaises(OutputNameConflict, find_inputs, self.tmpdir)
+
+    def test_run(self):
+        """Method to test that every file is converted next to it, and failures are reported"""
+        b = Batch(find_inputs(self.tmpdir), ('json', 'xml'), jobs=2, sort_key='stars', cache=False, executor='process')
+        results = b.run()
+        self.assertEqual([os.path.basename(result['csv']) for result in results], ['large.csv', 'medium.csv', 'small.csv', 'other.csv'])
+        for name, rows in self.sizes.items():
+            result = results[[r['csv'] for r in results].index(self.path(name))]
+            self.assertEqual(result['rows'], rows)
+            self.assertEqual(result['error'], None)
+            base = os.path.splitext(name)[0]
+            with open(self.path('{}.json'.format(base))) as f:
+                self.assertEqual([row['stars'] for row in json.load(f)], sorted(unicode(i % 6) for i in range(rows)))
+            self.assertTrue(os.path.exists(self.path('{}.xml'.format(base))))
+        self.assertEqual(results[-1]['error'], 'SortKeyNotFound: stars is not a column of {}'.format(self.path('other.csv')))
+        self.assertEqual(b.get_failed(), [results[-1]])
+        summary = b.format_summary().splitlines()
+        self.assertTrue(summary[0].startswith('OK     {}: 50 rows in '.format(self.path('large.csv'))))
+        self.assertTrue(summary[3].startswith('FAILED {}'.format(self.path('other.csv'))))
+        self.assertTrue(summary[4].startswith('Converted 3 of 4 files, 62 rows in '))
+
+    def test_exit_status(self):
+        """Method to test that the command fails when a file of the batch failed or the batch is refused"""
+        from click.testing import CliRunner
+        from converttool.app import main
+        result = CliRunner().invoke(main, ['--batch', self.path('*.csv'), '--jobs', '2', '--sort-key', 'stars', '--no-cache', 'json'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('FAILED {}'.format(self.path('other.csv')), result.output)
+        self.assertTrue(os.path.exists(self.path('small.json')))
+        result = CliRunner().invoke(main, ['--batch', self.path('*.csv'), '--jobs', '2', '--no-cache', 'json'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Converted 4 of 4 files', result.output)
+        with open(self.path('small.csv.gz'), 'wb') as f:
+            f.write(b'')
+        result = CliRunner().invoke(main, ['--batch', self.tmpdir, '--no-cache', 'json'])
+        self.assertEqual(result.exit_code, 1)
+
+    def test_options(self):
+        """Method to test that the options of a single conversion are refused with --batch"""
+        from click.testing import CliRunner
+        from converttool.app import main
+        for option in (['--output-name', 'data'], ['--stats'], ['--stats-json', 'stats.json'], ['--profile', 'cpu']):
+            result = CliRunner().invoke(main, ['--batch', self.tmpdir] + option + ['json'])
+            self.assertEqual(result.exit_code, 2)
+            self.assertIn('{} can not be used with --batch'.format(option[0]), result.output)
+        self.assertFalse(os.path.exists(self.path('small.json')))
@@ -0,0 +1,95 @@
+#coding: utf-8
+import unittest
+import os
+import shutil
+import tempfile
+from converttool.cache import Cache
+
+class TestCache(unittest.TestCase):
+    """Tests for the Cache Class"""
+
+    def setUp(self):
+        """Setup a cache in a temporary directory"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = Cache(os.path.join(self.tmpdir, 'cache'), size=1)
+        self.csv = os.path.join(self.tmpdir, 'test.csv')
+        with open(self.csv, 'w') as f:
+            f.write('name,stars\nJürgen,5\n')
+
+    def tearDown(self):
+        """Remove the cache"""
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, content):
+        """Write a file in the temporary directory"""
+        name = os.path.join(self.tmpdir, name)
+        with open(name, 'w') as f:
+            f.write(content)
+        return name
+
+    def test_digest(self):
+        """Method to test that the hash of a csv is kept until it changes"""
+        digest = self.cache.get_digest(self.csv)
+        entry, = os.listdir(os.path.join(self.cache.directory, 'inputs'))
+        entry = os.path.join(self.cache.directory, 'inputs', entry)
+        with open(entry) as f:
+            content = f.read()
+        with open(entry, 'w') as f:
+            f.write(content.replace(digest, 'known'))
+        self.assertEqual(self.cache.get_digest(self.csv), 'known')
+        with open(self.csv, 'a') as f:
+            f.write('Anna,3\n')
+        self.assertNotEqual(self.cache.get_digest(self.csv), digest)
+
+    def test_key(self):
+        """Method to test that every option changes the key of an output"""
+        keys = set([
+            self.cache.get_key('digest', 'json'),
+            self.cache.get_key('other', 'json'),
+            self.cache.get_key('digest', 'xml'),
+            self.cache.get_key('digest', 'json', pretty=True),
+            self.cache.get_key('digest', 'json', sort_key='stars'),
+            self.cache.get_key('digest', 'json', schema={'stars': {'type': 'integer'}}),
+        ])
+        self.assertEqual(len(keys), 6)
+        self.assertEqual(self.cache.get_key('digest', 'json'), self.cache.get_key('digest', 'JSON'))
+
+    def test_store_fetch(self):
+        """Method to test that outputs are copied from the cache, and never change it"""
+        output = self.write('data.json', '[]')
+        self.assertEqual(self.cache.get_details('key'), None)
+        self.cache.store('key', output, {'rows': 0})
+        self.assertEqual(self.cache.get_details('key'), {'rows': 0})
+        with open(output, 'a') as f:
+            f.write('\n')
+        os.utime(output, (0, 0))
+        self.cache.fetch('key', output)
+        self.cache.fetch('key', output)
+        self.assertEqual(open(output).read(), '[]')
+        self.assertEqual(os.listdir(self.tmpdir).count('data.json'), 1)
+        self.assertEqual(os.stat(output).st_nlink, 1)
+        # Writing the output, or touching the object, leaves the other alone
+        with open(output, 'a') as f:
+            f.write('[{}]')
+        self.assertEqual(open(self.cache.get_object_name('key')).read(), '[]')
+        mtime = os.path.getmtime(output)
+        self.cache.fetch('key', self.write('other.json', ''))
+        self.assertEqual(os.path.getmtime(output), mtime)
+
+    def test_changed(self):
+        """Method to test that an output whose size changed in the cache is not used"""
+        self.cache.store('key', self.write('data.json', '[]'), {'rows': 0})
+        with open(self.cache.get_object_name('key'), 'a') as f:
+            f.write('[{}]')
+        self.assertEqual(self.cache.get_details('key'), None)
+
+    def test_evict(self):
+        """Method to test that the least recently used outputs are evicted first"""
+        for key in ('old', 'used', 'new'):
+            self.cache.store(key, self.write(key, 'x' * 400 * 1024), {'rows': 1})
+            os.utime(self.cache.get_object_name(key), (0, {'old': 1, 'used': 2, 'new': 3}[key]))
+        os.utime(self.cache.get_object_name('used'), None)
+        self.cache.evict()
+        self.assertEqual(self.cache.get_details('old'), None)
+        self.assertEqual(self.cache.get_details('used'), {'rows': 1})
+        self.assertEqual(self.cache.get_details('new'), {'rows': 1})
@@ -0,0 +1,100 @@
+#coding: utf-8
+import unittest
+import os
+import tempfile
+import unicodecsv as csv
+from converttool.chunks import split_csv, read_chunk, convert_in_chunks
+from converttool.formats import Format
+from converttool.exceptions import *
+
+class TestChunks(unittest.TestCase):
+    """Tests for the chunked conversion of the csv"""
+
+    tmpdir = tempfile.gettempdir()
+
+    def setUp(self):
+        """Setup test data with quoted newlines in the addresses"""
+        self.csv = os.path.join(self.tmpdir, 'test_chunks.csv')
+        rows = ['name,address,stars,contact,phone,uri']
+        for i in range(50):
+            rows.append('Jürgen-{0},"{0} Lowe Knoll,\n""East"" Maxine, WA",{1},Dr. Sinda Wyman,1-270-665-9933,http://www.paucek.com/{0}'.format(i, i % 6))
+        with open(self.csv, 'w') as f:
+            f.write('\n'.join(rows))
+
+    def tearDown(self):
+        """Destroy and rebuild data after every unit case"""
+        for name in ('data.json', 'data.xml', 'data.jsonl', 'serial.json', 'serial.xml', 'serial.jsonl'):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def test_split_csv(self):
+        """Method to test that the chunks are aligned on records and cover all the rows"""
+        header, ranges = split_csv(self.csv, 8, 1)
+        self.assertEqual(header, 'name,address,stars,contact,phone,uri\n')
+        self.assertEqual(len(ranges), 8)
+        self.assertEqual(ranges[0][0], len(header))
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.csv))
+        names = []
+        for start, end in ranges:
+            for row in read_chunk(self.csv, header, start, end):
+                self.assertEqual(row['stars'], unicode(int(row['name'].split('-')[1]) % 6))
+                names.append(row['name'])
+        self.assertEqual(names, ['Jürgen-{}'.decode('utf-8').format(i) for i in range(50)])
+        header, ranges = split_csv(self.csv, 2, 1, 1000)
+        self.assertTrue(len(ranges) >= os.path.getsize(self.csv) // 1000)
+        self.assertTrue(all(end - start <= 1000 + 200 for start, end in ranges))
+        self.assertEqual(sum(end - start for start, end in ranges), os.path.getsize(self.csv) - len(header))
+
+    def test_convert_in_chunks(self):
+        """Method to test that the chunked conversion is identical to a serial one"""
+        for format in ('json', 'xml', 'jsonl'):
+            for pretty in (True, False):
+                Format(format, read_chunk(self.csv, '', 0, os.path.getsize(self.csv)), 'serial', pretty).convert_data()
+                with open('serial.{}'.format(format)) as f:
+                    expected = f.read()
+                # Few large chunks, and many small chunks queued behind
+                # the processes
+                for max_chunk_size in (1 << 20, 500):
+                    count = convert_in_chunks([Format(format, None, 'data', pretty)], self.csv, 2, 1, max_chunk_size=max_chunk_size)
+                    self.assertEqual(count, 50)
+                    with open('data.{}'.format(format)) as f:
+                        self.assertEqual(f.read(), expected)
+
+    def test_convert_formats_in_chunks(self):
+        """Method to test that the chunks are validated once and converted to every format"""
+        formats = ('json', 'xml', 'jsonl')
+        schema = dict((field, {'type': 'string'}) for field in ('name', 'address', 'contact', 'phone', 'uri'))
+        schema['stars'] = {'type': 'integer', 'max': 3}
+        rows = [row for row in read_chunk(self.csv, '', 0, os.path.getsize(self.csv)) if int(row['stars']) <= 3]
+        for format in formats:
+            Format(format, rows, 'serial').convert_data()
+        rejected = []
+        count = convert_in_chunks([Format(format, None, 'data') for format in formats], self.csv, 2, 1, schema=schema, max_chunk_size=500, rejected=rejected)
+        self.assertEqual(count, 50)
+        self.assertEqual(rejected, [i for i in range(50) if i % 6 > 3])
+        for format in formats:
+            with open('serial.{}'.format(format)) as f, open('data.{}'.format(format)) as g:
+                self.assertEqual(g.read(), f.read())
+
+    def test_quote_in_field(self):
+        """Method to test that quotes inside unquoted fields do not open a quoted field"""
+        rows = ['name,address,stars,contact,phone,uri']
+        for i in range(50):
+            rows.append('tv-{0},24" monitor,{1},Dr. "Who,1,http://a.com/{0}'.format(i, i % 6))
+            rows.append('Jürgen-{0},"{0} Lowe Knoll,\n""East"" Maxine, WA",{1},Dr. Sinda Wyman,1-270-665-9933,http://www.paucek.com/{0}'.format(i, i % 6))
+        with open(self.csv, 'w') as f:
+            f.write('\n'.join(rows))
+        with open(self.csv, 'rb') as f:
+            expected = list(csv.DictReader(f, encoding='utf-8'))
+        self.assertEqual(len(expected), 100)
+        for chunks in (2, 8, 64):
+            header, ranges = split_csv(self.csv, chunks, 1)
+            self.assertEqual(len(ranges), chunks)
+            rows = []
+            for start, end in ranges:
+                rows.extend(read_chunk(self.csv, header, start, end))
+            self.assertEqual(rows, expected)
+
+    def test_raise_csv_exception(self):
+        """Method to check if CSVNotFound exception is raised when the CSV is not Found"""
+        self.assertRaises(CSVNotFound, split_csv, 'unknown.csv', 4)
@@ -0,0 +1,60 @@
+#coding: utf-8
+import unittest
+from cStringIO import StringIO
+import unicodecsv as csv
+from converttool.columns import ColumnTypes, iter_columns, project_schema
+
+CSV = '''name,address,stars,contact,phone,zip
+Jürgen,"63847 Lowe Knoll,
+East Maxine",5,Dr. Sinda Wyman,1-270-665-9933,01234
+Zoë,Mühlenweg 2,4.5,,555,98101
+
+short,row
+'''
+
+class TestColumns(unittest.TestCase):
+    """Tests for the projection and the types of the columns"""
+
+    def read(self):
+        """Read the test csv with unicodecsv"""
+        return list(csv.DictReader(StringIO(CSV), encoding='utf-8'))
+
+    def test_iter_columns(self):
+        """Method to test that the projected rows are the rows of unicodecsv with fewer keys"""
+        columns = [u'stars', u'name', u'zip']
+        rows = list(iter_columns(StringIO(CSV), columns))
+        expected = [dict((column, row[column]) for column in columns) for row in self.read()]
+        self.assertEqual(rows, expected)
+        self.assertEqual(rows[0][u'name'], 'Jürgen'.decode('utf-8'))
+        self.assertEqual(rows[2][u'stars'], None)
+        fieldnames = [u'name', u'address', u'stars', u'contact', u'phone', u'zip']
+        lines = StringIO(CSV)
+        lines.readline()
+        self.assertEqual(list(iter_columns(lines, columns, fieldnames)), expected)
+
+    def test_infer(self):
+        """Method to test the types inferred from the rows and the schema"""
+        fieldnames = [u'name', u'address', u'stars', u'contact', u'phone', u'zip']
+        types = ColumnTypes.infer(self.read(), fieldnames)
+        self.assertEqual(types.types, {u'name': 'string', u'address': 'string', u'stars': 'float',
+            u'contact': 'string', u'phone': 'string', u'zip': 'string'})
+        types = ColumnTypes.infer(self.read(), fieldnames, sample=1)
+        self.assertEqual(types.types[u'stars'], 'integer')
+        types = ColumnTypes.infer(self.read(), fieldnames, schema={u'phone': {'type': 'integer'}, u'stars': {'max': 5}})
+        self.assertEqual(types.types[u'phone'], 'integer')
+        self.assertEqual(types.types[u'stars'], 'float')
+
+    def test_convert(self):
+        """Method to test the conversion of the values to the types of their columns"""
+        types = ColumnTypes({u'stars': 'integer', u'name': 'string'})
+        rows = [{u'stars': u'5', u'name': u'5'}, {u'stars': u'', u'name': u''}, {u'stars': u'n/a'}, {u'name': None}]
+        self.assertEqual(list(types.convert(rows)), [{u'stars': 5, u'name': u'5'}, {u'stars': None, u'name': u''},
+            {u'stars': u'n/a'}, {u'name': None}])
+
+    def test_schema(self):
+        """Method to test that the types are added to the schema of the columns read"""
+        schema = {u'name': {'type': 'string'}, u'stars': {'max': 5}, u'phone': {'type': 'string'}}
+        schema = project_schema(schema, [u'name', u'stars'])
+        self.assertEqual(schema, {u'name': {'type': 'string'}, u'stars': {'max': 5}})
+        types = ColumnTypes({u'name': 'integer', u'stars': 'float'})
+        self.assertEqual(types.apply(schema), {u'name': {'type': 'string'}, u'stars': {'max': 5, 'type': 'float'}})
@@ -0,0 +1,85 @@
+import unittest
+import os
+import gzip
+import bz2
+import tempfile
+import shutil
+from converttool import compression
+from converttool.compression import CompressedSink, detect_compression, open_input, strip_extension
+from converttool.exceptions import *
+
+class TestCompression(unittest.TestCase):
+    """Class to test the compressed inputs and outputs of `converttool`"""
+
+    data = ''.join('{},row {}\n'.format(i, 'x' * (i % 50)) for i in range(20000))
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def compressed(self, name, streams):
+        """Method to write the data in compressed streams one after the other"""
+        name = os.path.join(self.tmpdir, name)
+        size = len(self.data) // streams
+        parts = [self.data[i * size:(i + 1) * size if i < streams - 1 else None] for i in range(streams)]
+        with open(name, 'wb') as f:
+            for part in parts:
+                if name.endswith('.gz'):
+                    with gzip.GzipFile(fileobj=f, mode='wb') as g:
+                        g.write(part)
+                else:
+                    f.write(bz2.compress(part))
+        return name
+
+    def test_detect_compression(self):
+        """Method to test that compressed files are detected from their first bytes"""
+        plain = os.path.join(self.tmpdir, 'plain.csv.gz')
+        with open(plain, 'w') as f:
+            f.write(self.data)
+        self.assertEqual(detect_compression(self.compressed('data.csv.gz', 1)), 'gzip')
+        self.assertEqual(detect_compression(self.compressed('data.csv.bz2', 1)), 'bz2')
+        self.assertEqual(detect_compression(plain), None)
+        self.assertEqual(detect_compression(os.path.join(self.tmpdir, 'missing.csv')), None)
+        self.assertEqual(strip_extension('data.csv.bz2'), 'data.csv')
+
+    def test_open_input(self):
+        """Method to test that compressed files are read line by line, across their streams"""
+        for name in ('data.csv.gz', 'data.csv.bz2'):
+            for streams in (1, 3):
+                f = open_input(self.compressed(name, streams), detect_compression(os.path.join(self.tmpdir, name)))
+                with f:
+                    lines = list(iter(f.readline, b''))
+                self.assertEqual(''.join(lines), self.data)
+                self.assertEqual(len(lines), 20000)
+
+    def test_compressed_sink(self):
+        """Method to test that what is written in a sink is compressed in order, in blocks"""
+        name = os.path.join(self.tmpdir, 'data.gz')
+        for threads in (1, 3):
+            with open(name, 'wb') as f:
+                with CompressedSink(f, 'gzip', threads=threads, block_size=4096) as sink:
+                    for line in self.data.splitlines(True):
+                        sink.write(line)
+            self.assertEqual(gzip.GzipFile(name).read(), self.data)
+        # Appended outputs are read as another stream
+        with open(name, 'ab') as f:
+            with CompressedSink(f, 'gzip', block_size=4096) as sink:
+                sink.write(self.data)
+        with open_input(name, 'gzip') as f:
+            self.assertEqual(f.read(), self.data * 2)
+        with open(name, 'wb') as f:
+            with CompressedSink(f, 'bz2', block_size=4096) as sink:
+                sink.write(self.data)
+        self.assertEqual(bz2.BZ2File(name).read(), self.data)
+
+    def test_xz_not_supported(self):
+        """Method to test that xz raises CompressionNotSupported without lzma"""
+        lzma, compression.lzma = compression.lzma, None
+        try:
+            with open(os.path.join(self.tmpdir, 'data.xz'), 'wb') as f:
+                self.assertRaises(CompressionNotSupported, CompressedSink, f, 'xz')
+            self.assertRaises(CompressionNotSupported, compression.check_compression, 'xz')
+        finally:
+            compression.lzma = lzma
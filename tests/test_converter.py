@@ -3,7 +3,10 @@ import unittest
 import os
 import json
 import tempfile
+import shutil
+from converttool import validate
 from converttool.converter import Converter
+from converttool.incremental import Checkpoint
 from converttool.exceptions import *
 from xml.etree import ElementTree as ET
 
@@ -15,6 +18,12 @@ class TestConverter(unittest.TestCase):
 
     def setUp(self):
         """Setup test data if necessary"""
+        # Rows are only validated with the schemas of the tests
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        self.addCleanup(setattr, validate, 'CONFIG_DIR', validate.CONFIG_DIR)
+        self.addCleanup(setattr, validate, 'BASE_DIR', validate.BASE_DIR)
+        validate.CONFIG_DIR = validate.BASE_DIR = config_dir
         self.csv = os.path.join(self.tmpdir, 'test.csv')
         test_csv = '''name,address,stars,contact,phone,uri
 Jürgen-Gehringer,"63847 Lowe Knoll, East Maxine, WA 97030-4876",5,Dr. Sinda Wyman,1-270-665-9933x1626,http://www.paucek.com/search.htm'''
@@ -27,6 +36,10 @@ Jürgen-Gehringer,"63847 Lowe Knoll, East Maxine, WA 97030-4876",5,Dr. Sinda Wym
             os.remove('data.json')
         if os.path.exists('data.xml'):
             os.remove('data.xml')
+        if os.path.exists('data.jsonl'):
+            os.remove('data.jsonl')
+        if os.path.exists('data.rejects.csv'):
+            os.remove('data.rejects.csv')
 
     def test_converter_parameters(self):
         """Method to test if the converter is setup with the right params"""
@@ -92,3 +105,361 @@ Jürgen-Gehringer,"63847 Lowe Knoll, East Maxine, WA 97030-4876",5,Dr. Sinda Wym
         """Method to test get_total_data method of Converter"""
         c = Converter(self.csv, 'json', 'data', True)
         self.assertEqual(c.get_total_data(), 1)
+
+    def test_stream_data(self):
+        """Method to test that streaming does not load the csv in memory"""
+        c = Converter(self.csv, ('json',), 'data', True, stream=True)
+        self.assertFalse(isinstance(c.data, list))
+        self.assertEqual(c.get_total_data(), 0)
+        c.convert()
+        self.assertEqual(c.get_total_data(), 1)
+        with open('data.json') as f:
+            self.assertEqual(len(json.load(f)), 1)
+
+    def test_stream_output(self):
+        """Method to test that streaming writes the same output as the default mode"""
+        for format in ('json', 'xml'):
+            Converter(self.csv, (format,), 'data', True).convert()
+            with open('data.{}'.format(format)) as f:
+                expected = f.read()
+            Converter(self.csv, (format,), 'data', True, stream=True).convert()
+            with open('data.{}'.format(format)) as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_stream_raise_csv_exception(self):
+        """Method to check if CSVNotFound is raised when streaming a missing csv"""
+        self.assertRaises(CSVNotFound, Converter, 'unknown.csv', 'xml', 'data', True, stream=True)
+
+    def test_fan_out(self):
+        """Method to test that the thread and process executors write the same output as serial"""
+        formats = ('json', 'xml', 'jsonl')
+        Converter(self.csv, formats, 'data', True).convert()
+        expected = {}
+        for format in formats:
+            with open('data.{}'.format(format)) as f:
+                expected[format] = f.read()
+        for executor in ('thread', 'process'):
+            for workers in (None, 2):
+                c = Converter(self.csv, formats, 'data', True, stream=True, executor=executor, workers=workers)
+                c.convert()
+                self.assertEqual(c.get_total_data(), 1)
+                for format in formats:
+                    with open('data.{}'.format(format)) as f:
+                        self.assertEqual(f.read(), expected[format])
+
+    def test_fan_out_long_rows(self):
+        """Method to test that the keys of rows longer than the header keep their order in the processes"""
+        with open(self.csv, 'w') as f:
+            f.write('name,stars\nAnna,3\nOtto,4,extra,values\n')
+        formats = ('json', 'xml')
+        for stream in (False, True):
+            Converter(self.csv, formats, 'data', stream=stream).convert()
+            expected = {}
+            for format in formats:
+                with open('data.{}'.format(format)) as f:
+                    expected[format] = f.read()
+            self.assertIn('"extra"', expected['json'])
+            for executor in ('thread', 'process'):
+                Converter(self.csv, formats, 'data', stream=stream, executor=executor).convert()
+                for format in formats:
+                    with open('data.{}'.format(format)) as f:
+                        self.assertEqual(f.read(), expected[format])
+
+    def test_fan_out_formatter_not_found(self):
+        """Method to test that errors of a formatter are raised by the fan out"""
+        for executor in ('thread', 'process'):
+            c = Converter(self.csv, ('json', 'bson'), 'data', True, executor=executor)
+            self.assertRaises(FormatterNotFound, c.convert)
+
+    def get_schema(self, **rules):
+        """Method to return a schema of the test csv with extra rules for some fields"""
+        schema = dict((field, {'type': 'string'}) for field in ('name', 'address', 'stars', 'contact', 'phone', 'uri'))
+        schema.update(rules)
+        return schema
+
+    def test_validation_rejects(self):
+        """Method to test that invalid rows are dropped and written in the reject file"""
+        schema = self.get_schema(stars={'type': 'integer', 'max': 4})
+        for options in ({}, {'stream': True}, {'jobs': 2}, {'executor': 'thread'}):
+            c = Converter(self.csv, ('json',), 'data', True, schema=schema, **options)
+            c.convert()
+            self.assertEqual(c.get_total_data(), 1)
+            self.assertEqual(c.get_total_rejected(), 1)
+            with open('data.json') as f:
+                self.assertEqual(json.load(f), [])
+            with open('data.rejects.csv') as f:
+                rejects = f.read().splitlines()
+            self.assertEqual(rejects[0], 'name,address,stars,contact,phone,uri,errors')
+            self.assertTrue(rejects[1].endswith(',5,Dr. Sinda Wyman,1-270-665-9933x1626,http://www.paucek.com/search.htm,stars: max value is 4'))
+
+    def test_validation_once(self):
+        """Method to test that the rows are validated once for all the formats, in every mode"""
+        with open(self.csv, 'a') as f:
+            f.write('\nAnna,"1 Main St",3,Dr. Who,123,http://a.com\nOtto,"2 Main St",7,Dr. No,456,http://b.com\nIda,"3 Main St",1,Dr. Oz,789,http://c.com\n')
+        schema = self.get_schema(stars={'type': 'integer', 'max': 4})
+        formats = ('json', 'xml', 'jsonl')
+        validated = []
+        iter_batches = validate.Validate.iter_batches
+
+        def count(self, batch_size=1024):
+            for row, errors in iter_batches(self, batch_size):
+                validated.append(row)
+                yield row, errors
+
+        self.addCleanup(setattr, validate.Validate, 'iter_batches', iter_batches)
+        validate.Validate.iter_batches = count
+        Converter(self.csv, formats, 'data', schema=schema).convert()
+        expected = {}
+        for format in formats + ('rejects.csv',):
+            with open('data.{}'.format(format)) as f:
+                expected[format] = f.read()
+        self.assertEqual(len(expected['rejects.csv'].splitlines()), 3)
+        # Chunks are validated in the pool, and the valid rows are in the
+        # order of their names
+        for options in ({'stream': True}, {'stream': True, 'workers': 1}, {'jobs': 2}, {'jobs': 2, 'sort_key': 'name'},
+                {'executor': 'thread', 'workers': 2}, {'incremental': True}):
+            del validated[:]
+            c = Converter(self.csv, formats, 'data', schema=schema, **options)
+            c.convert()
+            self.assertEqual(len(validated), 0 if options == {'jobs': 2} else 4)
+            self.assertEqual(c.get_total_data(), 4)
+            self.assertEqual(c.get_total_rejected(), 2)
+            for format in formats + ('rejects.csv',):
+                with open('data.{}'.format(format)) as f:
+                    self.assertEqual(f.read(), expected[format])
+        for format in formats:
+            os.remove('data.{}.checkpoint'.format(format))
+
+    def test_validation_strict(self):
+        """Method to test that ValidationError is raised on the first invalid row in strict mode"""
+        schema = self.get_schema(stars={'type': 'integer', 'max': 4})
+        self.assertRaises(ValidationError, Converter, self.csv, ('json',), 'data', True, strict=True, schema=schema)
+        for options in ({'stream': True}, {'jobs': 2}, {'stream': True, 'executor': 'process'}):
+            c = Converter(self.csv, ('json',), 'data', True, strict=True, schema=schema, **options)
+            self.assertRaises(ValidationError, c.convert)
+        c = Converter(self.csv, ('json',), 'data', True, strict=True, schema=self.get_schema(stars={'type': 'integer'}))
+        c.convert()
+        self.assertEqual(c.get_total_rejected(), 0)
+        self.assertFalse(os.path.exists('data.rejects.csv'))
+
+    def test_sort_key(self):
+        """Method to test that in memory and streamed sorts write the same output"""
+        with open(self.csv, 'a') as f:
+            f.write('\nAnna,"1 Main St",10,Dr. Who,123,http://a.com\nOtto,"2 Main St",,Dr. No,456,http://b.com')
+        c = Converter(self.csv, ('json', 'xml'), 'data', sort_key='stars')
+        self.assertEqual([row['stars'] for row in c.data], ['5', '10', ''])
+        c.convert()
+        expected = {}
+        for format in ('json', 'xml'):
+            with open('data.{}'.format(format)) as f:
+                expected[format] = f.read()
+        for options in ({'stream': True}, {'stream': True, 'sort_memory': 0}, {'jobs': 2}):
+            for formats in (('json',), ('json', 'xml')):
+                Converter(self.csv, formats, 'data', sort_key='stars', **options).convert()
+                for format in formats:
+                    with open('data.{}'.format(format)) as f:
+                        self.assertEqual(f.read(), expected[format])
+
+    def test_columns(self):
+        """Method to test that only the columns given are read, in every mode"""
+        c = Converter(self.csv, ('json',), 'data', columns=['name', 'stars'])
+        self.assertEqual([dict(row) for row in c.data], [{'name': u'J\xfcrgen-Gehringer', 'stars': '5'}])
+        for options in ({'stream': True}, {'jobs': 2}, {'reader': 'mmap'}, {'jobs': 2, 'reader': 'mmap'}):
+            Converter(self.csv, ('json',), 'data', columns=['name', 'stars'], **options).convert()
+            with open('data.json') as f:
+                self.assertEqual(json.load(f), [{'name': u'J\xfcrgen-Gehringer', 'stars': '5'}])
+        self.assertRaises(ColumnNotFound, Converter, self.csv, 'json', 'data', columns=['name', 'url'])
+        self.assertRaises(SortKeyNotFound, Converter, self.csv, 'json', 'data', columns=['name'], sort_key='stars')
+
+    def test_compression(self):
+        """Method to test that compressed csvs are read and outputs compressed, in every mode"""
+        import gzip
+        with open(self.csv) as f, gzip.open(self.csv + '.gz', 'wb') as g:
+            g.write(f.read())
+        try:
+            expected = [{u'name': u'J\xfcrgen-Gehringer', u'address': u'63847 Lowe Knoll, East Maxine, WA 97030-4876', u'stars': u'5',
+                    u'contact': u'Dr. Sinda Wyman', u'phone': u'1-270-665-9933x1626', u'uri': u'http://www.paucek.com/search.htm'}]
+            for options in ({}, {'stream': True}, {'jobs': 2}, {'reader': 'mmap'}, {'executor': 'thread'}, {'incremental': True}):
+                Converter(self.csv + '.gz', ('json',), 'data', **options).convert()
+                with open('data.json') as f:
+                    self.assertEqual(json.load(f), expected)
+                Converter(self.csv, ('json', 'xml'), 'data', compress='gzip', **options).convert()
+                with gzip.open('data.json.gz') as f:
+                    self.assertEqual(json.load(f), expected)
+                with gzip.open('data.xml.gz') as f:
+                    ET.fromstring(f.read())
+        finally:
+            os.remove(self.csv + '.gz')
+            for name in ('data.json.gz', 'data.xml.gz'):
+                if os.path.exists(name):
+                    os.remove(name)
+
+    def test_compression_not_supported(self):
+        """Method to test that xz without lzma fails before the outputs are opened"""
+        from converttool import compression
+        from converttool.formats import Format
+        lzma, compression.lzma = compression.lzma, None
+        try:
+            with open('data.json.xz', 'w') as f:
+                f.write('previous output')
+            self.assertRaises(CompressionNotSupported, Converter, self.csv, ('json',), 'data', compress='xz')
+            self.assertRaises(CompressionNotSupported, Format('json', [], 'data', compress='xz').find_format_class)
+            with open('data.json.xz') as f:
+                self.assertEqual(f.read(), 'previous output')
+        finally:
+            compression.lzma = lzma
+            os.remove('data.json.xz')
+
+    def test_infer_types(self):
+        """Method to test that values are converted to the inferred types, and checked by the validation"""
+        with open(self.csv, 'a') as f:
+            f.write('\nAnna,"1 Main St",,Dr. Who,123,http://a.com\nOtto,"2 Main St",many,Dr. No,456,http://b.com')
+        c = Converter(self.csv, ('json',), 'data', infer_types=True, infer_sample=2)
+        self.assertEqual(c.types.types['stars'], 'integer')
+        self.assertEqual(c.types.types['phone'], 'string')
+        self.assertEqual([row['stars'] for row in c.data], [5, None, 'many'])
+        schema = self.get_schema()
+        del schema['stars']['type']
+        for options in ({}, {'stream': True}, {'jobs': 2}):
+            c = Converter(self.csv, ('json',), 'data', schema=schema, infer_types=True, infer_sample=2, **options)
+            c.convert()
+            self.assertEqual(c.get_total_rejected(), 1)
+            with open('data.json') as f:
+                self.assertEqual([row['stars'] for row in json.load(f)], [5, None])
+
+    def test_raise_sort_key_exception(self):
+        """Method to check if SortKeyNotFound is raised when the sort key is not a column"""
+        self.assertRaises(SortKeyNotFound, Converter, self.csv, 'json', 'data', sort_key='url')
+
+    def test_stats(self):
+        """Method to test the stages measured with stats"""
+        schema = self.get_schema()
+        c = Converter(self.csv, ('json', 'xml'), 'data', schema=schema, sort_key='stars', stats=True)
+        c.convert()
+        stages = dict((stage.name, stage) for stage in c.metrics.stages)
+        self.assertEqual([stage.name for stage in c.metrics.stages], ['read', 'decode', 'validate', 'table', 'sort', 'json', 'xml'])
+        self.assertEqual(stages['read'].bytes_in, os.path.getsize(self.csv))
+        self.assertEqual(stages['json'].bytes_out, os.path.getsize('data.json'))
+        self.assertEqual(stages['xml'].rows, 1)
+        c = Converter(self.csv, ('json', 'xml'), 'data', stream=True, stats=True)
+        c.convert()
+        self.assertEqual([stage.name for stage in c.metrics.stages], ['read', 'decode', 'json|xml'])
+        self.assertEqual([stage.rows for stage in c.metrics.stages], [2, 1, 1])
+        self.assertEqual(Converter(self.csv, ('json',), 'data').metrics, None)
+
+    def test_profile(self):
+        """Method to test that the parsing and every format are profiled on their own"""
+        c = Converter(self.csv, ('json', 'xml'), 'data', profile='cpu')
+        c.convert()
+        self.assertEqual([stage for stage, report in c.profiler.reports], ['parse_csv', 'json', 'xml'])
+        # Formats converted at once are profiled in their thread or process
+        for executor in ('thread', 'process'):
+            for stream in (False, True):
+                c = Converter(self.csv, ('json', 'xml'), 'data', profile='cpu', executor=executor, stream=stream)
+                c.convert()
+                # Streamed rows are parsed until the formats are done
+                reports = dict(c.profiler.reports)
+                self.assertEqual(sorted(reports), ['json', 'parse_csv', 'xml'])
+                self.assertIn('encode_batch', reports['json'])
+                self.assertIn('encode_batch', reports['xml'])
+        # Validation is profiled apart from the parsing pulling its rows
+        for stream in (False, True):
+            c = Converter(self.csv, ('json', 'xml'), 'data', profile='cpu', schema=self.get_schema(), stream=stream)
+            c.convert()
+            reports = dict(c.profiler.reports)
+            self.assertEqual(sorted(reports), ['json', 'parse_csv', 'validate', 'xml'])
+            self.assertIn('iter_valid_rows', reports['validate'])
+            self.assertNotIn('iter_valid_rows', reports['parse_csv'])
+        for stage in ('parse_csv', 'validate', 'json', 'xml'):
+            os.remove('data.{}.pstats'.format(stage))
+
+    def test_cache(self):
+        """Method to test that unchanged outputs are taken from the cache"""
+        cache_dir = tempfile.mkdtemp()
+        try:
+            c = Converter(self.csv, ('json', 'xml'), 'data', cache=True, cache_dir=cache_dir)
+            self.assertEqual(c.pending, ['json', 'xml'])
+            c.convert()
+            with open('data.json') as f:
+                expected = f.read()
+            os.remove('data.json')
+            c = Converter(self.csv, ('json', 'xml'), 'data', cache=True, cache_dir=cache_dir)
+            self.assertEqual(c.pending, [])
+            self.assertEqual(c.data, None)
+            c.convert()
+            self.assertEqual(c.get_total_data(), 1)
+            with open('data.json') as f:
+                self.assertEqual(f.read(), expected)
+            c = Converter(self.csv, ('json', 'xml'), 'data', pretty=True, cache=True, cache_dir=cache_dir)
+            self.assertEqual(c.pending, ['json', 'xml'])
+            c = Converter(self.csv, ('json',), 'data', cache=False, cache_dir=cache_dir)
+            self.assertEqual(c.pending, ['json'])
+            c.convert()
+            self.assertEqual(os.stat('data.json').st_nlink, 1)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_incremental(self):
+        """Method to test that rows added to the csv are added to the outputs"""
+        with open(self.csv, 'a') as f:
+            f.write('\nAnna,"1 Main St\nSpringfield",3,Dr. Who,123,http://a.com\nOtto,"2 Main')
+        formats = ('json', 'xml', 'jsonl')
+        try:
+            c = Converter(self.csv, formats, 'data', pretty=True, incremental=True)
+            c.convert()
+            self.assertEqual(c.get_total_data(), 2)
+            with open(self.csv, 'a') as f:
+                f.write(' St",,Dr. No,456,http://b.com\n')
+            c = Converter(self.csv, formats, 'data', pretty=True, incremental=True)
+            c.convert()
+            self.assertEqual(c.get_total_data(), 1)
+            outputs = {}
+            for format in formats:
+                with open('data.{}'.format(format)) as f:
+                    outputs[format] = f.read()
+                self.assertTrue(os.path.exists('data.{}.checkpoint'.format(format)))
+            Converter(self.csv, formats, 'data', pretty=True).convert()
+            for format in formats:
+                with open('data.{}'.format(format)) as f:
+                    self.assertEqual(f.read(), outputs[format])
+            # Outputs are rebuilt when the options changed
+            c = Converter(self.csv, formats, 'data', incremental=True)
+            c.convert()
+            self.assertEqual(c.get_total_data(), 3)
+        finally:
+            for format in formats:
+                os.remove('data.{}.checkpoint'.format(format))
+
+    def test_incremental_offsets(self):
+        """Method to test that outputs converted from different offsets are extended in a single pass"""
+        schema = self.get_schema(stars={'type': 'integer', 'max': 4})
+        formats = ('jsonl', 'xml', 'json')
+        try:
+            with open(self.csv, 'a') as f:
+                f.write('\nAnna,"1 Main St",3,Dr. Who,123,http://a.com\n')
+            Converter(self.csv, ('json',), 'data', schema=schema, incremental=True).convert()
+            with open(self.csv, 'a') as f:
+                f.write('Otto,"2 Main St",7,Dr. No,456,http://b.com\nIda,"3 Main St",1,Dr. Oz,789,http://c.com\n')
+            Converter(self.csv, ('json', 'xml'), 'data', schema=schema, incremental=True).convert()
+            with open(self.csv, 'a') as f:
+                f.write('Eve,"4 Main St",2,Dr. X,012,http://d.com\n')
+            # Jsonl is converted in full, and xml and json extended with
+            # the last row, in the same pass validating every row once
+            c = Converter(self.csv, formats, 'data', schema=schema, incremental=True)
+            c.convert()
+            self.assertEqual(c.get_total_data(), 5)
+            self.assertEqual(c.get_total_rejected(), 2)
+            with open('data.rejects.csv') as f:
+                self.assertEqual(len(f.read().splitlines()), 3)
+            outputs = {}
+            for format in formats:
+                with open('data.{}'.format(format)) as f:
+                    outputs[format] = f.read()
+            Converter(self.csv, formats, 'data', schema=schema).convert()
+            for format in formats:
+                with open('data.{}'.format(format)) as f:
+                    self.assertEqual(f.read(), outputs[format])
+            self.assertEqual(set(Checkpoint.load('data.{}'.format(format)).rows for format in formats), set([3]))
+        finally:
+            for format in formats:
+                os.remove('data.{}.checkpoint'.format(format))
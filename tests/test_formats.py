@@ -1,10 +1,33 @@
 import unittest
 import os
 import json
-from converttool.formats import Format
+from converttool.formats import Format, FormatWriter
 from converttool.exceptions import *
 from xml.etree import ElementTree as ET
 
+class FormatTSV(FormatWriter):
+    """Writer of tab separated values, written with the streaming protocol"""
+
+    appendable = True
+
+    batch_size = 2
+
+    batches = []
+
+    def open(self, sink):
+        FormatWriter.open(self, sink)
+        self.header = None
+
+    def encode_batch(self, rows):
+        FormatTSV.batches.append(len(rows))
+        lines = []
+        if self.header is None:
+            self.header = sorted(rows[0])
+            lines.append(u'\t'.join(self.header) + u'\n')
+        for row in rows:
+            lines.append(u'\t'.join(row[key] for key in self.header) + u'\n')
+        return lines
+
 class TestFormat(unittest.TestCase):
     """Class to test the `Format` class of `converttool module`"""
 
@@ -17,6 +40,8 @@ class TestFormat(unittest.TestCase):
             os.remove('data.json')
         if os.path.exists('data.xml'):
             os.remove('data.xml')
+        if os.path.exists('data.jsonl'):
+            os.remove('data.jsonl')
 
     def test_format_parameters(self):
         """Method to test if the Format class is setup with the right params"""
@@ -56,3 +81,163 @@ class TestFormat(unittest.TestCase):
         """Method to test if the exception is raised correctly when a form        at whose formatter class does not exists is passed to `Format`"""
         f = Format('bson', [{'a':'b', 'c':'d'}], 'data', True)
         self.assertRaises(FormatterNotFound, f.convert_data)
+
+    def test_register_format(self):
+        """Method to test that formats are resolved from the registry when they are used"""
+        from converttool import formats
+        self.assertEqual(formats.load_format_class('Json'), formats.FormatJSON)
+        formats.register_format('dump', 'converttool.formats:FormatJSONL')
+        formats.register_format('missing', 'converttool.nowhere:FormatMISSING')
+        try:
+            self.assertEqual(Format('dump', None).find_format_class(), formats.FormatJSONL)
+            self.assertRaises(FormatterNotFound, formats.load_format_class, 'missing')
+        finally:
+            del formats.FORMATS['DUMP']
+            del formats.FORMATS['MISSING']
+        self.assertRaises(FormatterNotFound, formats.load_format_class, 'dump')
+
+    def test_lazy_imports(self):
+        """Method to test that the command line only imports the conversion code to convert"""
+        import subprocess, sys
+        script = ('import sys; import converttool.app, converttool.formats; '
+                  'print sorted(m for m in sys.modules if m.split(".")[0] in ("cerberus", "simplejson", "multiprocessing") '
+                  'or m == "converttool.converter")')
+        output = subprocess.check_output([sys.executable, '-c', script], env=dict(os.environ, PYTHONPATH=os.getcwd()))
+        self.assertEqual(output.strip(), '[]')
+
+    def test_iter_json(self):
+        """Method to test that the streamed json is identical to `json.dump`"""
+        import simplejson
+        from converttool.formats import FormatJSON
+        rows = [{u'name': u'J\xfcrgen', u'address': u'Lowe Knoll,\nEast Maxine'}, {'a': 'b'}]
+        for data in (rows, rows[:1], []):
+            for pretty in (True, False):
+                expected = simplejson.dumps(data, indent=4 if pretty else None, ensure_ascii=False)
+                streamed = FormatJSON.dumps(iter(data), pretty)
+                self.assertEqual(streamed, expected)
+
+    def test_iter_xml(self):
+        """Method to test the streamed xml keeps the `root`/`item` structure"""
+        from converttool.formats import FormatXML
+        rows = [{u'name': u'J\xfcrgen & co', u'2': u''}]
+        self.assertEqual(FormatXML.dumps(iter(rows), False),
+                u'<?xml version="1.0" ?><root><item type="dict"><n2 type="str"/>'
+                u'<name type="str">J\xfcrgen &amp; co</name></item></root>')
+        self.assertEqual(FormatXML.dumps(iter(rows), True),
+                u'<?xml version="1.0" ?>\n<root>\n\t<item type="dict">\n\t\t<n2 type="str"/>\n'
+                u'\t\t<name type="str">J\xfcrgen &amp; co</name>\n\t</item>\n</root>\n')
+        self.assertEqual(FormatXML.dumps([], False), u'<?xml version="1.0" ?><root/>')
+
+    def test_xml_lists(self):
+        """Method to test that the values of rows longer than the header are written as `dicttoxml` did"""
+        from dicttoxml import dicttoxml
+        from xml.dom.minidom import parseString
+        from converttool.formats import FormatXML
+        row = {u'name': u'long', u'stars': u'3'}
+        row[None] = [u'a', u'', u'<b>&', 4, None]
+        rows = [{u'name': u'J', u'stars': u'5'}, row, {u'name': u'short', u'stars': None}]
+        dom = parseString(dicttoxml(rows))
+        self.assertEqual(FormatXML.dumps(iter(rows), False), dom.toxml())
+        self.assertEqual(FormatXML.dumps(iter(rows), True), dom.toprettyxml())
+
+    def test_json_templates(self):
+        """Method to test that rows encoded with the template of their header are identical to `json.dumps`"""
+        import simplejson
+        from converttool.formats import FormatJSON, FormatJSONL
+        rows = [{u'100%': u'J\xfcrgen "%s"', u'b': u'c\nd'}, {u'100%': u'', u'b': u'\xc3\xa9'.encode('latin-1')},
+                {u'100%': None, u'b': 3.5}, {u'b': 1, None: [u'e']}, {}]
+        for pretty in (True, False):
+            self.assertEqual(FormatJSON.dumps(iter(rows), pretty), simplejson.dumps(rows, indent=4 if pretty else None, ensure_ascii=False))
+        self.assertEqual(FormatJSONL.dumps(rows[:3]), u''.join(simplejson.dumps(row, ensure_ascii=False) + u'\n' for row in rows[:3]))
+
+    def test_buffered_writes(self):
+        """Method to test that writers write their output in buffers of `buffer_size` bytes"""
+        from converttool.formats import FormatJSON, FormatXML
+
+        class Sink(list):
+            write = list.append
+
+        rows = [{'a': str(i)} for i in range(1000)]
+        for format_class in (FormatJSON, FormatXML):
+            document = format_class.dumps(rows).encode('utf-8')
+            for buffer_size in (1 << 20, 1024):
+                sink = Sink()
+                writer = format_class(False, buffer_size)
+                writer.open(sink)
+                for i in range(0, len(rows), 10):
+                    writer.write_batch(rows[i:i + 10])
+                writer.close()
+                self.assertEqual(''.join(sink), document)
+                self.assertTrue(1 <= len(sink) <= len(document) // buffer_size + 1)
+                self.assertTrue(all(len(data) >= buffer_size for data in sink[:-1]))
+
+    def test_format_writer(self):
+        """Method to test that a writer registered from outside gets the rows in batches of its size"""
+        from converttool import formats
+        formats.register_format('tsv', 'test_formats:FormatTSV')
+        try:
+            rows = [{'a': str(i), 'b': u'\xe9'} for i in range(5)]
+            Format('tsv', iter(rows), 'data').convert_data()
+            Format('tsv', iter(rows[:1]), 'data', append=True).convert_data()
+            with open('data.tsv') as f:
+                self.assertEqual(f.read().decode('utf-8'), u'a\tb\n' + u''.join(u'{}\t\xe9\n'.format(i) for i in range(5)) + u'a\tb\n0\t\xe9\n')
+            self.assertEqual(FormatTSV.batches, [2, 2, 1, 1])
+            self.assertRaises(ConversionError, Format('tsv', iter(rows), 'data', extend=True).convert_data)
+        finally:
+            del formats.FORMATS['TSV']
+            os.remove('data.tsv')
+
+    def test_entry_points(self):
+        """Method to test that formats declared as entry points by installed packages are found"""
+        import tempfile, shutil, pkg_resources
+        from converttool import formats
+        path = tempfile.mkdtemp()
+        try:
+            info = os.path.join(path, 'converttool_tsv-1.0.egg-info')
+            os.mkdir(info)
+            with open(os.path.join(info, 'PKG-INFO'), 'w') as f:
+                f.write('Metadata-Version: 1.0\nName: converttool-tsv\nVersion: 1.0\n')
+            with open(os.path.join(info, 'entry_points.txt'), 'w') as f:
+                f.write('[converttool.tests]\ntsv = test_formats:FormatTSV\njson = test_formats:FormatTSV\n')
+            pkg_resources.working_set.add_entry(path)
+            formats.load_entry_points('converttool.tests')
+            self.assertEqual(formats.FORMATS['TSV'], 'test_formats:FormatTSV')
+            self.assertEqual(formats.load_format_class('tsv'), FormatTSV)
+            # Formats registered already are not replaced
+            self.assertEqual(formats.load_format_class('json'), formats.FormatJSON)
+        finally:
+            formats.FORMATS.pop('TSV', None)
+            shutil.rmtree(path)
+
+    def test_convert_data_jsonl(self):
+        """Method to test that json lines are written one row per line and can be appended"""
+        Format('jsonl', iter([{'a': 'b'}, {'c': 'd'}]), 'data').convert_data()
+        Format('jsonl', iter([{'e': 'f'}]), 'data', append=True).convert_data()
+        with open('data.jsonl') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows, [{'a': 'b'}, {'c': 'd'}, {'e': 'f'}])
+
+    def test_append_not_supported(self):
+        """Method to test that appending to a format that is not appendable raises ConversionError"""
+        f = Format('json', [{'a': 'b'}], 'data', append=True)
+        self.assertRaises(ConversionError, f.convert_data)
+
+    def test_extend_data(self):
+        """Method to test that extending an output writes the same document as converting all the rows"""
+        rows = [{'a': 'b'}, {'c': u'd\xe9'}, {'e': 'f'}]
+        for format in ('json', 'xml', 'jsonl'):
+            for pretty in (False, True):
+                for split in (0, 1, 2):
+                    Format(format, rows, 'data', pretty).convert_data()
+                    with open('data.{}'.format(format)) as f:
+                        expected = f.read()
+                    Format(format, rows[:split], 'data', pretty).convert_data()
+                    Format(format, rows[split:], 'data', pretty, extend=True).convert_data()
+                    with open('data.{}'.format(format)) as f:
+                        self.assertEqual(f.read(), expected)
+
+    def test_extend_not_a_document(self):
+        """Method to test that extending a file that is not a document raises ConversionError"""
+        with open('data.json', 'w') as f:
+            f.write('[{"a": "b"}')
+        self.assertRaises(ConversionError, Format('json', [{'c': 'd'}], 'data', extend=True).convert_data)
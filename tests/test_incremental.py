@@ -0,0 +1,68 @@
+#coding: utf-8
+import unittest
+import os
+import shutil
+import tempfile
+import hashlib
+from converttool.incremental import Checkpoint, PrefixHash, hash_prefix, hash_options
+
+class TestCheckpoint(unittest.TestCase):
+    """Tests for the Checkpoint Class"""
+
+    def setUp(self):
+        """Setup a csv and its output in a temporary directory"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv = os.path.join(self.tmpdir, 'test.csv')
+        self.output = os.path.join(self.tmpdir, 'data.json')
+        with open(self.csv, 'w') as f:
+            f.write('name,stars\nJürgen,5\n')
+        with open(self.output, 'w') as f:
+            f.write('[{"name": "J\\u00fcrgen", "stars": "5"}]')
+        self.header = hash_options(['name', 'stars'])
+        self.options = hash_options(False, None)
+        self.checkpoint = Checkpoint(os.path.getsize(self.csv), 1, self.header,
+                hash_prefix(self.csv, os.path.getsize(self.csv)), self.options, os.path.getsize(self.output))
+
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.tmpdir)
+
+    def test_save_load(self):
+        """Method to test that a checkpoint is kept next to its output"""
+        self.assertEqual(Checkpoint.load(self.output), None)
+        self.checkpoint.save(self.output)
+        self.assertTrue(os.path.exists(self.output + '.checkpoint'))
+        self.assertEqual(Checkpoint.load(self.output).__dict__, self.checkpoint.__dict__)
+
+    def test_matches(self):
+        """Method to test that rows added to the csv keep the checkpoint valid"""
+        with open(self.csv, 'a') as f:
+            f.write('Anna,3\n')
+        self.assertTrue(self.checkpoint.matches(self.csv, self.output, self.header, self.options))
+        self.assertFalse(self.checkpoint.matches(self.csv, self.output, self.header, hash_options(True, None)))
+        self.assertFalse(self.checkpoint.matches(self.csv, self.output, hash_options(['name']), self.options))
+
+    def test_prefix_hash(self):
+        """Method to test that the prefixes are hashed forward, and again from the start before the last one"""
+        with open(self.csv, 'a') as f:
+            f.write('Anna,3\nOtto,4\n')
+        with open(self.csv, 'rb') as f:
+            data = f.read()
+        prefix = PrefixHash(self.csv)
+        for offset in (0, 10, 21, len(data), 15):
+            self.assertEqual(prefix.hexdigest(offset), hashlib.sha1(data[:offset]).hexdigest())
+            self.assertEqual(prefix.position, offset)
+        self.assertEqual(prefix.hexdigest(21), hashlib.sha1(data[:21]).hexdigest())
+        self.assertEqual(prefix.position, 15)
+        self.assertTrue(self.checkpoint.matches(self.csv, self.output, self.header, self.options, prefix))
+
+    def test_changes(self):
+        """Method to test that changed rows or outputs invalidate the checkpoint"""
+        with open(self.output, 'a') as f:
+            f.write('\n')
+        self.assertFalse(self.checkpoint.matches(self.csv, self.output, self.header, self.options))
+        self.checkpoint.output_size += 1
+        self.assertTrue(self.checkpoint.matches(self.csv, self.output, self.header, self.options))
+        with open(self.csv, 'w') as f:
+            f.write('name,stars\nJürgen,4\n')
+        self.assertFalse(self.checkpoint.matches(self.csv, self.output, self.header, self.options))
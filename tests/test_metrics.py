@@ -0,0 +1,38 @@
+#coding: utf-8
+import unittest
+import time
+from converttool.metrics import Metrics
+
+class TestMetrics(unittest.TestCase):
+    """Tests for the Metrics Class"""
+
+    def slow(self, rows, delay):
+        """Generator of rows taking `delay` seconds for every row"""
+        for row in rows:
+            time.sleep(delay)
+            yield row
+
+    def test_iterate(self):
+        """Method to test that stages count their rows and exclude the time of their source"""
+        m = Metrics(['read', 'parse'])
+        lines = m.iterate('read', self.slow(range(5), 0.01))
+        rows = m.iterate('parse', self.slow(lines, 0.002), source='read')
+        self.assertEqual(list(rows), range(5))
+        read, parse = m.stages
+        self.assertEqual((read.name, read.rows), ('read', 5))
+        self.assertEqual((parse.name, parse.rows), ('parse', 5))
+        self.assertTrue(read.wall >= 0.05)
+        self.assertTrue(0.01 <= parse.wall < 0.04)
+        self.assertTrue(parse.peak_memory > 0)
+
+    def test_measure(self):
+        """Method to test a stage consuming the rows of another one"""
+        m = Metrics()
+        rows = m.iterate('read', self.slow(range(3), 0.01))
+        with m.measure('json', source='read') as stage:
+            list(rows)
+        self.assertEqual([s.name for s in m.stages], ['read', 'json'])
+        self.assertEqual(stage.rows, 3)
+        self.assertTrue(stage.wall < 0.03)
+        self.assertEqual(m.as_dict()['stages'][1]['name'], 'json')
+        self.assertEqual(len(m.format_table().splitlines()), 3)
@@ -0,0 +1,108 @@
+#coding: utf-8
+import unittest
+import os
+import tempfile
+import unicodecsv as csv
+from converttool import mmapreader
+from converttool.mmapreader import MmapReader
+from converttool.chunks import split_csv
+
+class TestMmapReader(unittest.TestCase):
+    """Tests for the MmapReader Class"""
+
+    tmpdir = tempfile.gettempdir()
+
+    def setUp(self):
+        """Setup test data with unicode, quoted newlines, quotes in unquoted fields and ragged rows"""
+        self.csv = os.path.join(self.tmpdir, 'test_mmap.csv')
+        rows = ['name,address,stars,contact,phone,uri\r']
+        for i in range(200):
+            rows.append('Jürgen-{0},"{0} Lowe Knoll,\n""East"" Maxine, WA",{1},Dr. Sinda Wyman,1-270-665-9933,http://www.paucek.com/{0}'.format(i, i % 6))
+            rows.append('Zoë-{0},Mühlenweg {0},{1},"Dr. Ørsted",555,http://a.com/{0}\r'.format(i, i % 6))
+            rows.append('tv-{0},24" monitor,{1},"Dr." Who,"5""5",http://a.com/{0}'.format(i, i % 6))
+        rows.extend(['', 'short,row', 'long,row,1,2,3,4,5,6', 'last,"open'])
+        self.write('\n'.join(rows))
+
+    def tearDown(self):
+        """Remove the test data"""
+        os.remove(self.csv)
+        mmapreader.BLOCK_SIZE = 1 << 20
+
+    def write(self, content):
+        """Write the test csv"""
+        with open(self.csv, 'w') as f:
+            f.write(content)
+
+    def read(self):
+        """Read the test csv with unicodecsv"""
+        with open(self.csv, 'rb') as f:
+            return list(csv.DictReader(f, encoding='utf-8'))
+
+    def test_rows(self):
+        """Method to test that the rows are the rows of unicodecsv, in small and large blocks"""
+        expected = self.read()
+        for block_size in (1 << 20, 64, 1):
+            mmapreader.BLOCK_SIZE = block_size
+            with MmapReader(self.csv) as reader:
+                rows = list(reader.iter_rows())
+                self.assertEqual(reader.offset, reader.size)
+            self.assertEqual(rows, expected)
+            self.assertEqual([row.keys() for row in rows], [row.keys() for row in expected])
+
+    def test_ranges(self):
+        """Method to test reading the rows of the chunks of the csv"""
+        for chunks in (8, 64):
+            header, ranges = split_csv(self.csv, chunks, 1)
+            rows = []
+            with MmapReader(self.csv) as reader:
+                self.assertEqual(reader.header_end, len(header))
+                for start, end in ranges:
+                    rows.extend(reader.iter_rows(start, end))
+            self.assertEqual(rows, self.read())
+
+    def test_record_end(self):
+        """Method to test that every record boundary is found, and only them"""
+        # The csv module reads the lines of a record one by one, so the
+        # file is at the end of the record once it is parsed
+        boundaries = []
+        with open(self.csv, 'rb') as f:
+            data = f.read()
+            f.seek(0)
+            for values in csv.reader(iter(f.readline, '')):
+                boundaries.append(f.tell())
+        # The last record does not end with a newline
+        boundaries.pop()
+        offset = 0
+        for boundary in boundaries:
+            self.assertEqual(mmapreader.record_end(data, offset, len(data)), boundary)
+            offset = boundary
+        self.assertEqual(mmapreader.record_end(data, offset, len(data)), -1)
+        self.assertEqual(mmapreader.last_record_end(data, 0, len(data)), boundaries[-1])
+        for target in range(0, len(data), 97):
+            expected = min([boundary for boundary in boundaries if boundary > target] or [-1])
+            self.assertEqual(mmapreader.record_end(data, 0, len(data), target), expected)
+
+    def test_complete(self):
+        """Method to test that a last record without a newline is left out"""
+        for block_size in (1 << 20, 64):
+            mmapreader.BLOCK_SIZE = block_size
+            with MmapReader(self.csv) as reader:
+                rows = list(reader.iter_rows(complete=True))
+                self.assertEqual(rows, self.read()[:-1])
+                with open(self.csv) as f:
+                    self.assertTrue(f.read().endswith('\n' + 'last,"open'))
+                self.assertEqual(reader.offset, reader.size - len('last,"open'))
+
+    def test_fields(self):
+        """Method to test that only the columns read are in the rows"""
+        with MmapReader(self.csv, fields=['stars', 'name']) as reader:
+            rows = list(reader.iter_rows())
+        self.assertEqual(rows[1], {'stars': u'0', 'name': 'Zoë-0'.decode('utf-8')})
+        self.assertEqual(rows[-3], {'stars': None, 'name': u'short'})
+
+    def test_empty(self):
+        """Method to test empty files and files with a header only"""
+        for content in ('', 'name,stars\n'):
+            self.write(content)
+            with MmapReader(self.csv) as reader:
+                self.assertEqual(list(reader.iter_rows()), [])
@@ -0,0 +1,78 @@
+#coding: utf-8
+import unittest
+import os
+import tempfile
+from converttool.profiling import Profiler
+
+class TestProfiler(unittest.TestCase):
+    """Tests for the Profiler Class"""
+
+    def setUp(self):
+        """Setup test data"""
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        """Remove the profiles"""
+        os.chdir(self.cwd)
+        for name in os.listdir(self.tmpdir):
+            os.remove(os.path.join(self.tmpdir, name))
+        os.rmdir(self.tmpdir)
+
+    def work(self):
+        """Function showing up in the profiles"""
+        return [unicode(i) for i in range(10000)]
+
+    def test_cpu(self):
+        """Method to test that every stage has its own pstats file and report"""
+        p = Profiler('cpu', 'data', top=5)
+        with p.profile('parse_csv'):
+            self.work()
+        with p.profile('json|xml'):
+            pass
+        self.assertEqual([stage for stage, report in p.reports], ['parse_csv', 'json|xml'])
+        self.assertTrue(os.path.exists('data.parse_csv.pstats'))
+        self.assertTrue(os.path.exists('data.json-xml.pstats'))
+        self.assertTrue('(work)' in p.reports[0][1])
+        self.assertFalse('(work)' in p.reports[1][1])
+        self.assertTrue(p.format_reports().startswith('=== parse_csv ==='))
+
+    def read(self):
+        """Generator of rows showing up in the profile of the stage pulling them"""
+        for i in range(3):
+            yield self.work()
+
+    def check(self, rows):
+        """Generator of a stage profiled on its own"""
+        for row in rows:
+            if len(row) == len(set(row)):
+                yield row
+
+    def test_iterate(self):
+        """Method to test that a stage producing rows is profiled apart from the stage pulling them"""
+        p = Profiler('cpu', 'data', top=50)
+        with p.profile('parse_csv'):
+            rows = list(p.iterate('validate', self.read(), self.check))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([stage for stage, report in p.reports], ['validate', 'parse_csv'])
+        self.assertTrue(os.path.exists('data.validate.pstats'))
+        self.assertTrue('(check)' in p.reports[0][1])
+        self.assertFalse('(work)' in p.reports[0][1])
+        self.assertTrue('(work)' in p.reports[1][1])
+        self.assertFalse('(check)' in p.reports[1][1])
+        p = Profiler('mem', 'data')
+        self.assertEqual(len(list(p.iterate('validate', self.read(), self.check))), 3)
+        self.assertEqual(p.reports, [])
+
+    def test_mem(self):
+        """Method to test the memory report of a stage"""
+        p = Profiler('mem', 'data')
+        with p.profile('json'):
+            self.work()
+        self.assertEqual(len(p.reports), 1)
+        self.assertTrue('memory' in p.reports[0][1] or 'RSS' in p.reports[0][1])
+
+    def test_unknown_profile(self):
+        """Method to test that only cpu and mem profiles are supported"""
+        self.assertRaises(ValueError, Profiler, 'disk')
@@ -0,0 +1,66 @@
+#coding: utf-8
+import unittest
+import pickle
+from array import array
+from converttool.rowtable import RowTable
+
+FIELDNAMES = ['name', 'address', 'stars', 'contact', 'phone', 'uri']
+
+class TestRowTable(unittest.TestCase):
+    """Tests for the RowTable Class"""
+
+    def setUp(self):
+        """Setup test data"""
+        self.rows = [
+            dict(zip(FIELDNAMES, [u'Jürgen', u'Lowe Knoll', u'5', u'Dr. Wyman', u'007', u'http://a.com'])),
+            dict(zip(FIELDNAMES, [u'Anna', u'Lowe Knoll', u'3', u'Dr. Wyman', u'123', u'http://b.com'])),
+            dict(zip(FIELDNAMES, [u'Otto', u'East Maxine', u'12', u'Dr. Smith', u'456', u'http://c.com'])),
+        ]
+        self.table = RowTable(FIELDNAMES, self.rows)
+
+    def test_rows(self):
+        """Method to test that the rows read back are the dictionaries that were added"""
+        self.assertEqual(len(self.table), 3)
+        for row, expected in zip(self.table, self.rows):
+            self.assertEqual(row, expected)
+            self.assertEqual(row.keys(), expected.keys())
+            self.assertEqual(row.items(), expected.items())
+            self.assertEqual(row['stars'], expected['stars'])
+            self.assertTrue('name' in row)
+        self.assertEqual(self.table[-1], self.rows[-1])
+
+    def test_columns(self):
+        """Method to test that integer columns are typed and repeated strings are shared"""
+        self.assertTrue(isinstance(self.table.columns[FIELDNAMES.index('stars')], array))
+        # '007' is not written back the same way as an integer
+        self.assertFalse(isinstance(self.table.columns[FIELDNAMES.index('phone')], array))
+        self.assertEqual(list(self.table.column('phone')), [u'007', u'123', u'456'])
+        address = self.table.columns[FIELDNAMES.index('address')]
+        self.assertTrue(address[0] is address[1])
+
+    def test_sort(self):
+        """Method to test sorting the table on a column"""
+        self.table.sort(field='stars')
+        self.assertEqual([row['name'] for row in self.table], [u'Anna', self.rows[0]['name'], u'Otto'])
+        self.table.sort(field='name', reverse=True)
+        self.assertEqual([row['stars'] for row in self.table], [u'12', u'5', u'3'])
+
+    def test_extra_values(self):
+        """Method to test that the values of rows longer than the header are kept"""
+        # Built the way csv.DictReader builds long rows
+        long_row = dict(zip(FIELDNAMES, [self.rows[1][field] for field in FIELDNAMES]))
+        long_row[None] = [u'extra', u'values']
+        self.table = RowTable(FIELDNAMES, [self.rows[0], long_row, self.rows[2]])
+        rows = list(self.table)
+        self.assertEqual(rows, [self.rows[0], long_row, self.rows[2]])
+        self.assertEqual(rows[1].keys(), long_row.keys())
+        self.assertEqual(self.table[1], long_row)
+        self.table.sort(field='stars')
+        self.assertEqual(self.table[0], long_row)
+        self.assertEqual(list(self.table)[1:], [self.rows[0], self.rows[2]])
+
+    def test_pickle(self):
+        """Method to test that rows are pickled as dictionaries"""
+        row = pickle.loads(pickle.dumps(self.table[0]))
+        self.assertEqual(type(row), dict)
+        self.assertEqual(row, self.rows[0])
@@ -0,0 +1,148 @@
+#coding: utf-8
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import stat
+import threading
+import converttool.client
+from converttool import validate
+from converttool.service import ConversionService, make_server, run_job
+from converttool.client import submit, request, connect, read_token, token_path, TOKEN_HEADER
+from converttool.exceptions import *
+
+class TestService(unittest.TestCase):
+    """Tests for the conversion service and its client, on localhost"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a service with a single worker"""
+        # The workers load validate.json when they start
+        cls.config_dir = tempfile.mkdtemp()
+        cls.validate_dirs = validate.CONFIG_DIR, validate.BASE_DIR
+        validate.CONFIG_DIR = validate.BASE_DIR = cls.config_dir
+        cls.service = ConversionService(workers=1, queue_size=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the workers of the service"""
+        cls.service.close()
+        validate.CONFIG_DIR, validate.BASE_DIR = cls.validate_dirs
+        shutil.rmtree(cls.config_dir)
+
+    def setUp(self):
+        """Setup test data in a directory of its own"""
+        self.tmpdir = tempfile.mkdtemp()
+        # Tokens of the services on a port are written in the directory
+        service_dir = converttool.client.SERVICE_DIR
+        converttool.client.SERVICE_DIR = os.path.join(self.tmpdir, 'service')
+        self.addCleanup(setattr, converttool.client, 'SERVICE_DIR', service_dir)
+        with open(os.path.join(self.tmpdir, 'test.csv'), 'w') as f:
+            f.write('''name,address,stars,contact,phone,uri
+Jürgen-Gehringer,"63847 Lowe Knoll, East Maxine, WA 97030-4876",5,Dr. Sinda Wyman,1-270-665-9933x1626,http://www.paucek.com/search.htm''')
+
+    def tearDown(self):
+        """Remove the test data"""
+        shutil.rmtree(self.tmpdir)
+
+    def start(self, socket_path=None):
+        """Start a server for the service in a thread
+
+        :rtype: str address of the server for the client
+
+        """
+        if socket_path is None:
+            server = make_server(self.service, port=0)
+        else:
+            server = make_server(self.service, socket_path=socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+
+        self.addCleanup(stop)
+        return socket_path or '127.0.0.1:{}'.format(server.server_address[1])
+
+    def test_run_job(self):
+        """Method to test that a job runs the command line in the directory of the client"""
+        cwd = os.getcwd()
+        result = run_job({'args': ['--no-cache', '--output-name', 'data', 'json', 'test.csv'], 'cwd': self.tmpdir})
+        os.chdir(cwd)
+        self.assertEqual(result['status'], 0)
+        self.assertIn('Total Data Parsed: 1', result['output'])
+        with open(os.path.join(self.tmpdir, 'data.json')) as f:
+            self.assertEqual(json.load(f)[0]['stars'], '5')
+        result = run_job({'args': ['json'], 'cwd': self.tmpdir})
+        os.chdir(cwd)
+        self.assertEqual(result['status'], 2)
+        self.assertIn('Missing argument', result['output'])
+
+    def test_submit(self):
+        """Method to test jobs sent by the client over http and over a unix socket"""
+        for server in (self.start(), self.start(os.path.join(self.tmpdir, 'service.sock'))):
+            result = submit(['--no-cache', '--infer-types', 'json', 'test.csv'], cwd=self.tmpdir, server=server)
+            self.assertEqual(result['status'], 0)
+            with open(os.path.join(self.tmpdir, 'output.json')) as f:
+                self.assertEqual(json.load(f)[0]['stars'], 5)
+            os.remove(os.path.join(self.tmpdir, 'output.json'))
+            self.assertEqual(request('GET', '/status', server=server), (200, {'workers': 1, 'queue_size': 1, 'jobs': 0}))
+            self.assertEqual(request('POST', '/jobs', '{}', server=server)[0], 400)
+            self.assertEqual(request('GET', '/jobs', server=server)[0], 404)
+
+    def test_busy(self):
+        """Method to test that jobs are refused beyond the workers and the queue"""
+        server = self.start()
+        for _ in range(2):
+            self.service.slots.acquire()
+        try:
+            self.assertEqual(request('POST', '/jobs', json.dumps({'args': ['json', 'test.csv'], 'cwd': self.tmpdir}), server=server)[0], 503)
+            self.assertRaises(ServiceUnavailable, submit, ['json', 'test.csv'], self.tmpdir, server, 0)
+        finally:
+            for _ in range(2):
+                self.service.slots.release()
+        self.assertEqual(submit(['--no-cache', 'json', 'test.csv'], self.tmpdir, server, 0)['status'], 0)
+
+    def test_token(self):
+        """Method to test that requests without the token, or jobs not sent as json, are refused"""
+        socket_path = os.path.join(self.tmpdir, 'service.sock')
+        for server in (self.start(), self.start(socket_path)):
+            self.assertEqual(stat.S_IMODE(os.stat(token_path(server)).st_mode), 0o600)
+            body = json.dumps({'args': ['--no-cache', '--output-name', 'pwn', 'json', 'test.csv'], 'cwd': self.tmpdir})
+            for headers, status in (({}, 401), ({TOKEN_HEADER: 'wrong', 'Content-Type': 'application/json'}, 401), ({TOKEN_HEADER: read_token(server), 'Content-Type': 'text/plain'}, 415)):
+                connection = connect(server)
+                connection.request('POST', '/jobs', body, headers)
+                self.assertEqual(connection.getresponse().status, status)
+                connection.close()
+            self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'pwn.json')))
+        self.assertEqual(stat.S_IMODE(os.stat(socket_path).st_mode), 0o600)
+
+    def test_worker_died(self):
+        """Method to test that the job of a worker that died fails, and the worker is replaced"""
+        import time
+        import signal
+        from converttool import service
+        interval, service.WATCH_INTERVAL = service.WATCH_INTERVAL, 0.1
+        self.addCleanup(setattr, service, 'WATCH_INTERVAL', interval)
+        worker = self.service.pool.workers[0]
+        # Reading the fifo blocks the job until the worker is killed
+        os.mkfifo(os.path.join(self.tmpdir, 'fifo.csv'))
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self.service.run({'args': ['--no-cache', 'json', 'fifo.csv'], 'cwd': self.tmpdir})))
+        thread.start()
+        pid = worker.process.pid
+        time.sleep(0.5)
+        os.kill(pid, signal.SIGKILL)
+        thread.join(10)
+        self.assertEqual(result[0]['status'], 1)
+        self.assertIn('died', result[0]['output'])
+        self.assertNotEqual(worker.process.pid, pid)
+        self.assertEqual(self.service.run({'args': ['--no-cache', 'json', 'test.csv'], 'cwd': self.tmpdir})['status'], 0)
+        self.assertEqual(self.service.status()['jobs'], 0)
+
+    def test_unavailable(self):
+        """Method to test that the client reports a service that can not be reached"""
+        self.assertRaises(ServiceUnavailable, submit, ['json', 'test.csv'], self.tmpdir, os.path.join(self.tmpdir, 'none.sock'))
@@ -0,0 +1,56 @@
+#coding: utf-8
+import unittest
+import random
+from converttool import sort
+from converttool.sort import ExternalSort, sort_key
+from converttool.constants import SORT_MEMORY
+
+FIELDNAMES = ['name', 'stars']
+
+class TestSort(unittest.TestCase):
+    """Tests for the sort of the rows"""
+
+    def setUp(self):
+        """Setup test data"""
+        r = random.Random(42)
+        self.rows = [{'name': 'Jürgen-{}'.decode('utf-8').format(i), 'stars': unicode(r.randint(0, 12))} for i in range(2500)]
+
+    def test_sort_key(self):
+        """Method to test that numbers sort numerically, before strings and empty values"""
+        values = [u'', u'b', u'10', u'9', u'a', u'2.5']
+        self.assertEqual(sorted(values, key=sort_key), [u'2.5', u'9', u'10', u'a', u'b', u''])
+
+    def test_sort_in_memory(self):
+        """Method to test a stable sort of rows that fit in memory"""
+        s = ExternalSort(FIELDNAMES, 'stars')
+        expected = sorted(self.rows, key=lambda row: int(row['stars']))
+        self.assertEqual(list(s.sort(iter(self.rows))), expected)
+        self.assertEqual(s.runs, 0)
+
+    def test_external_sort(self):
+        """Method to test a stable sort of rows spilled to temporary files"""
+        width = sort.MERGE_WIDTH
+        sort.MERGE_WIDTH = 2
+        try:
+            s = ExternalSort(FIELDNAMES, 'stars', memory=0)
+            expected = sorted(self.rows, key=lambda row: int(row['stars']))
+            self.assertEqual(list(s.sort(iter(self.rows))), expected)
+            # 3 runs of 1000 rows, the first two merged again
+            self.assertEqual(s.runs, 5)
+        finally:
+            sort.MERGE_WIDTH = width
+
+    def test_long_rows(self):
+        """Method to test that the values of rows longer than the header are kept, in memory and in runs"""
+        for i, row in enumerate(self.rows):
+            if i % 7 == 0:
+                row[None] = [u'extra', unicode(i)]
+        expected = sorted(self.rows, key=lambda row: int(row['stars']))
+        for memory in (SORT_MEMORY, 0):
+            rows = list(ExternalSort(FIELDNAMES, 'stars', memory=memory).sort(iter(self.rows)))
+            self.assertEqual(rows, expected)
+            self.assertEqual([row.keys() for row in rows], [row.keys() for row in expected])
+
+    def test_unknown_field(self):
+        """Method to test that sorting on an unknown column raises ValueError"""
+        self.assertRaises(ValueError, ExternalSort, FIELDNAMES, 'uri')
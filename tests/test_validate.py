@@ -0,0 +1,101 @@
+#coding: utf-8
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from converttool import validate
+from converttool.validate import Validate, CompiledSchema
+from converttool.exceptions import *
+
+SCHEMA = {
+    'name': {'type': 'string', 'required': True, 'empty': False},
+    'stars': {'type': 'integer', 'min': 0, 'max': 5},
+    'uri': {'type': 'string', 'regex': 'https?://.*'},
+    'phone': {'type': 'string', 'maxlength': 10, 'allowed': ['123', '12345678901']},
+}
+
+class TestValidate(unittest.TestCase):
+    """Tests for the Validate Class"""
+
+    def setUp(self):
+        """Setup test data, and directories of the test for validate.json"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.config_dir = os.path.join(self.tmpdir, 'config')
+        self.base_dir = os.path.join(self.tmpdir, 'base')
+        os.mkdir(self.config_dir)
+        os.mkdir(self.base_dir)
+        self.addCleanup(setattr, validate, 'CONFIG_DIR', validate.CONFIG_DIR)
+        self.addCleanup(setattr, validate, 'BASE_DIR', validate.BASE_DIR)
+        validate.CONFIG_DIR = self.config_dir
+        validate.BASE_DIR = self.base_dir
+        self.data = [
+            {'name': 'Jürgen'.decode('utf-8'), 'stars': '5', 'uri': 'http://a.com', 'phone': '123'},
+            {'name': '', 'stars': '7', 'uri': 'ftp://a.com', 'phone': '12345678901'},
+            {'stars': 'five', 'other': 'x'},
+        ]
+
+    def test_validate_batch(self):
+        """Method to test the errors of every row of a batch"""
+        errors = CompiledSchema(SCHEMA).validate_batch(self.data)
+        self.assertEqual(errors[0], {})
+        self.assertEqual(errors[1], {
+            'name': ["empty values not allowed"],
+            'stars': ["max value is 5"],
+            'uri': ["value does not match regex 'https?://.*'"],
+            'phone': ["max length is 10"],
+        })
+        self.assertEqual(errors[2], {
+            'name': ["required field"],
+            'stars': ["must be of integer type"],
+            'other': ["unknown field"],
+        })
+
+    def test_validate_column(self):
+        """Method to test the validation of a whole column"""
+        errors = CompiledSchema(SCHEMA).validate_column('stars', ['0', '-1', '', '3'])
+        self.assertEqual(errors, [[], ["min value is 0"], [], []])
+
+    def test_validate(self):
+        """Method to test that every error of every row is counted"""
+        v = Validate(iter(self.data), SCHEMA)
+        self.assertEqual(v.validate(), 7)
+        self.assertEqual([index for index, errors in v.errors], [1, 2])
+
+    def test_cerberus_fallback(self):
+        """Method to test that rules which are not compiled are validated by cerberus"""
+        schema = {'name': {'type': 'string', 'forbidden': ['admin']}}
+        errors = CompiledSchema(schema).validate_batch([{'name': 'admin'}, {'name': 'root'}])
+        self.assertEqual(errors[0].keys(), ['name'])
+        self.assertEqual(errors[1], {})
+
+    def test_invalid_schema(self):
+        """Method to test that an invalid schema raises InvalidValidationSchema"""
+        v = Validate([], {'name': {'type': 'no-such-type'}})
+        self.assertRaises(InvalidValidationSchema, v.validate)
+
+    def write_schema(self, directory, schema, mtime=None):
+        path = os.path.join(directory, 'validate.json')
+        with open(path, 'w') as f:
+            json.dump(schema, f)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_load_schema(self):
+        """Method to test that validate.json is loaded from the config directory before the project root"""
+        self.assertRaises(SettingsNotFound, Validate.load_schema)
+        self.write_schema(self.base_dir, {'name': {'type': 'string'}})
+        self.assertEqual(Validate.load_schema(), {'name': {'type': 'string'}})
+        self.write_schema(self.config_dir, SCHEMA)
+        self.assertEqual(Validate.load_schema(), SCHEMA)
+        self.assertEqual(Validate([]).schema, SCHEMA)
+
+    def test_load_schema_changed(self):
+        """Method to test that validate.json is only read again when it changed"""
+        self.write_schema(self.config_dir, SCHEMA, mtime=1000)
+        schema = Validate.load_schema()
+        schema['name']['type'] = 'integer'
+        self.assertEqual(Validate.load_schema(), SCHEMA)
+        self.write_schema(self.config_dir, {'stars': {'type': 'integer'}}, mtime=2000)
+        self.assertEqual(Validate.load_schema(), {'stars': {'type': 'integer'}})